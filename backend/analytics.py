@@ -0,0 +1,188 @@
+import os
+import time
+from datetime import date, timedelta
+from itertools import chain
+from typing import Dict, List, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import Subject, StudySession, Habit, HabitLog
+import schemas
+from auth import get_current_user
+from cache import cache_manager
+from serialization import encode, json_response, series_adapter
+from calendar_view import month_of, next_month
+import localday
+from writebehind import write_behind
+
+router = APIRouter()
+
+# widest range per request (ten years of days)
+SERIES_MAX_DAYS = int(os.getenv("SERIES_MAX_DAYS", "3660"))
+# entries are deleted by the next write of the user (see below); the TTL drops the ranges of
+# users who stop writing, and stray entries stored while a write was committing
+SERIES_CACHE_SECONDS = 3600
+
+# metric -> (model, value per day, group_by values it supports)
+METRICS = {
+    "study_minutes": (StudySession, func.sum(StudySession.duration_minutes), {"subject"}),
+    "study_sessions": (StudySession, func.count(StudySession.id), {"subject"}),
+    "habit_checkins": (HabitLog, func.count(HabitLog.id), {"habit"}),
+}
+GROUP_COLUMNS = {"subject": StudySession.subject_id, "habit": HabitLog.habit_id}
+
+# ======== buckets ===========
+def bucket_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())  # weeks start on Monday
+    if granularity == "month":
+        return month_of(day)
+    return day
+
+def bucket_after(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return next_month(start)
+    return start + timedelta(days=1)
+
+def buckets(start: date, end: date, granularity: str) -> List[date]:
+    """First day of every bucket from the one holding start to the one holding end"""
+    result = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        result.append(current)
+        current = bucket_after(current, granularity)
+    return result
+
+# ======== aggregation ===========
+def load_series(db: Session, user_id: str, metric: str, group_by: Optional[str], starts: List[date], end: date) -> List[dict]:
+    """
+    Read the daily rollup of the range (one grouped query on the (user_id, local_day) index) and
+    coarsen it to the buckets in memory; every bucket gets a value, 0 when nothing happened
+    """
+    model, value, _ = METRICS[metric]
+    group = GROUP_COLUMNS[group_by] if group_by else None
+    first_day, last_day = localday.day_number(starts[0]), localday.day_number(end)
+    columns = [model.local_day] + ([group] if group is not None else []) + [value]
+    query = db.query(*columns).filter(
+        model.user_id == user_id,
+        model.local_day >= first_day,
+        model.local_day <= last_day
+    ).group_by(*columns[:-1])
+
+    # day offset -> bucket index, so each rollup row is placed with a list lookup
+    bucket_of = []
+    for index, start in enumerate(starts):
+        following = starts[index + 1] if index + 1 < len(starts) else end + timedelta(days=1)
+        bucket_of += [index] * (following - start).days
+
+    lines: Dict[Optional[int], List[int]] = {}
+    for row in query:
+        key = row[1] if group is not None else None
+        values = lines.setdefault(key, [0] * len(starts))
+        values[bucket_of[row[0] - first_day]] += row[-1] or 0
+    if group is None:
+        values = lines.get(None, [0] * len(starts))
+        return [{"id": None, "name": None, "total": sum(values), "values": values}]
+
+    # names of the subjects/habits that have data in the range; most active first
+    name_model = Subject if group_by == "subject" else Habit
+    names = dict(db.query(name_model.id, name_model.name).filter(
+        name_model.user_id == user_id,
+        name_model.id.in_([key for key in lines if key is not None])
+    ))
+    if group_by == "subject" and len(names) < len(lines):
+        # deleted subjects keep the name stored on their sessions
+        names.update({key: name for key, name in db.query(StudySession.subject_id, func.max(StudySession.subject_name)).filter(
+            StudySession.user_id == user_id,
+            StudySession.subject_id.in_([key for key in lines if key is not None and key not in names])
+        ).group_by(StudySession.subject_id)})
+    series = [{"id": key, "name": names.get(key), "total": sum(values), "values": values} for key, values in lines.items()]
+    series.sort(key=lambda line: (-line["total"], line["id"] is None, line["id"] or 0))
+    return series
+
+def generation_key(user_id: str) -> str:
+    return cache_manager.get_cache_key(user_id, "analytics_series_generation")
+
+def generation(user_id: str) -> dict:
+    """
+    The user's current generation: an id that changes after every committed write to their
+    activity (part of every cache key) and the keys cached under it, deleted with it
+    """
+    current = cache_manager.get(generation_key(user_id))
+    if current is None:
+        current = {"id": str(time.time_ns()), "keys": set()}
+        cache_manager.set(generation_key(user_id), current, expire_seconds=SERIES_CACHE_SECONDS)
+    return current
+
+@router.get("/analytics/series", response_model=schemas.SeriesResponse)
+def read_series(
+    metric: str = Query(..., pattern="^(study_minutes|study_sessions|habit_checkins)$"),
+    start: date = Query(..., alias="from", description="first day (YYYY-MM-DD), widened to the start of its bucket"),
+    end: date = Query(..., alias="to", description="last day, inclusive, widened to the end of its bucket"),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    group_by: Optional[str] = Query(None, pattern="^(subject|habit)$", description="one series per subject (study metrics) or habit"),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    A metric per day, week (Monday first) or month over any range, with every bucket filled;
+    days are the user's local days (see localday.py)
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="`to` must not be before `from`")
+    if (end - start).days + 1 > SERIES_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {SERIES_MAX_DAYS} days per request")
+    if group_by and group_by not in METRICS[metric][2]:
+        raise HTTPException(status_code=400, detail=f"{metric} cannot be grouped by {group_by}")
+    write_behind.wait_user(user_id)
+
+    # the range is normalized to whole buckets, so any from/to inside the same buckets share a cache entry
+    starts = buckets(start, end, granularity)
+    end = bucket_after(starts[-1], granularity) - timedelta(days=1)
+    current = generation(user_id)
+    cache_key = cache_manager.get_cache_key(user_id, "analytics_series", {
+        "metric": metric, "granularity": granularity, "group_by": group_by or "",
+        "from": starts[0].isoformat(), "to": end.isoformat(), "generation": current["id"]
+    })
+    body = cache_manager.get(cache_key)
+    if body is None:
+        body = encode(series_adapter, {
+            "metric": metric,
+            "granularity": granularity,
+            "group_by": group_by,
+            "start": starts[0].isoformat(),
+            "end": end.isoformat(),
+            "buckets": [bucket.isoformat() for bucket in starts],
+            "series": load_series(db, user_id, metric, group_by, starts, end)
+        })
+        cache_manager.set(cache_key, body, expire_seconds=SERIES_CACHE_SECONDS)
+        current["keys"].add(cache_key)
+    return json_response(body)
+
+# ======== invalidation ===========
+# A committed change to a user's study sessions or habit logs (or a renamed subject/habit) deletes
+# the user's generation together with the entries cached under it. A request that read the old data
+# and stores its body after that uses the old generation id, so the body is never read again.
+
+@event.listens_for(Session, "after_flush")
+def collect_series_users(session: Session, flush_context) -> None:
+    users: Set[str] = session.info.setdefault("series_users", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (StudySession, HabitLog, Subject, Habit)) and obj.user_id is not None:
+            users.add(obj.user_id)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_series(session: Session) -> None:
+    for user_id in session.info.pop("series_users", ()):
+        current = cache_manager.get(generation_key(user_id))
+        cache_manager.delete(generation_key(user_id))
+        for key in list(current["keys"]) if current else ():
+            cache_manager.delete(key)
+
+@event.listens_for(Session, "after_rollback")
+def discard_series_users(session: Session) -> None:
+    session.info.pop("series_users", None)
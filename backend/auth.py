@@ -1,9 +1,11 @@
-from fastapi import HTTPException, Depends, status
+from fastapi import HTTPException, Depends, Header, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from typing import Optional
 import os
+import hmac
 import httpx
+from timing import phase
 
 # schema for JWT token authentication
 security = HTTPBearer()
@@ -14,7 +16,8 @@ async def verify_supabase_token(credentials: HTTPAuthorizationCredentials = Depe
         token = credentials.credentials
         
         # extract user id from Supabase JWT
-        payload = jwt.decode(token, options={"verify_signature": False})
+        with phase("auth"):
+            payload = jwt.decode(token, options={"verify_signature": False})
         user_id = payload.get("sub")  # 'sub' field saves the user id
         
         if not user_id:
@@ -68,6 +71,38 @@ async def get_current_user_optional(
     except HTTPException:
         return None
 
+# authentication for EventSource streams (browsers can't set the Authorization header there)
+async def get_current_user_stream(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    access_token: Optional[str] = Query(None)
+) -> str:
+    """
+    Like get_current_user, but also accepts the token as ?access_token=
+    """
+    if not credentials and access_token:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token)
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return await verify_supabase_token(credentials)
+
+# admin-only debugging features (Server-Timing, profiling) are unlocked with this token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """True if the given value matches the configured ADMIN_TOKEN (always False if it is not set)"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Dependency for admin-only endpoints (X-Admin-Token header)"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
 # 실제 프로덕션 환경에서는 Supabase JWT Secret으로 토큰 검증
 async def verify_supabase_token_production(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """
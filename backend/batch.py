@@ -0,0 +1,185 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import Subject, StudySession, Habit, HabitLog
+import schemas
+from auth import get_current_user
+from cache import cache_manager
+from serialization import encode, json_response, batch_result_adapter
+from leaderboard import leaderboard, week_range
+from localday import server_local
+import streaks
+from writebehind import write_behind
+
+router = APIRouter()
+
+# items per upload (habit logs and study sessions together)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+def result(index: int, status: str, id: Optional[int] = None, detail: Optional[str] = None) -> dict:
+    return {"index": index, "status": status, "id": id, "detail": detail}
+
+@router.post("/batch", response_model=schemas.BatchResult)
+def upload_batch(
+    batch: schemas.BatchUpload,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Uploads habit logs and study sessions recorded offline, in one transaction
+    Items for habits/subjects the user doesn't own are rejected, items already stored are
+    reported as duplicates, the rest are created; results follow the order of the upload
+    Send an Idempotency-Key header so a retried upload returns the first response (see idempotency.py)
+    """
+    if len(batch.habit_logs) + len(batch.study_sessions) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    write_behind.wait_user(user_id)  # queued single check-ins first, so they dedupe against the upload
+    try:
+        results = save_batch(db, user_id, batch)
+    except IntegrityError:
+        # a concurrent write stored some of the same check-ins first: run again, they are duplicates now
+        results = save_batch(db, user_id, batch)
+    return json_response(encode(batch_result_adapter, results))
+
+def save_batch(db: Session, user_id: str, batch: schemas.BatchUpload) -> dict:
+    log_results: List[Optional[dict]] = [None] * len(batch.habit_logs)
+    session_results: List[Optional[dict]] = [None] * len(batch.study_sessions)
+
+    # ownership: one query per entity type
+    habit_ids = {item.habit_id for item in batch.habit_logs}
+    owned_habits: Set[int] = set()
+    if habit_ids:
+        owned_habits = {row[0] for row in db.query(Habit.id).filter(Habit.user_id == user_id, Habit.id.in_(habit_ids))}
+    subject_ids = {item.subject_id for item in batch.study_sessions}
+    subject_names: Dict[int, str] = {}
+    if subject_ids:
+        subject_names = dict(db.query(Subject.id, Subject.name).filter(Subject.user_id == user_id, Subject.id.in_(subject_ids)))
+
+    # duplicates: one query per entity type for every candidate, matched as a set here
+    # (the single endpoints treat the same habit + completed_date as the same check-in)
+    logs = {}  # (habit_id, completed_date) -> indexes
+    for index, item in enumerate(batch.habit_logs):
+        if item.habit_id not in owned_habits:
+            log_results[index] = result(index, "rejected", detail="Cannot find the habit or access denied")
+        else:
+            logs.setdefault((item.habit_id, server_local(item.completed_date)), []).append(index)
+    existing_logs = {}
+    if logs:
+        rows = db.query(HabitLog.habit_id, HabitLog.completed_date, HabitLog.id).filter(
+            HabitLog.user_id == user_id,
+            HabitLog.habit_id.in_({habit_id for habit_id, _ in logs}),
+            HabitLog.completed_date.in_({completed_date for _, completed_date in logs})
+        )
+        existing_logs = {(habit_id, completed_date): log_id for habit_id, completed_date, log_id in rows}
+
+    sessions = {}  # (subject_id, created_at) -> indexes, only sessions with a client timestamp can be matched
+    new_sessions = []
+    for index, item in enumerate(batch.study_sessions):
+        if item.subject_id not in subject_names:
+            session_results[index] = result(index, "rejected", detail="Subject not found or access denied")
+        elif item.duration_minutes < 0:
+            session_results[index] = result(index, "rejected", detail="duration_minutes must not be negative")
+        elif item.created_at is None:
+            new_sessions.append((index, item))
+        else:
+            sessions.setdefault((item.subject_id, server_local(item.created_at)), []).append(index)
+    existing_sessions = {}
+    if sessions:
+        rows = db.query(StudySession.subject_id, StudySession.created_at, StudySession.id).filter(
+            StudySession.user_id == user_id,
+            StudySession.subject_id.in_({subject_id for subject_id, _ in sessions}),
+            StudySession.created_at.in_({created_at for _, created_at in sessions})
+        )
+        existing_sessions = {(subject_id, created_at): session_id for subject_id, created_at, session_id in rows}
+
+    # inserts: everything in one transaction
+    created_logs = []  # (indexes, HabitLog)
+    for key, indexes in logs.items():
+        if key in existing_logs:
+            for index in indexes:
+                log_results[index] = result(index, "duplicate", existing_logs[key])
+        else:
+            created_logs.append((indexes, HabitLog(habit_id=key[0], completed_date=key[1], user_id=user_id)))
+    created_sessions = []  # (indexes, StudySession)
+    for key, indexes in sessions.items():
+        if key in existing_sessions:
+            for index in indexes:
+                session_results[index] = result(index, "duplicate", existing_sessions[key])
+        else:
+            created_sessions.append((indexes, new_session(user_id, batch.study_sessions[indexes[0]], subject_names)))
+    created_sessions += [([index], new_session(user_id, item, subject_names)) for index, item in new_sessions]
+
+    db.add_all([row for _, row in created_logs] + [row for _, row in created_sessions])
+    try:
+        db.flush()
+        # bits of the local days stamped by the flush
+        days_by_habit: Dict[int, Set] = {}
+        for _, log in created_logs:
+            days_by_habit.setdefault(log.habit_id, set()).add(streaks.log_day(log))
+        if days_by_habit:
+            streaks.set_days(db, user_id, days_by_habit)
+        # read ids and values before the commit expires the rows (no reload per row afterwards)
+        for rows, results in ((created_logs, log_results), (created_sessions, session_results)):
+            for indexes, row in rows:
+                results[indexes[0]] = result(indexes[0], "created", row.id)
+                # repeats within the upload share the row of their first occurrence
+                for index in indexes[1:]:
+                    results[index] = result(index, "duplicate", row.id)
+        checkins = [(log.habit_id, log.completed_date) for _, log in created_logs]
+        studied = [(session.duration_minutes, session.created_at) for _, session in created_sessions]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    if checkins or studied:
+        after_commit(db, user_id, checkins, studied)
+
+    items = log_results + session_results
+    return {
+        "habit_logs": log_results,
+        "study_sessions": session_results,
+        "created": sum(1 for item in items if item["status"] == "created"),
+        "duplicates": sum(1 for item in items if item["status"] == "duplicate"),
+        "rejected": sum(1 for item in items if item["status"] == "rejected")
+    }
+
+def new_session(user_id: str, item: schemas.BatchStudySession, subject_names: Dict[int, str]) -> StudySession:
+    session = StudySession(
+        user_id=user_id,
+        subject_id=item.subject_id,
+        subject_name=subject_names[item.subject_id],
+        duration_minutes=item.duration_minutes,
+        notes=item.notes
+    )
+    if item.created_at is not None:
+        session.created_at = server_local(item.created_at)
+    return session
+
+def after_commit(db: Session, user_id: str, checkins: List[Tuple[int, datetime]], studied: List[Tuple[int, datetime]]) -> None:
+    """Leaderboard and cache updates, once per upload instead of once per item"""
+    week_start, week_end = week_range()
+    this_week = [(minutes, created_at) for minutes, created_at in studied if week_start <= created_at < week_end]
+    if this_week:
+        leaderboard.record_study(db, user_id, sum(minutes for minutes, _ in this_week), this_week[0][1], sessions=len(this_week))
+    if checkins:
+        by_habit: Dict[int, List[datetime]] = {}
+        for habit_id, completed_date in checkins:
+            by_habit.setdefault(habit_id, []).append(completed_date)
+        years = streaks.load_years(db, habit_ids=list(by_habit))
+        today = streaks.local_today(db, user_id)
+        for habit_id, dates in by_habit.items():
+            in_week = [completed_date for completed_date in dates if week_start <= completed_date < week_end]
+            leaderboard.record_habit_log(user_id, habit_id, (in_week or dates)[0], count=len(in_week),
+                                         streak=streaks.DayBits(years.get(habit_id, {}), today).current_streak())
+
+    cache_manager.delete(cache_manager.get_cache_key(user_id, "dashboard_summary"))
+    if studied:
+        cache_manager.delete(cache_manager.get_cache_key(user_id, "study_sessions"))
+    if checkins:
+        cache_manager.delete(cache_manager.get_cache_key(user_id, "habits"))
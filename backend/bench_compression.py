@@ -0,0 +1,62 @@
+"""
+Compression throughput benchmark (run: python bench_compression.py [rows])
+Measures ratio and MB/s for gzip levels and brotli qualities (if brotli is installed)
+on a study session list and a year heatmap, the two largest payloads we serve
+"""
+import sys
+import gzip
+import time
+
+import orjson
+
+from bench_serialization import make_rows
+from compression import brotli
+from serialization import encode, study_session_list_adapter
+
+def heatmap_payload() -> bytes:
+    """A realistic object-format heatmap year (365 entries)"""
+    data = [
+        {
+            "date": f"2025-{1 + day // 31:02d}-{1 + day % 28:02d}",
+            "value": (day * 37) % 101,
+            "level": (day * 37) % 101 // 25,
+            "study_time": (day * 53) % 180,
+            "habit_completion_rate": (day % 5) / 5,
+            "total_habits": 5,
+            "completed_habits": day % 5
+        }
+        for day in range(365)
+    ]
+    return orjson.dumps({"year": 2025, "data": data, "summary": {"total_days": 365}})
+
+def measure(name: str, payload: bytes, compressor, repeat: int = 5):
+    """Best-of-N compression time, printed as ratio and throughput"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = compressor(payload)
+        best = min(best, time.perf_counter() - start)
+    throughput = len(payload) / best / 1_000_000
+    print(f"  {name:<12}{len(output):>10}{len(payload) / len(output):>8.1f}x{best * 1000:>10.2f}ms{throughput:>10.1f} MB/s")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    sessions, _ = make_rows(count)
+    payloads = [
+        (f"study_sessions ({count} rows)", encode(study_session_list_adapter, sessions)),
+        ("heatmap (365 days)", heatmap_payload()),
+    ]
+
+    for title, payload in payloads:
+        print(f"{title}: {len(payload)} bytes")
+        print(f"  {'codec':<12}{'bytes':>10}{'ratio':>9}{'time':>12}{'speed':>15}")
+        for level in (1, 3, 6, 9):
+            measure(f"gzip-{level}", payload, lambda data, level=level: gzip.compress(data, compresslevel=level, mtime=0))
+        if brotli:
+            for quality in (1, 4, 5, 8, 11):
+                measure(f"br-{quality}", payload, lambda data, quality=quality: brotli.compress(data, quality=quality))
+        else:
+            print("  (brotli not installed, skipping br)")
+
+if __name__ == "__main__":
+    main()
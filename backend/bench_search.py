@@ -0,0 +1,115 @@
+"""
+Full-text search benchmark (run: python bench_search.py [notes] [users])
+
+    python bench_search.py 2000000 20000
+
+Fills a temporary SQLite database with study session notes (Zipf-distributed vocabulary,
+skewed notes per user), indexed by the FTS5 triggers of search.py while inserting, then
+times /search queries (common, rare, prefix and multi-word; ranked and newest first) for a heavy and a typical user
+against a LIKE '%word%' scan of the same user's notes (every match, as ranking needs them all).
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+WORDS = ["review", "lecture", "notes", "chapter", "problems", "practice", "exam", "midterm", "final", "essay",
+         "integrals", "derivatives", "vectors", "matrices", "probability", "statistics", "proofs", "lemma",
+         "photosynthesis", "mitosis", "enzymes", "genetics", "kinematics", "momentum", "thermodynamics",
+         "optics", "reactions", "equilibrium", "organic", "history", "revolution", "treaty", "economics",
+         "inflation", "grammar", "vocabulary", "flashcards", "reading", "summary", "assignment", "project",
+         "quiz", "homework", "group", "tutor", "slides", "textbook", "exercises", "mistakes", "formulas"]
+QUERIES = [("common word", "review", False, "relevance"), ("common, recent", "review", False, "recent"),
+           ("rare word", "thermodynamics", False, "relevance"), ("prefix", "deriv", True, "relevance"),
+           ("two words", "practice integrals", False, "relevance"), ("no match", "zyzzyva", False, "relevance")]
+
+def fill(engine, notes: int, users: int, seed: int = 42) -> dict:
+    """Insert `notes` study sessions for `users` users; returns notes per user"""
+    from models import StudySession
+    rng = random.Random(seed)
+    # a long vocabulary tail: WORDS plus numbered rare terms
+    vocabulary = WORDS + [f"{word}{index}" for word in WORDS for index in range(40)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    user_ids = [f"bench-user-{index}" for index in range(users)]
+    user_weights = [rng.paretovariate(1.6) for _ in user_ids]
+    counts = {}
+    table = StudySession.__table__
+    start = datetime(2022, 1, 1)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA synchronous = OFF")
+        rows = []
+        for index, user_id in enumerate(rng.choices(user_ids, user_weights, k=notes)):
+            counts[user_id] = counts.get(user_id, 0) + 1
+            rows.append({
+                "user_id": user_id,
+                "subject_name": "Bench",
+                "duration_minutes": 30,
+                "notes": " ".join(rng.choices(vocabulary, weights, k=rng.randint(4, 30))).capitalize(),
+                "created_at": start + timedelta(minutes=index)
+            })
+            if len(rows) == 20000:
+                connection.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            connection.execute(table.insert(), rows)
+    return counts
+
+def timed(func, repeat: int = 20) -> tuple:
+    """(p50, p95) wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95) - 1]
+
+def main():
+    notes = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else max(1, notes // 100)
+    workdir = tempfile.mkdtemp(prefix="bench-search-")
+    # database.py reads DATABASE_URL at import time
+    os.environ.update({"DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'search.db')}", "SLOW_QUERY_MS": "1000000"})
+
+    from sqlalchemy import text
+    from database import engine, SessionLocal, Base
+    import models  # registers the tables for create_all
+    import search
+
+    Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    counts = fill(engine, notes, users)
+    seconds = time.perf_counter() - started
+    size = os.path.getsize(os.path.join(workdir, "search.db")) / 1024 / 1024
+    print(f"{notes} notes for {users} users inserted and indexed in {seconds:.1f}s "
+          f"({notes / seconds:,.0f} notes/s), database {size:.0f} MB")
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        search.optimize(connection)
+    print(f"index merged in {time.perf_counter() - started:.1f}s")
+
+    ranked = sorted(counts, key=counts.get)
+    db = SessionLocal()
+    try:
+        for label, user_id in (("heavy user", ranked[-1]), ("typical user", ranked[len(ranked) // 2])):
+            print(f"\n{label} ({counts[user_id]} notes), p50 / p95 ms")
+            print(f"{'query':<16}{'hits':>6}{'fts5':>16}{'LIKE scan':>16}")  # hits: first page
+            for name, query, prefix, order in QUERIES:
+                words = search.terms(query)
+                hits = len(search.search_sqlite(db, user_id, words, 21, prefix, order))
+                fts = timed(lambda: search.search_sqlite(db, user_id, words, 21, prefix, order))
+                like = timed(lambda: db.execute(text(
+                    "SELECT id FROM study_sessions WHERE user_id = :user_id AND "
+                    + " AND ".join(f"notes LIKE :w{index}" for index in range(len(words)))
+                ), {"user_id": user_id, **{f"w{index}": f"%{word}%" for index, word in enumerate(words)}}).all())
+                print(f"{name:<16}{hits:>6}{fts[0]:>9.2f} /{fts[1]:>5.1f}{like[0]:>9.2f} /{like[1]:>5.1f}")
+    finally:
+        db.close()
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Encode-time benchmark for list responses (run: python bench_serialization.py [rows])
+Compares FastAPI's default jsonable_encoder path with the TypeAdapter / orjson path in serialization.py
+"""
+import sys
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import schemas
+from models import StudySession, HabitLog
+from serialization import encode, study_session_list_adapter, habit_log_list_adapter
+
+def make_rows(count: int):
+    """Build detached ORM rows that look like real study sessions and habit logs"""
+    now = datetime(2025, 1, 1, 9, 0, 0)
+    sessions = [
+        StudySession(
+            id=i,
+            user_id="bench-user",
+            subject_id=i % 12,
+            subject_name=f"Subject {i % 12}",
+            duration_minutes=25 + i % 90,
+            notes="Reviewed chapter notes and solved practice problems" if i % 3 else None,
+            created_at=now + timedelta(minutes=i)
+        )
+        for i in range(count)
+    ]
+    logs = [
+        HabitLog(id=i, user_id="bench-user", habit_id=i % 8, completed_date=now + timedelta(days=i // 8))
+        for i in range(count)
+    ]
+    return sessions, logs
+
+def fastapi_default(schema, rows) -> bytes:
+    """What FastAPI does with response_model=List[schema] and the stock JSONResponse"""
+    adapter = TypeAdapter(List[schema])
+    validated = adapter.validate_python(rows, from_attributes=True)
+    content = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def orjson_dicts(schema, rows) -> bytes:
+    """Validate once, then encode plain dicts with orjson"""
+    adapter = TypeAdapter(List[schema])
+    return orjson.dumps(adapter.dump_python(adapter.validate_python(rows, from_attributes=True)))
+
+def timed(func, repeat: int = 5) -> float:
+    """Best-of-N wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    sessions, logs = make_rows(count)
+
+    cases = [
+        ("study_sessions", schemas.StudySessionResponse, sessions, study_session_list_adapter),
+        ("habit_logs", schemas.HabitLog, logs, habit_log_list_adapter),
+    ]
+
+    print(f"Encoding {count} rows (best of 5, ms)")
+    print(f"{'list':<16}{'jsonable_encoder':>18}{'orjson dicts':>15}{'TypeAdapter':>14}{'bytes':>11}")
+    for name, schema, rows, adapter in cases:
+        default_ms = timed(lambda: fastapi_default(schema, rows))
+        orjson_ms = timed(lambda: orjson_dicts(schema, rows))
+        adapter_ms = timed(lambda: encode(adapter, rows))
+        size = len(encode(adapter, rows))
+        print(f"{name:<16}{default_ms:>18.1f}{orjson_ms:>15.1f}{adapter_ms:>14.1f}{size:>11}")
+
+if __name__ == "__main__":
+    main()
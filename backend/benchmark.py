@@ -0,0 +1,253 @@
+"""
+Endpoint benchmark suite
+
+    python benchmark.py                                   # small + medium datasets, writes bench_results.json
+    python benchmark.py --sizes large --iterations 50
+    python benchmark.py --baseline bench_baseline.json    # exit 1 on regressions beyond --threshold
+
+Every hot endpoint is called through the ASGI app in-process (httpx ASGITransport) against
+generated datasets of several sizes (see generate_data.py). For each endpoint it reports
+p50/p95/p99 latency, sequential throughput and the number of SQL statements per request
+(read from the Server-Timing header), stores the results as JSON and can compare them
+with a baseline run.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import date, datetime, timedelta
+
+BENCH_DIR = os.getenv("BENCH_DATA_DIR", "bench_data")
+
+DATASETS = {
+    "small": {"users": 100, "years": 1},
+    "medium": {"users": 1000, "years": 2},
+    "large": {"users": 5000, "years": 3},
+}
+
+# (name, method, path) - {group_id} / {habit_id} / {subject_id} are filled from the dataset
+ENDPOINTS = [
+    ("dashboard_summary", "GET", "/dashboard/summary"),
+    ("dashboard_weekly", "GET", "/dashboard/weekly"),
+    ("activity_heatmap", "GET", "/api/activity-heatmap"),
+    ("analytics_study_stats", "GET", "/analytics/study-stats?period=month"),
+    ("analytics_habit_completion", "GET", "/analytics/habit-completion?period=month"),
+    ("analytics_correlation", "GET", "/analytics/correlation"),
+    ("group_leaderboard", "GET", "/groups/{group_id}/leaderboard"),
+    ("list_subjects", "GET", "/subjects"),
+    ("list_habits", "GET", "/habits"),
+    ("list_study_sessions", "GET", "/study-sessions"),
+    ("list_habit_logs", "GET", "/habit-logs"),
+    ("checkin_habit_log", "POST", "/habits/{habit_id}/logs"),
+    ("create_study_session", "POST", "/study-sessions"),
+]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot API endpoints")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma separated dataset sizes ({', '.join(DATASETS)})")
+    parser.add_argument("--iterations", type=int, default=30, help="requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed requests per endpoint")
+    parser.add_argument("--user", choices=["heavy", "typical"], default="heavy", help="which generated user to benchmark as")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the response cache between requests (default: clear it)")
+    parser.add_argument("--endpoints", default=None, help="comma separated endpoint names to run (default: all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="previous results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown of p50/p95 before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this (noise)")
+    parser.add_argument("--run-one", default=None, help=argparse.SUPPRESS)  # internal: benchmark one dataset in this process
+    return parser.parse_args(argv)
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(round(fraction * len(ordered), 9)) - 1))
+    return ordered[index]
+
+def parse_query_count(server_timing: str) -> int:
+    """Statement count from the db entry of a Server-Timing header"""
+    for entry in (server_timing or "").split(","):
+        if entry.strip().startswith("db;") and 'desc="' in entry:
+            return int(entry.split('desc="')[1].split()[0])
+    return 0
+
+def ensure_dataset(size: str, seed: int) -> str:
+    """Generate (once) and return the SQLite file for a dataset size, history ending today"""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    # the end date is part of the name: the same name is always the same data
+    end_date = date.today().isoformat()
+    path = os.path.join(BENCH_DIR, f"{size}-{seed}-{end_date}.db")
+    if not os.path.exists(path + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+        config = DATASETS[size]
+        print(f"Generating {size} dataset ({config['users']} users, {config['years']} years)...")
+        subprocess.run(
+            [sys.executable, "generate_data.py", "--database-url", f"sqlite:///{path}",
+             "--users", str(config["users"]), "--years", str(config["years"]), "--seed", str(seed),
+             "--end-date", end_date, "--summary", path + ".json"],
+            check=True
+        )
+    return path
+
+async def run_dataset(args) -> dict:
+    """Benchmark every endpoint against the dataset in DATABASE_URL (runs inside the child process)"""
+    import httpx
+    import jwt
+    import main
+    from cache import cache_manager
+    from database import SessionLocal
+    from models import Habit, Subject, GroupMembership
+
+    with open(args.run_one + ".json") as f:
+        ids = json.load(f)
+    user_id = ids[f"{args.user}_user"]
+
+    db = SessionLocal()
+    group_id = ids["largest_group"]
+    if not db.query(GroupMembership).filter(GroupMembership.group_id == group_id, GroupMembership.user_id == user_id).first():
+        # make sure the benchmarked user can see the largest group
+        db.add(GroupMembership(group_id=group_id, user_id=user_id, role="member"))
+        db.commit()
+    habit_ids = [h.id for h in db.query(Habit.id).filter(Habit.user_id == user_id).all()]
+    subject_id = db.query(Subject.id).filter(Subject.user_id == user_id).first()[0]
+    db.close()
+
+    token = jwt.encode({"sub": user_id, "aud": "authenticated"}, os.getenv("SUPABASE_JWT_SECRET", "benchmark-secret"), algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    selected = set(args.endpoints.split(",")) if args.endpoints else None
+    checkin_day = [datetime(2001, 1, 1)]  # unique past dates so check-ins never hit the duplicate path
+
+    def request_for(name, method, path, iteration):
+        url = path.format(group_id=group_id, habit_id=habit_ids[iteration % len(habit_ids)], subject_id=subject_id)
+        body = None
+        if name == "checkin_habit_log":
+            checkin_day[0] += timedelta(days=1)
+            body = {"completed_date": checkin_day[0].isoformat()}
+        elif name == "create_study_session":
+            body = {"subject_id": subject_id, "duration_minutes": 30, "notes": "benchmark"}
+        return method, url, body
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, method, path in ENDPOINTS:
+                if selected and name not in selected:
+                    continue
+                latencies = []
+                queries = []
+                errors = 0
+                total_start = time.perf_counter()
+                for iteration in range(args.warmup + args.iterations):
+                    if not args.warm_cache:
+                        cache_manager.clear_user_cache(user_id)
+                    method_, url, body = request_for(name, method, path, iteration)
+                    start = time.perf_counter()
+                    response = await client.request(method_, url, headers=headers, json=body)
+                    elapsed = time.perf_counter() - start
+                    if iteration < args.warmup:
+                        total_start = time.perf_counter()
+                        continue
+                    if response.status_code >= 400:
+                        errors += 1
+                    latencies.append(elapsed * 1000)
+                    queries.append(parse_query_count(response.headers.get("server-timing")))
+                total = time.perf_counter() - total_start
+                results[name] = {
+                    "method": method,
+                    "path": path,
+                    "iterations": args.iterations,
+                    "p50_ms": round(percentile(latencies, 0.50), 3),
+                    "p95_ms": round(percentile(latencies, 0.95), 3),
+                    "p99_ms": round(percentile(latencies, 0.99), 3),
+                    "mean_ms": round(statistics.mean(latencies), 3),
+                    "throughput_rps": round(args.iterations / total, 1),
+                    "queries": int(statistics.median(queries)),
+                    "errors": errors
+                }
+                r = results[name]
+                print(f"  {name:<28}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['throughput_rps']:>9.1f}{r['queries']:>7}{r['errors']:>6}", file=sys.stderr)
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """List of regressions (size, endpoint, metric, before, after) beyond the threshold"""
+    regressions = []
+    for size, endpoints in results.get("results", {}).items():
+        for name, current in endpoints.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before:
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                if current[metric] > before[metric] * (1 + threshold) and current[metric] - before[metric] >= min_delta_ms:
+                    regressions.append((size, name, metric, before[metric], current[metric]))
+            if current["queries"] > before["queries"]:
+                regressions.append((size, name, "queries", before["queries"], current["queries"]))
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    if args.run_one:
+        import asyncio
+        json.dump(asyncio.run(run_dataset(args)), sys.stdout)
+        return
+
+    output = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+            "user": args.user,
+            "warm_cache": args.warm_cache,
+            "seed": args.seed
+        },
+        "results": {}
+    }
+
+    for size in args.sizes.split(","):
+        path = ensure_dataset(size, args.seed)
+        print(f"\n[{size}] {'endpoint':<28}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'sql':>7}{'err':>6}")
+        # write benchmarks add rows, so every run works on a fresh copy of the dataset
+        with tempfile.TemporaryDirectory() as workdir:
+            copy = os.path.join(workdir, os.path.basename(path))
+            shutil.copyfile(path, copy)
+            shutil.copyfile(path + ".json", copy + ".json")
+            # one process per dataset: database.py binds its engine to DATABASE_URL at import time;
+            # the slow query / N+1 logs are silenced, query counts are reported in the table instead
+            env = {**os.environ, "DATABASE_URL": f"sqlite:///{copy}", "SERVER_TIMING": "1", "SLOW_QUERY_MS": "1000000", "N_PLUS_ONE_THRESHOLD": "1000000"}
+            child = [sys.executable, __file__, "--run-one", copy, "--iterations", str(args.iterations),
+                     "--warmup", str(args.warmup), "--user", args.user]
+            if args.warm_cache:
+                child.append("--warm-cache")
+            if args.endpoints:
+                child += ["--endpoints", args.endpoints]
+            completed = subprocess.run(child, env=env, stdout=subprocess.PIPE, check=True, text=True)
+            output["results"][size] = json.loads(completed.stdout)
+
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(output, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for size, name, metric, before, after in regressions:
+                print(f"  [{size}] {name} {metric}: {before} -> {after}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,6 +2,7 @@ import json
 import time
 from typing import Any, Optional, Dict
 from threading import Lock
+from timing import phase
 
 class CacheManager:
     """In-memory cache manager class (Redis alternative)"""
@@ -9,6 +10,10 @@ class CacheManager:
     def __init__(self):
         self._cache: Dict[str, Dict[str, Any]] = {}
         self._lock = Lock()
+        # counters exposed at /metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get_cache_key(self, user_id: str, endpoint: str, params: dict = None) -> str:
         """Generate cache key"""
@@ -21,14 +26,17 @@ class CacheManager:
 
     def get(self, key: str) -> Optional[Any]:
         """Get data from cache"""
-        with self._lock:
+        with phase("cache"), self._lock:
             if key in self._cache:
                 entry = self._cache[key]
                 if time.time() < entry['expires_at']:
+                    self.hits += 1
                     return entry['data']
                 else:
                     # Delete expired cache
                     del self._cache[key]
+                    self.evictions += 1
+            self.misses += 1
             return None
 
     def set(self, key: str, value: Any, expire_seconds: int = 300) -> bool:
@@ -52,6 +60,16 @@ class CacheManager:
                 return True
             return False
 
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._cache)
+            }
+
     def clear_user_cache(self, user_id: str) -> int:
         """Clear all cache for a user"""
         deleted_count = 0
@@ -0,0 +1,150 @@
+import os
+from datetime import date, timedelta
+from itertools import chain
+from typing import Dict, Iterable, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import StudySession, HabitLog
+import schemas
+from auth import get_current_user
+from cache import cache_manager
+from serialization import encode, json_response, calendar_adapter
+import localday
+from writebehind import write_behind
+
+router = APIRouter()
+
+# widest range per request (a month view with spill-over weeks is 42 days)
+CALENDAR_MAX_DAYS = int(os.getenv("CALENDAR_MAX_DAYS", "400"))
+# months are invalidated by the writes that touch them, the TTL only bounds memory
+CALENDAR_CACHE_SECONDS = 24 * 3600
+
+def month_of(day: date) -> date:
+    return day.replace(day=1)
+
+def next_month(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1)
+
+def month_key(user_id: str, month: date) -> str:
+    return cache_manager.get_cache_key(user_id, "calendar", {"month": month.strftime("%Y-%m")})
+
+# ======== aggregation ===========
+def load_days(db: Session, user_id: str, start: date, end: date) -> Dict[str, dict]:
+    """
+    Activity per day in [start, end) of the user's timezone: one grouped query per table on the
+    (user_id, local_day) indexes; only days with activity are returned
+    """
+    start_day, end_day = localday.day_number(start), localday.day_number(end)
+    days: Dict[str, dict] = {}
+
+    def day_entry(day: int) -> dict:
+        return days.setdefault(localday.day_date(day).isoformat(), {"study_minutes": 0, "sessions": 0, "subjects": [], "habit_ids": []})
+
+    rows = db.query(
+        StudySession.local_day,
+        StudySession.subject_id,
+        StudySession.subject_name,
+        func.sum(StudySession.duration_minutes),
+        func.count(StudySession.id)
+    ).filter(
+        StudySession.user_id == user_id,
+        StudySession.local_day >= start_day,
+        StudySession.local_day < end_day
+    ).group_by(StudySession.local_day, StudySession.subject_id, StudySession.subject_name)
+    for day, subject_id, subject_name, minutes, count in rows:
+        entry = day_entry(day)
+        entry["study_minutes"] += minutes or 0
+        entry["sessions"] += count
+        entry["subjects"].append({"subject_id": subject_id, "subject_name": subject_name, "minutes": minutes or 0})
+
+    rows = db.query(HabitLog.local_day, HabitLog.habit_id).filter(
+        HabitLog.user_id == user_id,
+        HabitLog.local_day >= start_day,
+        HabitLog.local_day < end_day
+    ).group_by(HabitLog.local_day, HabitLog.habit_id)
+    for day, habit_id in rows:
+        day_entry(day)["habit_ids"].append(habit_id)
+
+    for entry in days.values():
+        entry["subjects"].sort(key=lambda subject: -subject["minutes"])
+        entry["habit_ids"].sort()
+    return days
+
+def month_days(db: Session, user_id: str, first: date, last: date) -> Dict[str, dict]:
+    """Days of every month from first to last (month starts), cached per (user, month)"""
+    days: Dict[str, dict] = {}
+    missing = []
+    month = first
+    while month <= last:
+        cached = cache_manager.get(month_key(user_id, month))
+        if cached is None:
+            missing.append(month)
+        else:
+            days.update(cached)
+        month = next_month(month)
+    if missing:
+        # the uncached months are read together (one query per table), then cached one by one
+        loaded = load_days(db, user_id, missing[0], next_month(missing[-1]))
+        for month in missing:
+            prefix = month.strftime("%Y-%m-")
+            month_entries = {day: entry for day, entry in loaded.items() if day.startswith(prefix)}
+            cache_manager.set(month_key(user_id, month), month_entries, expire_seconds=CALENDAR_CACHE_SECONDS)
+            days.update(month_entries)
+    return days
+
+@router.get("/calendar", response_model=schemas.CalendarResponse)
+def read_calendar(
+    start: date = Query(..., alias="from", description="first day shown (YYYY-MM-DD)"),
+    end: date = Query(..., alias="to", description="last day shown, inclusive"),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Study minutes per subject, session count and completed habits for every day of the range"""
+    if end < start:
+        raise HTTPException(status_code=400, detail="`to` must not be before `from`")
+    if (end - start).days + 1 > CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {CALENDAR_MAX_DAYS} days per request")
+
+    write_behind.wait_user(user_id)  # queued check-ins first, the months cached below would miss them
+    days = month_days(db, user_id, month_of(start), month_of(end))
+    result = []
+    day = start
+    while day <= end:
+        entry = days.get(day.isoformat())
+        result.append({"date": day.isoformat(), **(entry or {"study_minutes": 0, "sessions": 0, "subjects": [], "habit_ids": []})})
+        day += timedelta(days=1)
+    return json_response(encode(calendar_adapter, {"start": start.isoformat(), "end": end.isoformat(), "days": result}))
+
+# ======== invalidation ===========
+# Any flushed change to a study session or habit log (whatever endpoint made it) records the
+# months it touches, old and new days included; those cached months are dropped on commit.
+# A timezone change moves every day of the user, PUT /profiles/me clears all their cache entries.
+
+def touched_months(obj) -> Iterable[Tuple[str, date]]:
+    if not isinstance(obj, (StudySession, HabitLog)):
+        return []
+    state = inspect(obj)
+    history = state.attrs["local_day"].history
+    owners = state.attrs["user_id"].history
+    values = [value for value in chain(history.unchanged, history.added, history.deleted) if value is not None]
+    users = [user for user in chain(owners.unchanged, owners.added, owners.deleted) if user is not None]
+    months = [month_of(localday.day_date(value)) for value in values] or [month_of(date.today())]
+    return [(user, month) for user in users for month in months]
+
+@event.listens_for(Session, "after_flush")
+def collect_calendar_months(session: Session, flush_context) -> None:
+    months: Set[Tuple[str, date]] = session.info.setdefault("calendar_months", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        months.update(touched_months(obj))
+
+@event.listens_for(Session, "after_commit")
+def invalidate_calendar_months(session: Session) -> None:
+    for user_id, month in session.info.pop("calendar_months", ()):
+        cache_manager.delete(month_key(user_id, month))
+
+@event.listens_for(Session, "after_rollback")
+def discard_calendar_months(session: Session) -> None:
+    session.info.pop("calendar_months", None)
@@ -0,0 +1,180 @@
+"""
+Query plan regression check for the hot endpoints
+
+    python check_query_plans.py                                        # generated small SQLite dataset
+    python check_query_plans.py --database-url postgresql://localhost/studyflow_plans --generate
+
+Calls every hot endpoint in-process, captures the SQL it runs and explains each distinct
+statement (EXPLAIN QUERY PLAN on SQLite, EXPLAIN (FORMAT JSON) with sequential scans
+disabled on PostgreSQL). Exits 1 if a statement reads study_sessions, habit_logs, habits
+or group_memberships with a full table scan instead of an index search.
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmark import ENDPOINTS, ensure_dataset
+
+# tables that grow with users and history and must always be reached through an index
+INDEXED_TABLES = {"study_sessions", "habit_logs", "habits", "group_memberships", "habit_day_bitmaps", "sync_tombstones"}
+
+PLAN_ENDPOINTS = ENDPOINTS + [
+    ("habit_logs_of_habit", "GET", "/habits/{habit_id}/logs"),
+    ("list_groups", "GET", "/groups"),
+    ("group_detail", "GET", "/groups/{group_id}"),
+    ("dashboard_leaderboard", "GET", "/dashboard/leaderboard/{group_id}"),
+    ("analytics_study_stats_year", "GET", "/analytics/study-stats?period=year"),
+    ("sync_full", "GET", "/sync"),
+    ("sync_delta", "GET", "/sync?since=djE6MA"),  # token of change 0
+    ("search", "GET", "/search?q=review"),
+    ("calendar", "GET", "/calendar?from=2025-03-24&to=2025-05-04"),
+    ("analytics_series", "GET", "/analytics/series?metric=study_minutes&from=2023-01-01&to=2025-12-31&granularity=month&group_by=subject"),
+    ("goal_forecast", "GET", "/goals/forecast"),
+    ("analytics_series_habits", "GET", "/analytics/series?metric=habit_checkins&from=2025-01-01&to=2025-12-31&granularity=week&group_by=habit"),
+]
+
+SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fail on full table scans in the SQL of hot endpoints")
+    parser.add_argument("--dataset", default="small", help="generated SQLite dataset size (see benchmark.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default=None, help="run against this database instead (e.g. a local PostgreSQL)")
+    parser.add_argument("--generate", action="store_true", help="reset and populate --database-url with generate_data.py first")
+    parser.add_argument("--verbose", action="store_true", help="print every plan, not only the failing ones")
+    return parser.parse_args(argv)
+
+def sqlite_scans(conn, statement: str, parameters):
+    """(plan text, tables read with a full scan)"""
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    details = [row[3] for row in rows]
+    scanned = set()
+    for detail in details:
+        match = SQLITE_SCAN.match(detail)
+        if match:
+            scanned.add(match.group(1))
+    return "\n".join(details), scanned
+
+def postgres_scans(conn, statement: str, parameters):
+    """(plan text, tables read with a full scan); seq scans are disabled so one only shows up if no index fits"""
+    with conn.begin():
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scanned = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Node Type") == "Seq Scan":
+            scanned.add(node.get("Relation Name"))
+        nodes.extend(node.get("Plans", []))
+    return json.dumps(plan[0]["Plan"], indent=1), scanned
+
+def pick_ids(db):
+    """The most active user, one of their habits/subjects and the largest group they belong to"""
+    from sqlalchemy import func
+    from models import Habit, Subject, StudySession, GroupMembership
+
+    user_id = db.query(StudySession.user_id).group_by(StudySession.user_id) \
+        .order_by(func.count(StudySession.id).desc()).first()[0]
+    habit_id = db.query(Habit.id).filter(Habit.user_id == user_id).first()[0]
+    subject_id = db.query(Subject.id).filter(Subject.user_id == user_id).first()[0]
+    member_of = db.query(GroupMembership.group_id).filter(GroupMembership.user_id == user_id)
+    group = db.query(GroupMembership.group_id).filter(GroupMembership.group_id.in_(member_of)) \
+        .group_by(GroupMembership.group_id).order_by(func.count(GroupMembership.id).desc()).first()
+    return user_id, habit_id, subject_id, group[0] if group else 0
+
+def capture_statements(user_id: str, habit_id: int, subject_id: int, group_id: int) -> list:
+    """(endpoint, statement, parameters) for every distinct statement the endpoints execute"""
+    import jwt
+    from sqlalchemy import event
+    from fastapi.testclient import TestClient
+    import main
+    from database import engine, normalize_sql
+
+    current = [None]
+    captured = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if current[0] and not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            captured.setdefault(normalize_sql(statement), (current[0], statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    token = jwt.encode({"sub": user_id, "aud": "authenticated"}, "query-plans", algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    bodies = {
+        "checkin_habit_log": {"completed_date": "2001-01-01T08:00:00Z"},
+        "create_study_session": {"subject_id": subject_id, "duration_minutes": 30},
+    }
+    try:
+        with TestClient(main.app) as client:
+            for name, method, path in PLAN_ENDPOINTS:
+                current[0] = name
+                url = path.format(group_id=group_id, habit_id=habit_id, subject_id=subject_id)
+                response = client.request(method, url, headers=headers, json=bodies.get(name))
+                if response.status_code >= 400:
+                    print(f"warning: {name} returned {response.status_code}")
+                current[0] = None
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return list(captured.values())
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    workdir = None
+    if args.database_url:
+        database_url = args.database_url
+        if args.generate:
+            subprocess.run([sys.executable, "generate_data.py", "--database-url", database_url,
+                            "--users", "300", "--years", "1", "--seed", str(args.seed), "--reset"], check=True)
+    else:
+        # the checkin/create endpoints write, so explain against a copy
+        workdir = tempfile.mkdtemp(prefix="query-plans-")
+        copy = os.path.join(workdir, "plans.db")
+        shutil.copyfile(ensure_dataset(args.dataset, args.seed), copy)
+        database_url = f"sqlite:///{copy}"
+    # database.py reads DATABASE_URL at import time; keep the slow query / N+1 logs quiet
+    os.environ.update({"DATABASE_URL": database_url, "SLOW_QUERY_MS": "1000000", "N_PLUS_ONE_THRESHOLD": "1000000"})
+
+    try:
+        from database import engine, SessionLocal
+        from migrate_add_indexes import create_missing_indexes
+
+        # datasets generated before an index was declared don't have it yet
+        for name in create_missing_indexes(engine):
+            print(f"created missing index {name}")
+        db = SessionLocal()
+        try:
+            ids = pick_ids(db)
+        finally:
+            db.close()
+
+        statements = capture_statements(*ids)
+        explain = sqlite_scans if engine.dialect.name == "sqlite" else postgres_scans
+        failures = 0
+        with engine.connect() as conn:
+            for endpoint, statement, parameters in statements:
+                plan, scanned = explain(conn, statement, parameters)
+                offending = scanned & INDEXED_TABLES
+                if offending:
+                    failures += 1
+                if offending or args.verbose:
+                    status = f"FULL SCAN of {', '.join(sorted(offending))}" if offending else "ok"
+                    print(f"\n[{endpoint}] {status}\n  {' '.join(statement.split())}\n  " + plan.replace("\n", "\n  "))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{len(statements)} distinct statements checked on {engine.dialect.name}, {failures} with full table scans")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
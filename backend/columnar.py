@@ -0,0 +1,36 @@
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# opt-in compact wire format (?format=columnar) for daily series:
+# one array per field instead of one object per day, dates implied by start + index
+COLUMNAR = "columnar"
+
+def wants_columnar(format: Optional[str]) -> bool:
+    """True if the client asked for the columnar format"""
+    return (format or "").lower() == COLUMNAR
+
+def daily_columns(start: date, days: int, rows: Iterable[Dict[str, Any]], fields: List[str], date_key: str = "date") -> Dict[str, Any]:
+    """
+    Spread sparse per-day rows into dense arrays of length `days` starting at `start`
+    Missing days are filled with 0, rows outside the window are ignored
+    """
+    columns = {field: [0] * days for field in fields}
+    for row in rows:
+        day = row[date_key]
+        if isinstance(day, datetime):
+            day = day.date()
+        elif not isinstance(day, date):
+            try:
+                day = date.fromisoformat(str(day)[:10])
+            except ValueError:
+                continue
+        index = (day - start).days
+        if 0 <= index < days:
+            for field in fields:
+                columns[field][index] = row[field] or 0
+    return {"start": start.isoformat(), "days": days, **columns}
+
+def record_columns(rows: Iterable[Dict[str, Any]], fields: List[str]) -> Dict[str, List[Any]]:
+    """Turn a list of objects into parallel arrays (one per field)"""
+    rows = list(rows)
+    return {field: [row[field] for row in rows] for field in fields}
@@ -0,0 +1,132 @@
+import os
+import gzip
+from typing import Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:  # brotli is optional, gzip is always available
+    import brotli
+except ImportError:
+    brotli = None
+
+# responses smaller than this are sent as-is (compression overhead is not worth it)
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header (None = identity)"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in SUPPORTED_ENCODINGS:  # ordered by preference
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress bytes with the given content encoding"""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressedBody:
+    """Encoded response body kept in cache together with its compressed variants"""
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._variants: Dict[str, bytes] = {}
+
+    def get(self, encoding: Optional[str]) -> bytes:
+        """Return the body for an encoding, compressing it only the first time it is asked for"""
+        if encoding is None:
+            return self.raw
+        if encoding not in self._variants:
+            self._variants[encoding] = compress(self.raw, encoding)
+        return self._variants[encoding]
+
+class CompressedBodyResponse(Response):
+    """JSON response that serves a precompressed variant of a cached CompressedBody"""
+    media_type = "application/json"
+
+    def __init__(self, body: CompressedBody, status_code: int = 200):
+        self.compressed_body = body
+        super().__init__(content=body.raw, status_code=status_code)
+
+    async def __call__(self, scope, receive, send):
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding and len(self.compressed_body.raw) >= MINIMUM_SIZE:
+            self.body = self.compressed_body.get(encoding)
+            self.init_headers({"content-encoding": encoding, "vary": "Accept-Encoding"})
+        await super().__call__(scope, receive, send)
+
+class CompressionMiddleware:
+    """
+    gzip / brotli compression negotiated from Accept-Encoding
+    Only complete (non-streaming) bodies above MINIMUM_SIZE are compressed,
+    responses that already carry a Content-Encoding are passed through untouched
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                passthrough = "content-encoding" in headers or headers.get("content-type", "").startswith("text/event-stream")
+                if passthrough:
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or passthrough or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # streaming or small body: send uncompressed
+                await send(start_message)
+                start_message = None
+                passthrough = True
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["content-encoding"] = encoding
+            headers["content-length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            start_message = None
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
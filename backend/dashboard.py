@@ -4,9 +4,9 @@ from sqlalchemy import func, text
 from database import get_db
 from auth import get_current_user
 import models
-from datetime import date
-from datetime import timedelta
 from cache import cache_manager
+import localday
+from writebehind import write_behind
 
 router = APIRouter()
 
@@ -15,6 +15,7 @@ def dashboard_summary(
     user_id: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    write_behind.wait_user(user_id)  # check-ins still queued by the write-behind flusher count too
     try:
         # Generate cache key
         cache_key = cache_manager.get_cache_key(user_id, "dashboard_summary")
@@ -24,19 +25,21 @@ def dashboard_summary(
         if cached_data:
             return cached_data
 
-        today = date.today()
+        # today in the user's timezone (local_day, see localday.py)
+        today = localday.today(db, user_id)
 
-        # Get today's study time for the current user (simplified timezone handling)
+        # Get today's study time for the current user
         study_today = db.query(func.sum(models.StudySession.duration_minutes))\
             .filter(models.StudySession.user_id == user_id)\
-            .filter(func.date(models.StudySession.created_at) == today)\
+            .filter(models.StudySession.local_day == today)\
             .scalar() or 0
 
         # Count unique habit completions for today (user's habits only)
         habit_done = db.query(func.count(func.distinct(models.HabitLog.habit_id)))\
             .join(models.Habit, models.HabitLog.habit_id == models.Habit.id)\
+            .filter(models.HabitLog.user_id == user_id)\
             .filter(models.Habit.user_id == user_id)\
-            .filter(func.date(models.HabitLog.completed_date) == today)\
+            .filter(models.HabitLog.local_day == today)\
             .scalar() or 0
 
         # Count total habits for the current user
@@ -63,33 +66,39 @@ def dashboard_weekly(
     user_id: str = Depends(get_current_user),  # add JWT authentication
     db: Session = Depends(get_db)
 ):
+    write_behind.wait_user(user_id)
     try:
-        today = date.today()
+        # the last 7 days in the user's timezone (local_day, see localday.py)
+        today = localday.today(db, user_id)
+        first_day = today - 6
 
         weekly_data = []  # list for saving weekly data
         day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]  # list for days
 
-        for i in range(6,-1,-1):  # iterate till today from 6 days ago
-            target_date = today - timedelta(days=i)  # calculate the date
-
-            # load the total study time for that day based on created_at date
-            study_time = db.query(func.sum(models.StudySession.duration_minutes))\
-                .filter(func.date(models.StudySession.created_at) == target_date)\
-                .filter(models.StudySession.user_id == user_id)\
-                .scalar() or 0 
-            
-            # load the habit achievement for that day based on completed_date
-            habit_count = db.query(func.count(func.distinct(models.HabitLog.habit_id)))\
-                .join(models.Habit, models.HabitLog.habit_id == models.Habit.id)\
-                .filter(func.date(models.HabitLog.completed_date) == target_date)\
-                .filter(models.Habit.user_id == user_id)\
-                .scalar() or 0  
-            
+        # total study time per day, one grouped query for the week
+        study_times = dict(db.query(models.StudySession.local_day, func.sum(models.StudySession.duration_minutes))\
+            .filter(models.StudySession.user_id == user_id)\
+            .filter(models.StudySession.local_day >= first_day)\
+            .filter(models.StudySession.local_day <= today)\
+            .group_by(models.StudySession.local_day)\
+            .all())
+
+        # habits achieved per day
+        habit_counts = dict(db.query(models.HabitLog.local_day, func.count(func.distinct(models.HabitLog.habit_id)))\
+            .join(models.Habit, models.HabitLog.habit_id == models.Habit.id)\
+            .filter(models.HabitLog.user_id == user_id)\
+            .filter(models.Habit.user_id == user_id)\
+            .filter(models.HabitLog.local_day >= first_day)\
+            .filter(models.HabitLog.local_day <= today)\
+            .group_by(models.HabitLog.local_day)\
+            .all())
+
+        for day in range(first_day, today + 1):  # iterate till today from 6 days ago
             # save the daily data as dictionary
             weekly_data.append({
-                "day": day_names[target_date.weekday()],  # name of day
-                "study_time": study_time,  # study time
-                "habit_count": habit_count  # habit count
+                "day": day_names[localday.day_date(day).weekday()],  # name of day
+                "study_time": study_times.get(day) or 0,  # study time
+                "habit_count": habit_counts.get(day) or 0  # habit count
             })
 
         return{
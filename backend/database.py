@@ -1,7 +1,15 @@
 import os
-from sqlalchemy import create_engine # core tool that connects with the database
+import re
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from sqlalchemy import create_engine, event # core tool that connects with the database
 from sqlalchemy.ext.declarative import declarative_base # basic class to make table model
 from sqlalchemy.orm import sessionmaker # tool to make a session to converse with the database
+from sqlalchemy.pool import QueuePool
 
 # Database URL - supports both SQLite (local) and PostgreSQL (production)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./study_habit.db")
@@ -10,17 +18,97 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./study_habit.db")
 if DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
 
+logger = logging.getLogger("studyflow.sql")
+
+# statements slower than this are logged with their parameters and query plan
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# the same normalized statement executed more than this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+# raise NPlusOneError instead of only logging (meant for test runs)
+N_PLUS_ONE_RAISE = os.getenv("N_PLUS_ONE_RAISE", "").lower() in ("1", "true", "yes")
+
+class NPlusOneError(Exception):
+    """Raised when N_PLUS_ONE_RAISE is set and a request repeats the same statement too often"""
+
+def normalize_sql(statement: str) -> str:
+    """Collapse literals, IN lists and whitespace so repeated statements compare equal"""
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+\b", "?", statement)
+    statement = re.sub(r"%\(\w+\)s|%s|:\w+", "?", statement)
+    statement = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?)", statement)
+    return " ".join(statement.split())
+
+class QueryStats:
+    """Database work done while handling one request (filled by the engine events below)"""
+
+    def __init__(self, route: Optional[str] = None):
+        self.route = route
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.statements: Counter = Counter()  # normalized SQL -> executions
+
+    def n_plus_one(self, threshold: int = None) -> List[Tuple[str, int]]:
+        """Statements executed more than `threshold` times, most repeated first"""
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [(sql, count) for sql, count in self.statements.most_common() if count > threshold]
+
+    def assert_no_n_plus_one(self, threshold: int = None) -> None:
+        """Test helper: fail if any statement was repeated more than `threshold` times"""
+        offenders = self.n_plus_one(threshold)
+        if offenders:
+            sql, count = offenders[0]
+            raise NPlusOneError(f"N+1 query pattern in {self.route or 'block'}: executed {count}x: {sql}")
+
+    def report(self) -> None:
+        """Log N+1 patterns found in this request"""
+        for sql, count in self.n_plus_one():
+            logger.warning("N+1 query pattern on %s: executed %dx: %s", self.route, count, sql)
+
+# stats of the request currently being handled (None outside of a request)
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+@contextmanager
+def track_queries(route: str = None):
+    """
+    Collect QueryStats for a block of code (scripts and tests), e.g.
+        with track_queries() as stats:
+            dashboard_weekly(user_id, db)
+        stats.assert_no_n_plus_one()
+    """
+    stats = QueryStats(route)
+    token = query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats.reset(token)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each connection checkout waited"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = query_stats.get()
+            if stats is not None:
+                stats.pool_wait_seconds += time.perf_counter() - start
+
 # creating db engine
 if DATABASE_URL.startswith("sqlite"):
     # SQLite configuration
     engine = create_engine(
         DATABASE_URL,
-        connect_args={"check_same_thread": False} # SQLite config for multiple requests
+        connect_args={"check_same_thread": False}, # SQLite config for multiple requests
+        # file databases use a QueuePool by default, in-memory ones must keep their single connection
+        **({} if ":memory:" in DATABASE_URL or DATABASE_URL == "sqlite://" else {"poolclass": TimedQueuePool})
     )
 else:
     # PostgreSQL configuration
     engine = create_engine(
         DATABASE_URL,
+        poolclass=TimedQueuePool, # QueuePool with checkout wait timing
         pool_pre_ping=True,      # Check connection status
         pool_recycle=300,        # Connection reuse time (5 minutes)
         pool_size=5,             # Connection pool size
@@ -28,6 +116,65 @@ else:
         echo=False               # Disable SQL logging (production)
     )
 
+# count and time every statement for the current request
+@event.listens_for(engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(conn, statement, parameters, elapsed, executemany)
+    stats = query_stats.get()
+    if stats is not None:
+        stats.query_count += 1
+        stats.query_seconds += elapsed
+        normalized = normalize_sql(statement)
+        stats.statements[normalized] += 1
+        if N_PLUS_ONE_RAISE and stats.statements[normalized] > N_PLUS_ONE_THRESHOLD:
+            stats.assert_no_n_plus_one()
+
+def explain(conn, statement: str, parameters) -> str:
+    """
+    Query plan of a statement, run on a separate cursor of the same connection; on PostgreSQL
+    inside a savepoint, so a failing EXPLAIN doesn't abort the caller's transaction
+    """
+    sqlite = engine.dialect.name == "sqlite"
+    prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        if sqlite:
+            cursor.execute(prefix + statement, parameters)
+            return "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+        # the raw cursor bypasses SQLAlchemy, so the savepoint is managed by hand as well
+        cursor.execute("SAVEPOINT explain_plan")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT explain_plan")
+            raise
+        finally:
+            cursor.execute("RELEASE SAVEPOINT explain_plan")
+        return plan
+    finally:
+        cursor.close()
+
+def log_slow_query(conn, statement: str, parameters, elapsed: float, executemany: bool) -> None:
+    """Log a slow statement with its parameters and (for single reads/writes) its plan"""
+    stats = query_stats.get()
+    plan = ""
+    if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception as e:
+            plan = f"(EXPLAIN failed: {e})"
+    logger.warning(
+        "Slow query (%.1f ms) on %s: %s | params=%.500r | plan:\n%s",
+        elapsed * 1000, stats.route if stats else None, " ".join(statement.split()), parameters, plan
+    )
+
 # db session generator
 SessionLocal = sessionmaker(autocommit = False, autoflush = False, bind = engine)
 # SessionLocal: generator that makes sessions to converse with the db
@@ -0,0 +1,168 @@
+import os
+import math
+from datetime import datetime
+from itertools import chain
+from typing import Optional, Set
+import numpy as np
+from fastapi import APIRouter, Depends
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import StudySession, HabitLog, Goal
+import schemas
+from auth import get_current_user
+from cache import cache_manager
+from serialization import encode, json_response, forecast_adapter
+from analytics import METRICS
+from calendar_view import next_month
+import localday
+from writebehind import write_behind
+
+router = APIRouter()
+
+RECENT_DAYS = 7  # short window reported next to the long one
+# full days before today the daily rate is estimated from, never shorter than the recent window
+FORECAST_HISTORY_DAYS = max(RECENT_DAYS, int(os.getenv("FORECAST_HISTORY_DAYS", "28")))
+# dropped by the user's next relevant write (see below); the TTL bounds how old the time of day gets
+FORECAST_CACHE_SECONDS = 3600
+
+# ======== periods ===========
+def metric_of(goal: Goal) -> str:
+    """Daily series a goal counts: habit check-ins, study sessions or study minutes"""
+    if goal.goal_type.endswith("_habit"):
+        return "habit_checkins"
+    return "study_sessions" if goal.target_unit == "sessions" else "study_minutes"
+
+def period_days(period: str, today: int) -> Optional[tuple]:
+    """First and last day (inclusive) of the goal's current period, None for unknown periods"""
+    day = localday.day_date(today)
+    if period == "daily":
+        return today, today
+    if period == "weekly":
+        start = today - day.weekday()  # Monday, like goal progress
+        return start, start + 6
+    if period == "monthly":
+        start = today - day.day + 1
+        return start, localday.day_number(next_month(day.replace(day=1))) - 1
+    return None
+
+def normal_cdf(z: float) -> float:
+    return 0.5 * (1 + math.erf(z / math.sqrt(2)))
+
+# ======== forecasts ===========
+def load_series(db: Session, user_id: str, metric: str, first_day: int, today: int) -> np.ndarray:
+    """Dense daily values from first_day to today (one grouped query on the (user_id, local_day) index)"""
+    model, value, _ = METRICS[metric]
+    series = np.zeros(today - first_day + 1)
+    for day, total in db.query(model.local_day, value).filter(
+        model.user_id == user_id,
+        model.local_day >= first_day,
+        model.local_day <= today
+    ).group_by(model.local_day):
+        series[day - first_day] = total or 0
+    return series
+
+def forecast_goals(db: Session, user_id: str) -> dict:
+    """
+    Projections for every active goal of the user, from one daily series per metric:
+    the period total so far plus the remaining time at the mean daily rate of the last
+    FORECAST_HISTORY_DAYS full days, with the daily spread giving the probability of the target
+    """
+    zone = localday.user_zone(db, user_id)
+    now = datetime.now().astimezone(zone)
+    today = localday.day_number(now.date())
+    # the rest of today counts as remaining time
+    left_today = 1 - (now - now.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds() / 86400
+
+    goals = db.query(Goal).filter(Goal.user_id == user_id, Goal.is_active == 1).order_by(Goal.id).all()
+    periods = {goal.id: period_days(goal.period, today) for goal in goals}
+    goals = [goal for goal in goals if periods[goal.id] is not None]
+    first_day = min([today - FORECAST_HISTORY_DAYS] + [periods[goal.id][0] for goal in goals])
+
+    # per metric: the series and its rolling means / spread at the end of yesterday
+    rates = {}
+    for metric in {metric_of(goal) for goal in goals}:
+        series = load_series(db, user_id, metric, first_day, today)
+        sums = np.cumsum(np.concatenate(([0.0], series)))
+        history = series[-FORECAST_HISTORY_DAYS - 1:-1]
+        rates[metric] = {
+            "sums": sums,
+            "mean": (sums[-2] - sums[-2 - FORECAST_HISTORY_DAYS]) / FORECAST_HISTORY_DAYS,
+            "recent": (sums[-2] - sums[-2 - RECENT_DAYS]) / RECENT_DAYS,
+            "std": float(history.std(ddof=1)) if len(history) > 1 else 0.0,
+        }
+
+    forecasts = []
+    for goal in goals:
+        start, end = periods[goal.id]
+        rate = rates[metric_of(goal)]
+        actual = float(rate["sums"][-1] - rate["sums"][start - first_day])
+        remaining = end - today + left_today
+        expected = actual + rate["mean"] * remaining
+        target = goal.target_value or 0
+        if actual >= target:
+            probability = 1.0
+        elif rate["std"] == 0:
+            probability = 1.0 if expected >= target else 0.0
+        else:
+            # days are treated as independent: the remaining total ~ N(mean * r, std^2 * r)
+            probability = 1 - normal_cdf((target - expected) / (rate["std"] * math.sqrt(remaining)))
+        forecasts.append({
+            "goal_id": goal.id,
+            "goal_type": goal.goal_type,
+            "period": goal.period,
+            "target_value": target,
+            "target_unit": goal.target_unit,
+            "period_start": localday.day_date(start).isoformat(),
+            "period_end": localday.day_date(end).isoformat(),
+            "actual_value": round(actual, 2),
+            "expected_value": round(expected, 2),
+            "probability": round(probability, 4),
+            "required_daily_pace": round(max(0.0, target - actual) / remaining, 2),
+            "daily_average": round(float(rate["mean"]), 2),
+            "recent_daily_average": round(float(rate["recent"]), 2),
+            "remaining_days": round(remaining, 2)
+        })
+    return {"today": localday.day_date(today).isoformat(), "forecasts": forecasts}
+
+def forecast_key(user_id: str) -> str:
+    return cache_manager.get_cache_key(user_id, "goal_forecast")
+
+@router.get("/goals/forecast", response_model=schemas.GoalForecastResponse)
+def read_goal_forecast(
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Expected end-of-period value, probability of reaching the target and the daily pace still
+    needed, for all active goals of the current user at once
+    """
+    write_behind.wait_user(user_id)
+    cached = cache_manager.get(forecast_key(user_id))
+    today = localday.day_date(localday.today(db, user_id)).isoformat()
+    if cached is not None and cached["today"] == today:
+        return json_response(cached["body"])
+    result = forecast_goals(db, user_id)
+    body = encode(forecast_adapter, result)
+    cache_manager.set(forecast_key(user_id), {"today": result["today"], "body": body}, expire_seconds=FORECAST_CACHE_SECONDS)
+    return json_response(body)
+
+# ======== invalidation ===========
+# A committed change to a user's study sessions, habit logs or goals drops their forecast.
+
+@event.listens_for(Session, "after_flush")
+def collect_forecast_users(session: Session, flush_context) -> None:
+    users: Set[str] = session.info.setdefault("forecast_users", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (StudySession, HabitLog, Goal)) and obj.user_id is not None:
+            users.add(obj.user_id)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_forecasts(session: Session) -> None:
+    for user_id in session.info.pop("forecast_users", ()):
+        cache_manager.delete(forecast_key(user_id))
+
+@event.listens_for(Session, "after_rollback")
+def discard_forecast_users(session: Session) -> None:
+    session.info.pop("forecast_users", None)
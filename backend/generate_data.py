@@ -0,0 +1,298 @@
+"""
+Synthetic dataset generator for load tests and benchmarks
+
+    python generate_data.py --users 2000 --years 3 --seed 42
+    python generate_data.py --database-url postgresql://... --users 20000 --reset
+
+Creates profiles, subjects, habits, multi-year study sessions and habit logs, goals,
+study groups and memberships with realistic skew (a few power users, many light users,
+a handful of very large groups). Rows are written with bulk executemany inserts in
+batches, and the same seed and --end-date always produce the same dataset.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+SUBJECT_NAMES = ["Math", "Physics", "Chemistry", "Biology", "History", "English", "Korean", "Economics",
+                 "Computer Science", "Statistics", "Philosophy", "Art", "Music", "Geography", "Japanese"]
+HABIT_NAMES = ["Exercise", "Reading", "Meditation", "Sleep before 12", "Drink water", "Journal",
+               "No phone before bed", "Stretching", "Walk 10k steps", "Review flashcards", "Healthy breakfast"]
+COLORS = ["#3B82F6", "#10B981", "#F59E0B", "#EF4444", "#8B5CF6", "#EC4899", "#14B8A6", "#F97316"]
+NOTES = ["Reviewed lecture notes", "Solved practice problems", "Read the textbook chapter",
+         "Prepared for the midterm", "Worked on the assignment", "Watched recorded lecture",
+         "Group study session", "Made summary flashcards", "Past exam questions", None, None, None]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Populate the database with a synthetic StudyFlow dataset")
+    parser.add_argument("--database-url", help="target database (default: DATABASE_URL or the local SQLite file)")
+    parser.add_argument("--users", type=int, default=1000, help="number of users")
+    parser.add_argument("--subjects", type=float, default=5, help="average subjects per user")
+    parser.add_argument("--habits", type=float, default=4, help="average habits per user")
+    parser.add_argument("--years", type=float, default=2, help="years of history to generate")
+    parser.add_argument("--groups", type=int, default=None, help="number of study groups (default: users / 20)")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None, help="last day of history (default: today)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed (same seed, same dataset)")
+    parser.add_argument("--batch-size", type=int, default=20000, help="rows per bulk insert")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    parser.add_argument("--summary", default=None, help="write row counts and sample ids (heavy/typical user, largest group) to this JSON file")
+    return parser.parse_args(argv)
+
+class BulkWriter:
+    """Buffers rows per table and writes them with executemany in fixed-size batches"""
+
+    def __init__(self, connection, batch_size: int):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, table, row: dict) -> None:
+        buffer = self.buffers.setdefault(table, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table=None) -> None:
+        tables = [table] if table is not None else list(self.buffers)
+        for current in tables:
+            rows = self.buffers.get(current)
+            if rows:
+                self.connection.execute(current.insert(), rows)
+                self.counts[current.name] = self.counts.get(current.name, 0) + len(rows)
+                self.buffers[current] = []
+
+def next_id(connection, table) -> int:
+    """First free integer primary key, so explicit ids can be assigned in bulk"""
+    from sqlalchemy import func, select
+    return (connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+def sync_sequence(connection, table) -> None:
+    """Move a PostgreSQL serial sequence past the explicitly assigned ids, so later inserts don't collide"""
+    if connection.dialect.name != "postgresql":
+        return  # SQLite picks max(rowid) + 1 by itself
+    connection.exec_driver_sql(
+        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {table.name}), 1), (SELECT MAX(id) IS NOT NULL FROM {table.name}))"
+    )
+
+def activity_factor(rng: random.Random) -> float:
+    """Pareto-distributed activity: most users are light, a few are power users"""
+    return min(rng.paretovariate(1.6), 12.0)
+
+def generate_dataset(users=1000, subjects=5, habits=4, years=2, groups=None, end_date=None,
+                     seed=42, batch_size=20000, reset=False, verbose=True) -> dict:
+    """
+    Generate a dataset into database.engine and return row counts plus a few handy ids:
+    the heaviest user, a typical (median) user and the largest group
+    """
+    from database import engine, Base
+    import models
+    import streaks
+    import sync
+    import search  # the full-text index (and its triggers) is created along with the tables
+    import localday
+
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=int(years * 365))
+    days = (end_date - start_date).days + 1
+    groups = max(1, users // 20) if groups is None else groups
+
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    started = time.perf_counter()
+    profiles_table = models.Profile.__table__
+    subjects_table = models.Subject.__table__
+    sessions_table = models.StudySession.__table__
+    habits_table = models.Habit.__table__
+    logs_table = models.HabitLog.__table__
+    bitmaps_table = models.HabitDayBitmap.__table__
+    goals_table = models.Goal.__table__
+    groups_table = models.StudyGroup.__table__
+    memberships_table = models.GroupMembership.__table__
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "sqlite":
+            # bulk load settings: durability is not needed for generated data
+            connection.exec_driver_sql("PRAGMA synchronous = OFF")
+            connection.exec_driver_sql("PRAGMA temp_store = MEMORY")
+
+        writer = BulkWriter(connection, batch_size)
+        subject_id = next_id(connection, subjects_table)
+        habit_id = next_id(connection, habits_table)
+        group_id = next_id(connection, groups_table)
+        activity = {}
+
+        for index in range(users):
+            user_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            factor = activity_factor(rng)
+            activity[user_id] = factor
+            joined = start_date + timedelta(days=int(rng.random() * days * 0.5))
+            writer.add(profiles_table, {
+                "id": user_id,
+                "user_id": user_id,
+                "email": f"user{index}_{seed}@example.com",
+                "full_name": f"User {index}",
+                "created_at": datetime.combine(joined, datetime.min.time())
+            })
+
+            # subjects
+            user_subjects = []
+            for name in rng.sample(SUBJECT_NAMES, min(len(SUBJECT_NAMES), max(1, int(rng.expovariate(1 / subjects)) + 1))):
+                writer.add(subjects_table, {
+                    "id": subject_id,
+                    "user_id": user_id,
+                    "name": name,
+                    "color": rng.choice(COLORS),
+                    "created_at": datetime.combine(joined, datetime.min.time())
+                })
+                user_subjects.append((subject_id, name, rng.random() + 0.2))
+                subject_id += 1
+            weights = [weight for _, _, weight in user_subjects]
+
+            # habits
+            user_habits = []
+            for name in rng.sample(HABIT_NAMES, min(len(HABIT_NAMES), max(1, int(rng.expovariate(1 / habits)) + 1))):
+                target = rng.choice([3, 4, 5, 7, 7])
+                writer.add(habits_table, {
+                    "id": habit_id,
+                    "user_id": user_id,
+                    "name": name,
+                    "description": f"{name} ({target}x per week)",
+                    "target_frequency": target,
+                    "color": rng.choice(COLORS),
+                    "created_at": datetime.combine(joined, datetime.min.time())
+                })
+                # adherence grows with activity, clipped to a probability
+                user_habits.append((habit_id, min(0.97, target / 7 * (0.35 + 0.12 * factor))))
+                habit_id += 1
+
+            # goals
+            writer.add(goals_table, {
+                "user_id": user_id,
+                "goal_type": "weekly_study",
+                "target_value": rng.choice([300, 600, 900, 1200]),
+                "target_unit": "minutes",
+                "period": "weekly",
+                "is_active": 1,
+                "created_at": datetime.combine(joined, datetime.min.time())
+            })
+
+            # daily activity from the join date to the end date
+            bitmaps = {}  # (habit_id, year) -> day bits, written once per user
+            study_probability = min(0.95, 0.25 * factor)
+            day = joined
+            while day <= end_date:
+                weekend = day.weekday() >= 5
+                local_day = localday.day_number(day)
+                if rng.random() < study_probability * (0.7 if weekend else 1.0):
+                    for _ in range(1 + int(rng.expovariate(1 / (0.5 + 0.3 * factor)))):
+                        subject, subject_name, _ = rng.choices(user_subjects, weights)[0]
+                        started_at = datetime.combine(day, datetime.min.time()) + timedelta(minutes=rng.randint(6 * 60, 23 * 60))
+                        duration = max(5, int(rng.gauss(45 + 10 * factor, 25)))
+                        writer.add(sessions_table, {
+                            "user_id": user_id,
+                            "subject_id": subject,
+                            "subject_name": subject_name,
+                            "duration_minutes": duration,
+                            "notes": rng.choice(NOTES),
+                            "created_at": started_at,
+                            "local_day": local_day  # profiles have no timezone: the server-local day
+                        })
+                for habit, probability in user_habits:
+                    if rng.random() < probability:
+                        writer.add(logs_table, {
+                            "user_id": user_id,
+                            "habit_id": habit,
+                            "completed_date": datetime.combine(day, datetime.min.time()) + timedelta(minutes=rng.randint(5 * 60, 23 * 60)),
+                            "local_day": local_day,
+                            "created_at": datetime.combine(day, datetime.min.time())
+                        })
+                        bitmaps[(habit, day.year)] = bitmaps.get((habit, day.year), 0) | 1 << streaks.day_of_year(day)
+                day += timedelta(days=1)
+            for (habit, year), bits in bitmaps.items():
+                writer.add(bitmaps_table, {"habit_id": habit, "user_id": user_id, "year": year, "days": streaks.to_bytes(bits)})
+
+            if verbose and (index + 1) % max(1, users // 10) == 0:
+                print(f"  {index + 1}/{users} users ({time.perf_counter() - started:.1f}s)")
+
+        # groups: Zipf-like sizes, so a few groups are very large and most are small
+        user_ids = list(activity)
+        largest_group = None
+        for rank in range(1, groups + 1):
+            size = max(2, min(len(user_ids), int(len(user_ids) * 0.5 / rank)))
+            members = rng.sample(user_ids, size)
+            writer.add(groups_table, {
+                "id": group_id,
+                "name": f"Study Group {rank}",
+                "description": "Generated group",
+                "created_by": members[0],
+                "created_at": datetime.combine(start_date, datetime.min.time()),
+                "invite_code": f"gen{seed}-{group_id}"
+            })
+            for position, member in enumerate(members):
+                writer.add(memberships_table, {
+                    "group_id": group_id,
+                    "user_id": member,
+                    "role": "admin" if position == 0 else "member",
+                    "joined_at": datetime.combine(start_date, datetime.min.time())
+                })
+            if largest_group is None:
+                largest_group = group_id
+            group_id += 1
+
+        writer.flush()
+        for table in (subjects_table, habits_table, groups_table):
+            sync_sequence(connection, table)
+        # bulk rows bypass the ORM, number them for delta sync here
+        sync.backfill(connection)
+        search.optimize(connection)
+
+    ranked = sorted(activity, key=activity.get)
+    summary = {
+        "rows": writer.counts,
+        "total_rows": sum(writer.counts.values()),
+        "seconds": round(time.perf_counter() - started, 1),
+        "heavy_user": ranked[-1] if ranked else None,
+        "typical_user": ranked[len(ranked) // 2] if ranked else None,
+        "largest_group": largest_group
+    }
+    return summary
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.database_url:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from database import engine
+    print(f"Generating {args.users} users, {args.years} years of history into {engine.url.render_as_string(hide_password=True)}")
+    summary = generate_dataset(
+        users=args.users,
+        subjects=args.subjects,
+        habits=args.habits,
+        years=args.years,
+        groups=args.groups,
+        end_date=args.end_date,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        reset=args.reset
+    )
+    for table, count in summary["rows"].items():
+        print(f"{table:<20}{count:>12}")
+    rate = summary["total_rows"] / max(summary["seconds"], 0.1)
+    print(f"{summary['total_rows']} rows in {summary['seconds']}s ({rate:,.0f} rows/s)")
+    print(f"heavy user: {summary['heavy_user']}  typical user: {summary['typical_user']}  largest group: {summary['largest_group']}")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, or_
 
 from database import get_db
-from models import StudyGroup, GroupMembership, StudySession, HabitLog, Habit, Profile
+from models import StudyGroup, GroupMembership, Profile
 import schemas
 from auth import get_current_user
+from leaderboard import leaderboard, MemberStats
 
 router = APIRouter()
 
@@ -152,115 +153,77 @@ def join_group(
     )
     db.add(membership)
     db.commit()
+    leaderboard.invalidate_group(group.id, user_id, "joined")
 
     return {"message": "Successfully joined group", "group_name": group.name}
 
 # 5. Get group leaderboard
+def display_names(user_ids: List[str], db: Session) -> Dict[str, str]:
+    """Leaderboard names for many users with one profile query (missing profiles are created)"""
+    profiles = {p.id: p for p in db.query(Profile).filter(Profile.id.in_(user_ids))}
+    missing = [member_id for member_id in user_ids if member_id not in profiles]
+    for member_id in missing:
+        profiles[member_id] = ensure_profile_exists(member_id, db)
+
+    names = {}
+    for member_id in user_ids:
+        profile = profiles[member_id]
+        # Use full_name if available, otherwise use email (without domain for privacy)
+        if profile.full_name and profile.full_name.strip():
+            names[member_id] = profile.full_name.strip()
+        elif getattr(profile, 'email', None):
+            names[member_id] = profile.email.split('@')[0]
+        else:
+            names[member_id] = f"User {member_id[:8]}"  # Fallback with partial ID
+    return names
+
+def leaderboard_entry(rank: int, member_id: str, minutes: int, stats: MemberStats, username: str) -> dict:
+    total_habits = len(stats.targets)
+    completed_habits = stats.completed_habits
+    return {
+        "user_id": member_id,
+        "user_email": member_id,
+        "username": username,
+        "total_study_minutes": minutes,
+        "study_sessions_count": stats.sessions,
+        "habit_completion_rate": completed_habits / total_habits if total_habits > 0 else 0,
+        "total_habits": total_habits,
+        "completed_habits": completed_habits,
+        "best_streak": stats.best_streak,
+        "rank": rank
+    }
+
 @router.get("/groups/{group_id}/leaderboard", response_model=schemas.GroupLeaderboardResponse)
 def get_group_leaderboard(
     group_id: int,
+    limit: Optional[int] = Query(None, ge=1, description="only the top N members (default: everyone)"),
     user_id: str = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Gets leaderboard for a study group"""
-    # Check if user is member of the group
-    membership = db.query(GroupMembership).filter(
-        and_(
-            GroupMembership.group_id == group_id,
-            GroupMembership.user_id == user_id
-        )
-    ).first()
-
-    if not membership:
+    """Gets the weekly leaderboard for a study group (ranked by study minutes, Monday to Sunday)"""
+    # scores come from the incrementally maintained board, so a view costs no aggregation
+    me = leaderboard.member_rank(db, group_id, user_id)
+    if not me:
         raise HTTPException(status_code=403, detail="Not a member of this group")
 
-    # Get all group members
-    memberships = db.query(GroupMembership).filter(
-        GroupMembership.group_id == group_id
-    ).all()
-
-    member_ids = [m.user_id for m in memberships]
-
-    # Calculate week range (Monday to Sunday)
-    today = datetime.now()
-    week_start = today - timedelta(days=today.weekday())  # Monday
-    week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_end = week_start + timedelta(days=6, hours=23, minutes=59, seconds=59)
-
-    leaderboard = []
-
-    for member_id in member_ids:
-        # Get user info from Profile table (ensure profile exists)
-        profile = ensure_profile_exists(member_id, db)
-
-        # Use full_name if available, otherwise use email (without domain for privacy)
-        if profile.full_name and profile.full_name.strip():
-            username = profile.full_name.strip()
-        elif hasattr(profile, 'email') and profile.email:
-            # Use email username part (before @) for privacy
-            username = profile.email.split('@')[0]
-        else:
-            username = f"User {member_id[:8]}"  # Fallback with partial ID
-
-        # Calculate study statistics for the week
-        study_sessions = db.query(StudySession).filter(
-            and_(
-                StudySession.user_id == member_id,
-                StudySession.created_at >= week_start,
-                StudySession.created_at <= week_end
-            )
-        ).all()
-
-        total_study_minutes = sum(session.duration_minutes for session in study_sessions)
-        study_sessions_count = len(study_sessions)
-
-        # Calculate habit completion rate for the week
-        habits = db.query(Habit).filter(Habit.user_id == member_id).all()
-        total_habits = len(habits)
-
-        completed_habits = 0
-        if total_habits > 0:
-            for habit in habits:
-                habit_logs = db.query(HabitLog).filter(
-                    and_(
-                        HabitLog.habit_id == habit.id,
-                        HabitLog.completed_date >= week_start.date(),
-                        HabitLog.completed_date <= week_end.date()
-                    )
-                ).all()
-                if len(habit_logs) >= habit.target_frequency:
-                    completed_habits += 1
-
-        habit_completion_rate = completed_habits / total_habits if total_habits > 0 else 0
-
-        leaderboard.append({
-            "user_id": member_id,
-            "user_email": member_id,
-            "username": username,
-            "total_study_minutes": total_study_minutes,
-            "study_sessions_count": study_sessions_count,
-            "habit_completion_rate": habit_completion_rate,
-            "total_habits": total_habits,
-            "completed_habits": completed_habits,
-            "rank": 0  # Will be calculated after sorting
-        })
-
-    # Sort by total study minutes (descending)
-    leaderboard.sort(key=lambda x: x["total_study_minutes"], reverse=True)
-
-    # Assign ranks
-    for i, entry in enumerate(leaderboard, 1):
-        entry["rank"] = i
-
     group = db.query(StudyGroup).filter(StudyGroup.id == group_id).first()
 
+    standings = leaderboard.standings(db, group_id, limit)
+    names = display_names(list({member_id for _, member_id, _, _ in standings} | {user_id}), db)
+    my_rank, my_minutes, my_stats = me
+
     return {
         "group_id": group_id,
         "group_name": group.name,
-        "leaderboard": leaderboard,
-        "total_members": len(member_ids),
-        "week_start": week_start.strftime("%Y-%m-%d"),
-        "week_end": week_end.strftime("%Y-%m-%d")
+        "leaderboard": [
+            leaderboard_entry(rank, member_id, minutes, stats, names[member_id])
+            for rank, member_id, minutes, stats in standings
+        ],
+        "total_members": leaderboard.member_count(db, group_id),
+        "week_start": leaderboard.week_start.strftime("%Y-%m-%d"),
+        "week_end": (leaderboard.week_end - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "my_rank": my_rank,
+        "me": leaderboard_entry(my_rank, user_id, my_minutes, my_stats, names[user_id])
     }
 
 # 6. Leave group
@@ -300,6 +263,7 @@ def leave_group(
     # Remove membership
     db.delete(membership)
     db.commit()
+    leaderboard.invalidate_group(group_id, user_id, "left")
 
     return {"message": "Successfully left the group"}
 
@@ -361,5 +325,6 @@ def delete_group(
     # Delete the group
     db.delete(group)
     db.commit()
+    leaderboard.invalidate_group(group_id)
 
     return {"message": "Group deleted successfully"}
\ No newline at end of file
@@ -1,15 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException  # import router, depends and HTTPException from FastAPT
 from sqlalchemy.orm import Session  # import session from SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from typing import List  # import List from tyuping
 from auth import get_current_user
 
 from database import get_db  # import function to create sessions
-from models import Habit, HabitLog  # import habit and habitlog models
+from models import Habit, HabitLog, HabitDayBitmap  # import habit, habitlog and bitmap models
 import schemas # import schemas
 from cache import cache_manager
+from compression import CompressedBody, CompressedBodyResponse
+from serialization import encode, json_response, habit_list_adapter, habit_log_list_adapter
+from leaderboard import leaderboard
+import streaks
+import localday
+from writebehind import write_behind
 
 router = APIRouter()
 
+def add_streaks(db: Session, habits: List[Habit]) -> None:
+    """Sets the streak fields of schemas.Habit on the rows (one bitmap query for all of them)"""
+    summaries = streaks.habit_summaries(db, habits)
+    for habit in habits:
+        for field, value in summaries[habit.id].items():
+            setattr(habit, field, value)
+
 @router.options("/habits")
 async def habits_options():
     """Handle OPTIONS requests for habits"""
@@ -22,13 +36,14 @@ def read_habits(
     db: Session = Depends(get_db)
 ):
     """Reads every habit"""
+    write_behind.wait_user(user_id)  # streak fields include the user's queued check-ins
     # Generate cache key
     cache_key = cache_manager.get_cache_key(user_id, "habits")
 
     # Check cache for data
     cached_habits = cache_manager.get(cache_key)
     if cached_habits:
-        return cached_habits
+        return CompressedBodyResponse(cached_habits)
 
     habits = db.query(Habit).filter(Habit.user_id == user_id).all()
 
@@ -38,11 +53,13 @@ def read_habits(
             habit.target_frequency = 7
         if habit.color is None:
             habit.color = "#10B981"
+    add_streaks(db, habits)
 
-    # Store result in cache (10 minutes)
-    cache_manager.set(cache_key, habits, expire_seconds=600)
+    # Store the encoded JSON (and its compressed variants, filled on demand) in cache (10 minutes)
+    body = CompressedBody(encode(habit_list_adapter, habits))
+    cache_manager.set(cache_key, body, expire_seconds=600)
 
-    return habits
+    return CompressedBodyResponse(body)
 
 # 2. create new habit
 @router.post("/habits", response_model=schemas.Habit) # use the POST method, repond with schemas.habit type
@@ -52,16 +69,6 @@ def create_habit(
     db: Session = Depends(get_db)
 ):
     """Creates new habit"""
-    # Check if habit with same name already exists for this user
-    existing_habit = db.query(Habit).filter(
-        Habit.user_id == user_id,
-        Habit.name == habit.name
-    ).first()
-    
-    if existing_habit:
-        # Return existing habit instead of creating duplicate
-        return existing_habit
-    
     db_habit = Habit( # creates a new habit object
         name=habit.name,
         user_id=user_id,  # connect user ID to the habit
@@ -70,8 +77,17 @@ def create_habit(
         color=habit.color
     )
     db.add(db_habit)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # a habit with the same name already exists for this user (unique user_id + name): return it instead
+        db.rollback()
+        return db.query(Habit).filter(
+            Habit.user_id == user_id,
+            Habit.name == habit.name
+        ).first()
     db.refresh(db_habit)
+    leaderboard.refresh_user(db, user_id)
 
     # Invalidate cache when data changes
     cache_key = cache_manager.get_cache_key(user_id, "habits")
@@ -90,12 +106,14 @@ def read_habit(
     db: Session = Depends(get_db)
 ):
     """Searches for a specific habit belonging to current user"""
+    write_behind.wait_user(user_id)
     habit = db.query(Habit).filter(
         Habit.id == habit_id, 
         Habit.user_id == user_id  # ensure user owns this habit
     ).first()
     if not habit:
         raise HTTPException(status_code=404, detail="Cannot find the habit or access denied")
+    add_streaks(db, [habit])
     return habit
 
 # 4. update a habit
@@ -117,7 +135,11 @@ def update_habit(
         habit.name = habit_update.name
     if habit_update.description is not None:
         habit.description = habit_update.description
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="A habit with this name already exists")
     db.refresh(habit)
 
     # Invalidate cache when data changes
@@ -134,6 +156,7 @@ def delete_habit(
     db: Session = Depends(get_db)
 ):
     """Deletes a habit and all related logs for current user only"""
+    write_behind.wait_user(user_id)  # queued check-ins of this habit are deleted too
     habit = db.query(Habit).filter(
         Habit.id == habit_id, 
         Habit.user_id == user_id  # ensure user owns this habit
@@ -148,11 +171,13 @@ def delete_habit(
     ).all()
     for log in habit_logs:
         db.delete(log)
+    db.query(HabitDayBitmap).filter(HabitDayBitmap.habit_id == habit_id).delete(synchronize_session=False)
     
     # Delete the habit itself
     habit_name = habit.name
     db.delete(habit)
     db.commit()
+    leaderboard.refresh_user(db, user_id)
     
     # Invalidate cache when data changes
     cache_key = cache_manager.get_cache_key(user_id, "habits")
@@ -177,17 +202,10 @@ def create_habit_log(
     ).first()
     if not habit:
         raise HTTPException(status_code=404, detail="Cannot find the habit or access denied")
-    
-    # Check if a log already exists for this habit on this date
-    existing_log = db.query(HabitLog).filter(
-        HabitLog.habit_id == habit_id,
-        HabitLog.user_id == user_id,
-        HabitLog.completed_date == log.completed_date
-    ).first()
-    
-    if existing_log:
-        # Return the existing log instead of creating a duplicate
-        return existing_log
+
+    if write_behind.enabled:
+        # acknowledged once durable in the local log, committed by the flusher a few ms later
+        return write_behind.submit(user_id, habit_id, log.completed_date)
     
     db_log = HabitLog(
         habit_id=habit_id,
@@ -195,12 +213,24 @@ def create_habit_log(
         user_id=user_id  # connect user ID to the habit log
     )
     db.add(db_log)
-    db.commit()
+    try:
+        db.flush()  # stamps local_day, the day the bit is set for (in the same transaction as the log)
+        streaks.set_day(db, habit_id, user_id, streaks.log_day(db_log), True)
+        db.commit()
+    except IntegrityError:
+        # a log already exists for this habit on this date (unique habit_id + completed_date): return it instead
+        db.rollback()
+        return db.query(HabitLog).filter(
+            HabitLog.habit_id == habit_id,
+            HabitLog.completed_date == localday.server_local(log.completed_date)  # the form it was stored in
+        ).first()
     db.refresh(db_log)
+    leaderboard.record_habit_log(user_id, habit_id, db_log.completed_date, streak=streaks.habit_streak(db, habit_id, user_id))
 
     # 데이터 변경 시 캐시 무효화 (dashboard summary도 함께 무효화)
     dashboard_cache_key = cache_manager.get_cache_key(user_id, "dashboard_summary")
     cache_manager.delete(dashboard_cache_key)
+    cache_manager.delete(cache_manager.get_cache_key(user_id, "habits"))  # streak fields
 
     return db_log
 
@@ -212,6 +242,7 @@ def read_habit_logs(
     db: Session = Depends(get_db)
 ):
     """Brings the sessions of a specific habit for current user only"""
+    write_behind.wait_user(user_id)
     # First check if habit belongs to current user
     habit = db.query(Habit).filter(
         Habit.id == habit_id, 
@@ -225,7 +256,7 @@ def read_habit_logs(
         HabitLog.habit_id == habit_id,
         HabitLog.user_id == user_id  # ensure logs belong to current user
     ).all()
-    return logs
+    return json_response(encode(habit_log_list_adapter, logs))
 
 # 8. get all habit logs
 @router.get("/habit-logs", response_model=List[schemas.HabitLog])
@@ -234,8 +265,9 @@ def read_all_habit_logs(
     db: Session = Depends(get_db)
 ):
     """Gets all habit logs for current user only"""
+    write_behind.wait_user(user_id)
     logs = db.query(HabitLog).filter(HabitLog.user_id == user_id).all()
-    return logs
+    return json_response(encode(habit_log_list_adapter, logs))
 
 # 9. delete a specific habit log
 @router.delete("/habit-logs/{log_id}")
@@ -245,6 +277,9 @@ def delete_habit_log(
     db: Session = Depends(get_db)
 ):
     """Deletes a specific habit log for current user only"""
+    if log_id < 0:
+        # provisional id of a write-behind check-in: delete the row it became
+        log_id = write_behind.resolve(log_id) or log_id
     log = db.query(HabitLog).filter(
         HabitLog.id == log_id,
         HabitLog.user_id == user_id  # ensure log belongs to current user
@@ -253,11 +288,14 @@ def delete_habit_log(
         raise HTTPException(status_code=404, detail="Cannot find the habit log or access denied")
     
     db.delete(log)
+    streaks.log_removed(db, log.habit_id, user_id, log.local_day)
     db.commit()
+    leaderboard.record_habit_log(user_id, log.habit_id, log.completed_date, count=-1, streak=streaks.habit_streak(db, log.habit_id, user_id))
 
     # Invalidate cache when data changes (dashboard summary)
     dashboard_cache_key = cache_manager.get_cache_key(user_id, "dashboard_summary")
     cache_manager.delete(dashboard_cache_key)
+    cache_manager.delete(cache_manager.get_cache_key(user_id, "habits"))  # streak fields
 
     return {"message": f"Habit log {log_id} has been deleted."}
 
@@ -268,6 +306,7 @@ def cleanup_orphaned_logs(
     db: Session = Depends(get_db)
 ):
     """Deletes habit logs for habits that no longer exist for current user only"""
+    write_behind.wait_user(user_id)
     # Find all habit logs where the habit_id doesn't exist in the habits table for current user
     orphaned_logs = db.query(HabitLog).filter(
         HabitLog.user_id == user_id,  # filter by current user
@@ -0,0 +1,274 @@
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import List, Optional, Tuple
+import jwt
+import orjson
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+# how long a response is kept for retries with the same Idempotency-Key
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "50000"))
+# "memory" (per process) or "database" (idempotency_keys table, shared by every worker)
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")
+# a database key still in progress after this long belongs to a worker that died: a retry runs the request again
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+IDEMPOTENT_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+# not kept: auth failures and rate limits say nothing about the request, server errors may succeed on retry
+UNSTORED_STATUS = {401, 403, 429}
+
+IN_PROGRESS = object()  # placeholder while the first request with a key is still running
+
+# (status, raw headers, body) of a finished request
+StoredResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+class IdempotencyConflict(Exception):
+    """The key can't be used for this request right now (sent back as status / detail)"""
+
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+
+def fingerprint(*parts) -> str:
+    """Hash of what makes two requests "the same" (method, path, body...)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def check_stored(request_hash: str, stored_hash: str, in_progress: bool) -> None:
+    if stored_hash != request_hash:
+        raise IdempotencyConflict(422, "Idempotency-Key was already used for a different request")
+    if in_progress:
+        raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+
+class IdempotencyStore:
+    """
+    In-memory (user, Idempotency-Key) -> (request fingerprint, stored response) for IDEMPOTENCY_TTL seconds
+    Every entry lives equally long, so insertion order is expiry order and expired entries are
+    dropped from the front; the oldest are also dropped beyond IDEMPOTENCY_MAX_ENTRIES
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self._lock = Lock()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()  # -> (expires_at, fingerprint, response)
+        self.replays = 0
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[0] > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def begin(self, user_id: str, key: str, request_hash: str) -> Optional[StoredResponse]:
+        """
+        Claim a key before running the request: None means go ahead (then finish or abort),
+        otherwise the stored response of the original request is returned
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                self._entries[(user_id, key)] = (now + self.ttl, request_hash, IN_PROGRESS)
+                return None
+            check_stored(request_hash, entry[1], entry[2] is IN_PROGRESS)
+            self.replays += 1
+            return entry[2]
+
+    def finish(self, user_id: str, key: str, request_hash: str, response: StoredResponse) -> None:
+        with self._lock:
+            self._entries[(user_id, key)] = (time.time() + self.ttl, request_hash, response)
+            self._entries.move_to_end((user_id, key))
+
+    def abort(self, user_id: str, key: str) -> None:
+        """The request failed: a retry with the same key runs it again"""
+        with self._lock:
+            self._entries.pop((user_id, key), None)
+
+class DatabaseIdempotencyStore:
+    """
+    The same in the idempotency_keys table, for several workers: the unique (user_id, key)
+    constraint decides which concurrent request runs; expired rows are purged now and then.
+    A running request holds its key for lock_seconds, after that a retry takes it over
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, lock_seconds: float = IDEMPOTENCY_LOCK_SECONDS):
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.replays = 0
+        self._next_purge = 0.0
+
+    def _purge(self, db) -> None:
+        from models import IdempotencyRecord
+        if time.time() >= self._next_purge:
+            self._next_purge = time.time() + 600
+            db.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at < datetime.now()).delete(synchronize_session=False)
+            db.commit()
+
+    def begin(self, user_id: str, key: str, request_hash: str) -> Optional[StoredResponse]:
+        from database import SessionLocal
+        from models import IdempotencyRecord
+        db = SessionLocal()
+        try:
+            self._purge(db)
+            now = datetime.now()
+            locked_until = now + timedelta(seconds=self.lock_seconds)
+            db.add(IdempotencyRecord(user_id=user_id, key=key, request_hash=request_hash, locked_until=locked_until,
+                                     expires_at=now + timedelta(seconds=self.ttl)))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+            record = db.query(IdempotencyRecord).filter(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key).first()
+            if record is None:  # aborted in the meantime
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+            if record.status is None and record.request_hash == request_hash and (record.locked_until is None or record.locked_until < now):
+                # the worker running it died: take the key over (only one retry wins the update)
+                taken = db.query(IdempotencyRecord).filter(
+                    IdempotencyRecord.id == record.id,
+                    IdempotencyRecord.status.is_(None),
+                    IdempotencyRecord.locked_until == record.locked_until
+                ).update({"locked_until": locked_until}, synchronize_session=False)
+                db.commit()
+                if taken:
+                    return None
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+            check_stored(request_hash, record.request_hash, record.status is None)
+            self.replays += 1
+            headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in orjson.loads(record.headers)]
+            return record.status, headers, record.body
+        finally:
+            db.close()
+
+    def finish(self, user_id: str, key: str, request_hash: str, response: StoredResponse) -> None:
+        from database import SessionLocal
+        from models import IdempotencyRecord
+        status, headers, body = response
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyRecord).filter(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key).update({
+                "status": status,
+                "headers": orjson.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers]).decode(),
+                "body": body
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def abort(self, user_id: str, key: str) -> None:
+        from database import SessionLocal
+        from models import IdempotencyRecord
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyRecord).filter(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+# idempotency store instance
+idempotency = DatabaseIdempotencyStore() if IDEMPOTENCY_STORE == "database" else IdempotencyStore()
+
+def request_user(headers: Headers) -> str:
+    """User a key belongs to: the token's subject, read like auth.verify_supabase_token does"""
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            return str(jwt.decode(authorization[7:], options={"verify_signature": False}).get("sub") or "")
+        except jwt.PyJWTError:
+            pass
+    return ""
+
+class IdempotencyMiddleware:
+    """
+    Idempotency-Key support for every write endpoint: the first request with a key runs and its
+    response is stored, retries with the same key and body get that response back without
+    running the endpoint again (marked with Idempotent-Replayed: true)
+    """
+
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or idempotency
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get("idempotency-key")
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await JSONResponse({"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}, status_code=400)(scope, receive, send)
+            return
+
+        # the body is part of the fingerprint, so read it first and hand it on afterwards
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        user_id = request_user(headers)
+        request_hash = fingerprint(scope["method"], scope["path"], scope.get("query_string", b""), body)
+
+        try:
+            stored = await run_in_threadpool(self.store.begin, user_id, key, request_hash)
+        except IdempotencyConflict as e:
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+            return
+        if stored is not None:
+            status, stored_headers, stored_body = stored
+            await send({"type": "http.response.start", "status": status,
+                        "headers": stored_headers + [(b"idempotent-replayed", b"true")]})
+            await send({"type": "http.response.body", "body": stored_body})
+            return
+
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        start = None
+        response_chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                response_chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+        except Exception:
+            await run_in_threadpool(self.store.abort, user_id, key)
+            raise
+        status = start["status"] if start is not None else 500
+        if status >= 500 or status in UNSTORED_STATUS:
+            await run_in_threadpool(self.store.abort, user_id, key)
+        else:
+            response = (status, list(start["headers"]), b"".join(response_chunks))
+            await run_in_threadpool(self.store.finish, user_id, key, request_hash, response)
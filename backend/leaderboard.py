@@ -0,0 +1,397 @@
+import os
+import time
+from datetime import datetime, timedelta
+from threading import RLock
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sortedcontainers import SortedList
+
+from models import GroupMembership, StudySession, Habit, HabitLog
+import streaks
+from localday import server_local
+
+try:
+    import redis
+except ImportError:  # the mirror is optional
+    redis = None
+
+# every worker process keeps its own boards and only sees its own writes, so boards are rebuilt
+# from SQL after this many seconds; with REDIS_URL the ranking itself is shared through sorted sets
+LEADERBOARD_MAX_AGE = float(os.getenv("LEADERBOARD_MAX_AGE", "60"))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_KEY_TTL = 8 * 24 * 3600  # a week's board outlives the week by a day
+
+def week_range(now: datetime = None) -> Tuple[datetime, datetime]:
+    """Monday 00:00 of the current week and the following Monday"""
+    now = now or datetime.now()
+    start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=7)
+
+class MemberStats:
+    """One user's totals for the current week (shared by every group the user is in)"""
+    __slots__ = ("minutes", "sessions", "targets", "completions", "streaks")
+
+    def __init__(self):
+        self.minutes = 0
+        self.sessions = 0
+        self.targets: Dict[int, int] = {}  # habit_id -> target_frequency
+        self.completions: Dict[int, int] = {}  # habit_id -> logs this week
+        self.streaks: Dict[int, int] = {}  # habit_id -> current streak in days
+
+    @property
+    def completed_habits(self) -> int:
+        return sum(1 for habit_id, target in self.targets.items() if self.completions.get(habit_id, 0) >= target)
+
+    @property
+    def best_streak(self) -> int:
+        return max((self.streaks.get(habit_id, 0) for habit_id in self.targets), default=0)
+
+class GroupBoard:
+    """
+    Members of one group kept sorted by (-minutes, user_id) in a SortedList, so moving a member
+    and looking up a rank are O(log n) even for the largest groups
+    """
+
+    def __init__(self, members: Set[str]):
+        self.members = members
+        self.order = SortedList()
+        self.built_at = time.time()
+
+    def insert(self, key: Tuple[int, str]) -> None:
+        self.order.add(key)
+
+    def remove(self, key: Tuple[int, str]) -> None:
+        self.order.discard(key)
+
+    def rank(self, key: Tuple[int, str]) -> int:
+        return self.order.bisect_left(key) + 1
+
+class LeaderboardService:
+    """
+    Weekly study leaderboards per group, kept up to date on writes instead of recomputed per view
+    Boards are built lazily with three aggregated queries and thrown away at week rollover
+    The queries run before the lock is taken, so a rebuild doesn't stall reads of other boards and writes
+    """
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self._lock = RLock()
+        self.week_start, self.week_end = week_range()
+        self.stats: Dict[str, MemberStats] = {}
+        self.boards: Dict[int, GroupBoard] = {}
+        self.user_groups: Dict[str, Set[int]] = {}  # only groups with a loaded board
+        # users and groups changed while a board was loading, so stale loaded rows aren't installed
+        self._version = 0
+        self._loading = 0
+        self._touched: Dict[object, int] = {}
+        # called with (group_ids, user_id, kind, amount) after a change, outside the lock (see live.py)
+        self.listeners: List[Callable[[Set[int], Optional[str], str, int], None]] = []
+        self.redis = None
+        if redis_url and redis is not None:
+            self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+
+    def _notify(self, group_ids: Set[int], user_id: Optional[str], kind: str, amount: int = 0) -> None:
+        for listener in self.listeners:
+            try:
+                listener(group_ids, user_id, kind, amount)
+            except Exception as e:
+                print(f"Leaderboard listener error: {e}")
+
+    @staticmethod
+    def _key(user_id: str, stats: MemberStats) -> Tuple[int, str]:
+        return (-stats.minutes, user_id)
+
+    def _redis_key(self, group_id: int) -> str:
+        return f"leaderboard:{group_id}:{self.week_start:%Y-%m-%d}"
+
+    def _roll_week(self) -> None:
+        week_start, week_end = week_range()
+        if week_start != self.week_start:
+            self.week_start, self.week_end = week_start, week_end
+            self.stats.clear()
+            self.boards.clear()
+            self.user_groups.clear()
+
+    def _load_stats(self, db: Session, user_ids: List[str]) -> Dict[str, MemberStats]:
+        """Week totals for many users with one aggregated query per table"""
+        loaded = {user_id: MemberStats() for user_id in user_ids}
+        if not user_ids:
+            return loaded
+        sessions = db.query(
+            StudySession.user_id,
+            func.coalesce(func.sum(StudySession.duration_minutes), 0),
+            func.count(StudySession.id)
+        ).filter(
+            StudySession.user_id.in_(user_ids),
+            StudySession.created_at >= self.week_start,
+            StudySession.created_at < self.week_end
+        ).group_by(StudySession.user_id)
+        for user_id, minutes, count in sessions:
+            loaded[user_id].minutes = int(minutes)
+            loaded[user_id].sessions = count
+        for habit_id, user_id, target in db.query(Habit.id, Habit.user_id, Habit.target_frequency).filter(Habit.user_id.in_(user_ids)):
+            loaded[user_id].targets[habit_id] = target if target is not None else 7
+        logs = db.query(Habit.user_id, HabitLog.habit_id, func.count(HabitLog.id)).join(
+            Habit, HabitLog.habit_id == Habit.id
+        ).filter(
+            Habit.user_id.in_(user_ids),
+            HabitLog.completed_date >= self.week_start,
+            HabitLog.completed_date < self.week_end
+        ).group_by(Habit.user_id, HabitLog.habit_id)
+        for user_id, habit_id, count in logs:
+            loaded[user_id].completions[habit_id] = count
+        for user_id, habit_streaks in streaks.current_streaks(db, user_ids).items():
+            loaded[user_id].streaks = habit_streaks
+        return loaded
+
+    def _set_stats(self, user_id: str, stats: MemberStats) -> None:
+        """Replace a user's stats and move them on every loaded board they are on"""
+        old = self.stats.get(user_id)
+        self.stats[user_id] = stats
+        if old is not None and old.minutes == stats.minutes:
+            return
+        for group_id in self.user_groups.get(user_id, ()):
+            board = self.boards[group_id]
+            if old is not None:
+                board.remove(self._key(user_id, old))
+            board.insert(self._key(user_id, stats))
+
+    def _touch(self, key) -> None:
+        """A user's stats or a group's members changed (called under the lock)"""
+        self._version += 1
+        if self._loading:
+            self._touched[key] = self._version
+
+    def _read_board(self, db: Session, group_id: int) -> Tuple[Set[str], Dict[str, MemberStats]]:
+        members = {row[0] for row in db.query(GroupMembership.user_id).filter(GroupMembership.group_id == group_id)}
+        return members, self._load_stats(db, list(members))
+
+    def _install(self, group_id: int, members: Set[str], loaded: Dict[str, MemberStats], started: int) -> GroupBoard:
+        """Put a board read from SQL in place; changes made while it was read win over its rows"""
+        stale = self._touched.get(("group", group_id), 0) > started
+        fresh = {}
+        for user_id, stats in loaded.items():
+            if self._touched.get(user_id, 0) > started:
+                current = self.stats.get(user_id)
+                if current is None:
+                    stale = True  # the change wasn't applied anywhere, the loaded row may predate it
+                else:
+                    stats = current  # the write hook already applied it
+            fresh[user_id] = stats
+        self._drop_board(group_id)
+        board = GroupBoard(members)
+        self.boards[group_id] = board
+        # members already loaded for another group are refreshed too (and re-sorted there)
+        for user_id, stats in fresh.items():
+            self._set_stats(user_id, stats)
+        for user_id in members:
+            self.user_groups.setdefault(user_id, set()).add(group_id)
+            board.insert(self._key(user_id, self.stats[user_id]))
+        if stale:
+            board.built_at = 0  # served once, rebuilt on the next read
+        if self.redis is not None:
+            self._mirror_board(group_id, board)
+        return board
+
+    def _prepare(self, db: Session, group_id: int) -> None:
+        """Rebuild a missing or outdated board, with the SQL read outside the lock (call without holding it)"""
+        with self._lock:
+            self._roll_week()
+            board = self.boards.get(group_id)
+            if board is not None and time.time() - board.built_at <= LEADERBOARD_MAX_AGE:
+                return
+            self._loading += 1
+            started, week_start = self._version, self.week_start
+        try:
+            members, loaded = self._read_board(db, group_id)
+        except Exception:
+            with self._lock:
+                self._loading -= 1
+            raise
+        with self._lock:
+            self._loading -= 1
+            self._roll_week()
+            if self.week_start == week_start:  # otherwise the next read loads the new week
+                self._install(group_id, members, loaded, started)
+            if not self._loading:
+                self._touched.clear()
+
+    def _drop_board(self, group_id: int) -> None:
+        board = self.boards.pop(group_id, None)
+        if board is None:
+            return
+        for user_id in board.members:
+            groups = self.user_groups.get(user_id)
+            if groups is not None:
+                groups.discard(group_id)
+                if not groups:
+                    del self.user_groups[user_id]
+                    self.stats.pop(user_id, None)
+
+    def _board(self, db: Session, group_id: int) -> GroupBoard:
+        """The group's board (under the lock, after _prepare); built here only if it was dropped in between"""
+        self._roll_week()
+        board = self.boards.get(group_id)
+        if board is None:
+            board = self._install(group_id, *self._read_board(db, group_id), self._version)
+        return board
+
+    def _mirror_board(self, group_id: int, board: GroupBoard) -> None:
+        key = self._redis_key(group_id)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(key)
+            if board.members:
+                pipe.zadd(key, {user_id: self.stats[user_id].minutes for user_id in board.members})
+            pipe.expire(key, REDIS_KEY_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Leaderboard mirror error: {e}")
+
+    def _mirror_increment(self, db: Session, user_id: str, minutes: int) -> None:
+        # other workers may have boards this process never loaded, so ask the database
+        group_ids = [row[0] for row in db.query(GroupMembership.group_id).filter(GroupMembership.user_id == user_id)]
+        try:
+            pipe = self.redis.pipeline()
+            for group_id in group_ids:
+                pipe.exists(self._redis_key(group_id))
+            existing = pipe.execute()
+            pipe = self.redis.pipeline()
+            for group_id, exists in zip(group_ids, existing):
+                if exists:  # missing boards are built from SQL on the next read
+                    pipe.zincrby(self._redis_key(group_id), minutes, user_id)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Leaderboard mirror error: {e}")
+
+    # ======== reads ===========
+    def standings(self, db: Session, group_id: int, limit: Optional[int] = None) -> List[Tuple[int, str, int, MemberStats]]:
+        """(rank, user_id, study minutes, stats) for the top `limit` members (all when None)"""
+        self._prepare(db, group_id)
+        with self._lock:
+            board = self._board(db, group_id)
+            if self.redis is not None:
+                try:
+                    end = -1 if limit is None else limit - 1
+                    ranked = self.redis.zrevrange(self._redis_key(group_id), 0, end, withscores=True)
+                    if not ranked and board.members:
+                        # dropped by a membership change in some worker: publish ours again
+                        self._mirror_board(group_id, board)
+                        ranked = self.redis.zrevrange(self._redis_key(group_id), 0, end, withscores=True)
+                    return [
+                        (rank, user_id, int(score), self.stats.get(user_id) or MemberStats())
+                        for rank, (user_id, score) in enumerate(ranked, 1)
+                    ]
+                except redis.RedisError as e:
+                    print(f"Leaderboard mirror error: {e}")
+            keys = board.order if limit is None else board.order[:limit]
+            return [(rank, user_id, -minutes, self.stats[user_id]) for rank, (minutes, user_id) in enumerate(keys, 1)]
+
+    def member_rank(self, db: Session, group_id: int, user_id: str) -> Optional[Tuple[int, int, MemberStats]]:
+        """(rank, study minutes, stats) of one member, None if not in the group"""
+        self._prepare(db, group_id)
+        with self._lock:
+            board = self._board(db, group_id)
+            if user_id not in board.members:
+                return None
+            stats = self.stats[user_id]
+            if self.redis is not None:
+                try:
+                    key = self._redis_key(group_id)
+                    rank, score = self.redis.zrevrank(key, user_id), self.redis.zscore(key, user_id)
+                    if rank is not None:
+                        return rank + 1, int(score or 0), stats
+                except redis.RedisError as e:
+                    print(f"Leaderboard mirror error: {e}")
+            return board.rank(self._key(user_id, stats)), stats.minutes, stats
+
+    def member_count(self, db: Session, group_id: int) -> int:
+        self._prepare(db, group_id)
+        with self._lock:
+            return len(self._board(db, group_id).members)
+
+    # ======== write hooks ===========
+    def record_study(self, db: Session, user_id: str, minutes: int, created_at: datetime, sessions: int = 1) -> None:
+        """A study session was added (or removed, with negative minutes/sessions)"""
+        with self._lock:
+            self._roll_week()
+            if not self.week_start <= server_local(created_at) < self.week_end:
+                return
+            self._touch(user_id)
+            stats = self.stats.get(user_id)
+            if stats is not None:
+                updated = MemberStats()
+                updated.minutes = stats.minutes + minutes
+                updated.sessions = stats.sessions + sessions
+                updated.targets, updated.completions, updated.streaks = stats.targets, stats.completions, stats.streaks
+                self._set_stats(user_id, updated)
+            group_ids = set(self.user_groups.get(user_id, ()))
+        if self.redis is not None and minutes:
+            self._mirror_increment(db, user_id, minutes)
+        if group_ids:
+            self._notify(group_ids, user_id, "study", minutes)
+
+    def record_habit_log(self, user_id: str, habit_id: int, completed_date: datetime, count: int = 1, streak: Optional[int] = None) -> None:
+        """A habit check-in was added (or removed, with count=-1); doesn't change the order"""
+        with self._lock:
+            self._roll_week()
+            self._touch(user_id)
+            stats = self.stats.get(user_id)
+            if stats is None:
+                return
+            in_week = self.week_start <= server_local(completed_date) < self.week_end
+            # a back-filled day outside this week can still join two streaks
+            if not in_week and (streak is None or stats.streaks.get(habit_id, 0) == streak):
+                return
+            if in_week:
+                stats.completions[habit_id] = max(0, stats.completions.get(habit_id, 0) + count)
+            if streak is not None:
+                stats.streaks[habit_id] = streak
+            group_ids = set(self.user_groups.get(user_id, ()))
+        self._notify(group_ids, user_id, "habit", count)
+
+    def refresh_user(self, db: Session, user_id: str) -> None:
+        """Habits were added or removed: reload one user's stats if any board shows them"""
+        with self._lock:
+            self._roll_week()
+            self._touch(user_id)
+            if user_id not in self.stats:
+                return
+            self._loading += 1
+            started, week_start = self._version, self.week_start
+        try:
+            loaded = self._load_stats(db, [user_id])[user_id]
+        except Exception:
+            with self._lock:
+                self._loading -= 1
+            raise
+        with self._lock:
+            self._loading -= 1
+            self._roll_week()
+            group_ids = set()
+            if self.week_start == week_start and user_id in self.stats:
+                self._set_stats(user_id, loaded)
+                group_ids = set(self.user_groups.get(user_id, ()))
+                if self._touched.get(user_id, 0) > started:
+                    # changed while it was read: the row may miss it, rebuild on the next read
+                    for group_id in group_ids:
+                        self.boards[group_id].built_at = 0
+            if not self._loading:
+                self._touched.clear()
+        if group_ids:
+            self._notify(group_ids, user_id, "habits")
+
+    def invalidate_group(self, group_id: int, user_id: Optional[str] = None, kind: str = "members") -> None:
+        """Membership changed ("joined" / "left" by user_id, "members" for the whole group): rebuild on the next read"""
+        with self._lock:
+            self._touch(("group", group_id))
+            self._drop_board(group_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._redis_key(group_id))
+            except redis.RedisError as e:
+                print(f"Leaderboard mirror error: {e}")
+        self._notify({group_id}, user_id, kind)
+
+# leaderboard instance
+leaderboard = LeaderboardService(REDIS_URL)
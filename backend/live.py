@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+import contextvars
+from typing import Dict, List, Optional, Set
+import orjson
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from auth import get_current_user_stream
+from leaderboard import leaderboard
+from groups import display_names, leaderboard_entry
+
+router = APIRouter()
+
+# at most one update per group per interval, however many writes happen in between
+LIVE_UPDATE_INTERVAL = float(os.getenv("LIVE_UPDATE_INTERVAL", "1.0"))
+# updates buffered per client; a client that falls further behind gets a fresh snapshot instead
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "16"))
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "15"))
+# full snapshot every so often: with several workers a stream only sees its own worker's writes
+LIVE_RESYNC = float(os.getenv("LIVE_RESYNC", "60"))
+
+RESYNC = object()  # queue marker: send a snapshot next
+
+def sse(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+class Subscriber:
+    """One connected client"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.needs_snapshot = True
+
+class GroupHub:
+    """
+    In-process fan-out of leaderboard changes to the streams of each group
+    Leaderboard writes happen in threadpool threads and are handed to the event loop with
+    call_soon_threadsafe; changes are collected per group and flushed once per interval
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: Dict[int, Set[Subscriber]] = {}
+        self.pending: Dict[int, Dict[str, Dict[str, int]]] = {}  # group -> user -> {"study_minutes", "habit_logs"}
+        self.scheduled: Set[int] = set()
+        self.last_flush: Dict[int, float] = {}
+        self.dropped = 0  # updates discarded for slow clients
+
+    def subscribe(self, group_id: int) -> Subscriber:
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber()
+        self.subscribers.setdefault(group_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, group_id: int, subscriber: Subscriber) -> None:
+        subscribers = self.subscribers.get(group_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[group_id]
+
+    def on_change(self, group_ids: Set[int], user_id: Optional[str], kind: str, amount: int) -> None:
+        """Leaderboard listener, may be called from any thread"""
+        watched = [group_id for group_id in group_ids if group_id in self.subscribers]
+        if not watched or self.loop is None:
+            return
+        # a fresh context, so the flush isn't attributed to the request that wrote
+        self.loop.call_soon_threadsafe(self._collect, watched, user_id, kind, amount, context=contextvars.Context())
+
+    def _collect(self, group_ids: List[int], user_id: Optional[str], kind: str, amount: int) -> None:
+        for group_id in group_ids:
+            if kind in ("members", "joined", "left"):
+                self.resync(group_id)
+                continue
+            change = self.pending.setdefault(group_id, {}).setdefault(user_id, {"study_minutes": 0, "habit_logs": 0})
+            if kind == "study":
+                change["study_minutes"] += amount
+            elif kind == "habit":
+                change["habit_logs"] += amount
+            if group_id not in self.scheduled:
+                self.scheduled.add(group_id)
+                delay = max(0.0, self.last_flush.get(group_id, 0.0) + LIVE_UPDATE_INTERVAL - time.monotonic())
+                self.loop.call_later(delay, lambda g=group_id: asyncio.ensure_future(self._flush(g)))
+
+    async def _flush(self, group_id: int) -> None:
+        self.scheduled.discard(group_id)
+        self.last_flush[group_id] = time.monotonic()
+        changes = self.pending.pop(group_id, {})
+        if not changes or group_id not in self.subscribers:
+            return
+        try:
+            entries = await run_in_threadpool(member_entries, group_id, list(changes))
+        except Exception as e:
+            print(f"Live update failed for group {group_id}: {e}")
+            return
+        activity = [{"user_id": user_id, **change} for user_id, change in changes.items()]
+        message = sse("update", {"group_id": group_id, "week_start": leaderboard.week_start.strftime("%Y-%m-%d"),
+                                 "entries": entries, "activity": activity})
+        for subscriber in list(self.subscribers.get(group_id, ())):
+            self._deliver(subscriber, message)
+
+    def _deliver(self, subscriber: Subscriber, message) -> None:
+        try:
+            subscriber.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # slow client: drop its backlog, it catches up with one snapshot
+            self.dropped += subscriber.queue.qsize()
+            self._reset(subscriber)
+
+    def _reset(self, subscriber: Subscriber) -> None:
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.needs_snapshot = True
+        subscriber.queue.put_nowait(RESYNC)
+
+    def resync(self, group_id: int) -> None:
+        """Every client of the group gets a full snapshot (membership changed)"""
+        for subscriber in list(self.subscribers.get(group_id, ())):
+            self._reset(subscriber)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "groups": len(self.subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self.subscribers.values()),
+            "dropped": self.dropped
+        }
+
+# hub instance
+hub = GroupHub()
+leaderboard.listeners.append(hub.on_change)
+
+def member_entries(group_id: int, user_ids: List[str]) -> List[dict]:
+    """Compact rank/score rows for the members that changed (no names, the snapshot has them)"""
+    db = SessionLocal()
+    try:
+        entries = []
+        for user_id in user_ids:
+            ranked = leaderboard.member_rank(db, group_id, user_id)
+            if ranked:
+                rank, minutes, stats = ranked
+                entry = leaderboard_entry(rank, user_id, minutes, stats, None)
+                del entry["username"], entry["user_email"]
+                entries.append(entry)
+        return entries
+    finally:
+        db.close()
+
+def snapshot(group_id: int, user_id: str) -> Optional[dict]:
+    """Full leaderboard for a (re)connecting client, None if the user is no longer a member"""
+    db = SessionLocal()
+    try:
+        me = leaderboard.member_rank(db, group_id, user_id)
+        if not me:
+            return None
+        standings = leaderboard.standings(db, group_id)
+        names = display_names([member_id for _, member_id, _, _ in standings], db)
+        return {
+            "group_id": group_id,
+            "week_start": leaderboard.week_start.strftime("%Y-%m-%d"),
+            "my_rank": me[0],
+            "leaderboard": [
+                leaderboard_entry(rank, member_id, minutes, stats, names[member_id])
+                for rank, member_id, minutes, stats in standings
+            ]
+        }
+    finally:
+        db.close()
+
+@router.get("/groups/{group_id}/stream")
+async def stream_group(group_id: int, user_id: str = Depends(get_current_user_stream)):
+    """
+    Server-Sent Events for a group's weekly leaderboard: a `snapshot` on connect (and after
+    membership changes or when the client fell behind), then `update` events with the changed
+    members' rank/score rows and their coalesced activity
+    """
+    # subscribe before taking the snapshot so no change falls in between
+    subscriber = hub.subscribe(group_id)
+    subscriber.needs_snapshot = False
+    first = await run_in_threadpool(snapshot, group_id, user_id)
+    if first is None:
+        hub.unsubscribe(group_id, subscriber)
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    async def events():
+        try:
+            yield b"retry: 5000\n\n" + sse("snapshot", first)
+            resync_at = time.monotonic() + LIVE_RESYNC
+            while True:
+                if subscriber.needs_snapshot or time.monotonic() >= resync_at:
+                    subscriber.needs_snapshot = False
+                    resync_at = time.monotonic() + LIVE_RESYNC
+                    data = await run_in_threadpool(snapshot, group_id, user_id)
+                    if data is None:
+                        yield sse("closed", {"reason": "not a member"})
+                        return
+                    yield sse("snapshot", data)
+                try:
+                    timeout = min(LIVE_HEARTBEAT, max(0.0, resync_at - time.monotonic()))
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"  # keeps proxies from closing an idle stream
+                    continue
+                if message is not RESYNC:
+                    yield message
+        finally:
+            hub.unsubscribe(group_id, subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,342 @@
+"""
+Concurrent load test with mixed read/write traffic
+
+    python loadtest.py --scenario morning_checkin --users 200 --duration 60 --workers 4
+    python loadtest.py --scenario leaderboard_spike --dataset medium
+    python loadtest.py --url http://staging:8000 --database-url postgresql://... --scenario mixed
+
+Starts uvicorn with several worker processes on a generated dataset (see generate_data.py /
+benchmark.py) and replays a traffic mix with asyncio + httpx as signed test users. Unlike
+benchmark.py this exercises contention: cache locking, SQLite write locks and pool exhaustion.
+Reports throughput, error rate and p50/p95/p99 per time interval and per action.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from benchmark import DATASETS, ensure_dataset, percentile
+
+# (share of --duration, share of --users active, think time seconds, {action: weight})
+SCENARIOS = {
+    # everyone opens the app and ticks off habits within a few minutes
+    "morning_checkin": [
+        (0.2, 0.25, 2.0, {"list_habits": 3, "checkin": 2, "dashboard_summary": 1}),
+        (0.6, 1.0, 0.5, {"list_habits": 3, "checkin": 5, "dashboard_summary": 2, "list_habit_logs": 1}),
+        (0.2, 0.25, 2.0, {"list_habits": 3, "checkin": 1, "dashboard_summary": 1}),
+    ],
+    # open dashboards refreshing on a timer, reads only
+    "dashboard_polling": [
+        (1.0, 1.0, 2.0, {"dashboard_summary": 4, "dashboard_weekly": 2, "activity_heatmap": 1}),
+    ],
+    # a group challenge ends and every member refreshes the same leaderboard
+    "leaderboard_spike": [
+        (0.3, 0.3, 2.0, {"dashboard_summary": 2, "list_groups": 1, "leaderboard": 1}),
+        (0.4, 1.0, 0.2, {"leaderboard": 8, "list_groups": 1, "create_session": 1}),
+        (0.3, 0.3, 2.0, {"dashboard_summary": 2, "list_groups": 1, "leaderboard": 1}),
+    ],
+    "mixed": [
+        (1.0, 1.0, 1.0, {"dashboard_summary": 4, "dashboard_weekly": 1, "list_habits": 3, "checkin": 2,
+                         "list_study_sessions": 1, "create_session": 1, "leaderboard": 2, "analytics": 1}),
+    ],
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay concurrent traffic mixes against a local uvicorn server")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--users", type=int, default=100, help="concurrent virtual users at the peak")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--interval", type=float, default=5, help="report interval in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dataset", choices=sorted(DATASETS), default="small", help="generated dataset to run against")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", default=None, help="target an already running server instead of starting one")
+    parser.add_argument("--database-url", default=None, help="database behind --url (used to pick test users)")
+    parser.add_argument("--secret", default=os.getenv("SUPABASE_JWT_SECRET", "loadtest-secret"), help="HS256 secret for the test JWTs")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout in seconds")
+    parser.add_argument("--output", default=None, help="write the full report as JSON")
+    return parser.parse_args(argv)
+
+def load_users(count: int, seed: int) -> list:
+    """Pick test users (weighted towards active ones) with their habits, subjects and groups"""
+    from sqlalchemy import func
+    from database import SessionLocal
+    from models import Habit, Subject, StudySession, GroupMembership
+
+    db = SessionLocal()
+    try:
+        # the most active users first, like real morning traffic
+        ranked = db.query(StudySession.user_id).group_by(StudySession.user_id) \
+            .order_by(func.count(StudySession.id).desc()).limit(count).all()
+        user_ids = [row[0] for row in ranked]
+        habits, subjects, groups = {}, {}, {}
+        for user_id, habit_id in db.query(Habit.user_id, Habit.id).filter(Habit.user_id.in_(user_ids)):
+            habits.setdefault(user_id, []).append(habit_id)
+        for user_id, subject_id in db.query(Subject.user_id, Subject.id).filter(Subject.user_id.in_(user_ids)):
+            subjects.setdefault(user_id, []).append(subject_id)
+        for user_id, group_id in db.query(GroupMembership.user_id, GroupMembership.group_id).filter(GroupMembership.user_id.in_(user_ids)):
+            groups.setdefault(user_id, []).append(group_id)
+    finally:
+        db.close()
+
+    rng = random.Random(seed)
+    rng.shuffle(user_ids)
+    return [
+        {"id": user_id, "habits": habits.get(user_id, []), "subjects": subjects.get(user_id, []), "groups": sorted(groups.get(user_id, []))}
+        for user_id in user_ids
+    ]
+
+def make_token(user_id: str, secret: str) -> str:
+    """Signed Supabase-style access token"""
+    import jwt
+    now = datetime.now(timezone.utc)
+    return jwt.encode(
+        {"sub": user_id, "aud": "authenticated", "role": "authenticated", "iat": now, "exp": now + timedelta(hours=2)},
+        secret, algorithm="HS256"
+    )
+
+def build_request(action: str, user: dict, rng: random.Random):
+    """(method, path, json body) for one action, None if the user has nothing to act on"""
+    if action == "dashboard_summary":
+        return "GET", "/dashboard/summary", None
+    if action == "dashboard_weekly":
+        return "GET", "/dashboard/weekly", None
+    if action == "activity_heatmap":
+        return "GET", "/api/activity-heatmap", None
+    if action == "analytics":
+        return "GET", f"/analytics/study-stats?period={rng.choice(['week', 'month', 'year'])}", None
+    if action == "list_habits":
+        return "GET", "/habits", None
+    if action == "list_habit_logs":
+        return "GET", "/habit-logs", None
+    if action == "list_study_sessions":
+        return "GET", "/study-sessions", None
+    if action == "list_groups":
+        return "GET", "/groups", None
+    if action == "leaderboard" and user["groups"]:
+        # the lowest id is the largest generated group, so spikes concentrate on it
+        group_id = user["groups"][0] if rng.random() < 0.8 else rng.choice(user["groups"])
+        return "GET", f"/groups/{group_id}/leaderboard", None
+    if action == "checkin" and user["habits"]:
+        completed = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")  # same format as the frontend
+        return "POST", f"/habits/{rng.choice(user['habits'])}/logs", {"completed_date": completed}
+    if action == "create_session" and user["subjects"]:
+        return "POST", "/study-sessions", {"subject_id": rng.choice(user["subjects"]), "duration_minutes": rng.randint(15, 120)}
+    return None
+
+class Recorder:
+    """Collects (offset, action, latency, outcome) samples and summarizes them"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.samples = []
+        self.buckets = []  # samples per interval, filled as they are recorded
+        self.rows = []  # summaries of the closed intervals
+        self.reported = 0
+
+    def record(self, action: str, latency: float, outcome: str) -> None:
+        sample = (time.perf_counter() - self.start, action, latency, outcome)
+        self.samples.append(sample)
+        index = int(sample[0] // self.interval)
+        while len(self.buckets) <= index:
+            self.buckets.append([])
+        self.buckets[index].append(sample)
+
+    @staticmethod
+    def summarize(samples, seconds: float) -> dict:
+        latencies = [s[2] * 1000 for s in samples]
+        errors = {}
+        for s in samples:
+            if s[3] != "ok":
+                errors[s[3]] = errors.get(s[3], 0) + 1
+        return {
+            "requests": len(samples),
+            "rps": round(len(samples) / seconds, 1) if seconds > 0 else 0.0,
+            "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95), 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+        }
+
+    def interval_rows(self, upto: float) -> list:
+        """Summaries of every complete interval before `upto` seconds, each summarized once when it closes"""
+        for index in range(len(self.rows), int(upto // self.interval)):
+            window = self.buckets[index] if index < len(self.buckets) else []
+            self.rows.append({"t": round((index + 1) * self.interval, 1), **self.summarize(window, self.interval)})
+        return self.rows[:int(upto // self.interval)]
+
+    def print_new_intervals(self, upto: float, active_users: int) -> None:
+        rows = self.interval_rows(upto)
+        for row in rows[self.reported:]:
+            p = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+            print(f"{row['t']:>7.1f}s{active_users:>7}{row['requests']:>9}{row['rps']:>9.1f}{row['error_rate'] * 100:>8.2f}%{p(row['p50_ms'])}{p(row['p95_ms'])}{p(row['p99_ms'])}")
+        self.reported = len(rows)
+
+async def virtual_user(client, user: dict, token: str, phases: list, state: dict, recorder: Recorder, rng: random.Random, slot: int):
+    """Closed-loop user: act, think, repeat while its slot is active in the current phase"""
+    headers = {"Authorization": f"Bearer {token}"}
+    # stagger start so users don't fire in lockstep
+    await asyncio.sleep(rng.random() * 0.5)
+    while not state["done"]:
+        _, active, think, mix = phases[state["phase"]]
+        if slot >= active:
+            await asyncio.sleep(0.1)
+            continue
+        action = rng.choices(list(mix), list(mix.values()))[0]
+        request = build_request(action, user, rng)
+        if request is not None:
+            method, path, body = request
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, headers=headers, json=body)
+                outcome = "ok" if response.status_code < 400 else str(response.status_code)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                outcome = type(e).__name__
+            recorder.record(action, time.perf_counter() - start, outcome)
+        # exponential think time around the phase mean
+        await asyncio.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+
+async def run_load(args, base_url: str, users: list) -> dict:
+    """Drive the scenario phases and return the report"""
+    scenario = SCENARIOS[args.scenario]
+    # (virtual user slots active, think, mix) per phase, and when each phase ends
+    phases = []
+    boundaries = []
+    elapsed = 0.0
+    for share, active_share, think, mix in scenario:
+        elapsed += share * args.duration
+        boundaries.append(elapsed)
+        phases.append((share, max(1, int(args.users * active_share)), think, mix))
+
+    state = {"phase": 0, "done": False}
+    recorder = Recorder(args.interval)
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    rng = random.Random(args.seed)
+
+    print(f"\n{'time':>8}{'users':>7}{'reqs':>9}{'rps':>9}{'errors':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        tasks = [
+            asyncio.create_task(virtual_user(client, users[slot % len(users)], make_token(users[slot % len(users)]["id"], args.secret),
+                                             phases, state, recorder, random.Random(rng.random()), slot))
+            for slot in range(args.users)
+        ]
+        recorder.start = time.perf_counter()
+        while True:
+            now = time.perf_counter() - recorder.start
+            if now >= args.duration:
+                break
+            while state["phase"] < len(phases) - 1 and now >= boundaries[state["phase"]]:
+                state["phase"] += 1
+            recorder.print_new_intervals(now, phases[state["phase"]][1])
+            await asyncio.sleep(min(0.25, args.interval / 4))
+        state["done"] = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+    recorder.print_new_intervals(args.duration, phases[state["phase"]][1])
+
+    samples = [s for s in recorder.samples if s[0] <= args.duration]
+    by_action = {}
+    for action in sorted({s[1] for s in samples}):
+        by_action[action] = recorder.summarize([s for s in samples if s[1] == action], args.duration)
+    return {
+        "scenario": args.scenario,
+        "users": args.users,
+        "duration": args.duration,
+        "workers": args.workers if not args.url else None,
+        "total": recorder.summarize(samples, args.duration),
+        "actions": by_action,
+        "intervals": recorder.interval_rows(args.duration),
+    }
+
+def start_server(args, database_url: str):
+    """uvicorn with --workers in a subprocess, returns once /health answers"""
+    env = {**os.environ, "DATABASE_URL": database_url, "SUPABASE_JWT_SECRET": args.secret}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        env=env, start_new_session=True
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.3)
+    stop_server(server)
+    raise RuntimeError("uvicorn did not become ready within 60s")
+
+def stop_server(server) -> None:
+    # workers share the session, so signal the whole process group
+    try:
+        os.killpg(server.pid, signal.SIGINT)
+        server.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(server.pid, signal.SIGKILL)
+
+def print_report(report: dict) -> None:
+    total = report["total"]
+    print(f"\n{report['scenario']}: {total['requests']} requests, {total['rps']} req/s, "
+          f"{total['error_rate'] * 100:.2f}% errors, p50 {total['p50_ms']}ms / p95 {total['p95_ms']}ms / p99 {total['p99_ms']}ms")
+    if total["errors"]:
+        print("errors: " + ", ".join(f"{name} x{count}" for name, count in sorted(total["errors"].items())))
+    print(f"\n{'action':<22}{'reqs':>8}{'rps':>8}{'err%':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for action, row in report["actions"].items():
+        print(f"{action:<22}{row['requests']:>8}{row['rps']:>8.1f}{row['error_rate'] * 100:>8.2f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    if args.url:
+        database_url = args.database_url or os.getenv("DATABASE_URL")
+        if not database_url:
+            sys.exit("--database-url (or DATABASE_URL) is required with --url to pick test users")
+    else:
+        # check-ins and sessions are written during the run, so work on a copy of the dataset
+        workdir = tempfile.mkdtemp(prefix="loadtest-")
+        copy = os.path.join(workdir, "loadtest.db")
+        shutil.copyfile(ensure_dataset(args.dataset, args.seed), copy)
+        database_url = f"sqlite:///{copy}"
+    # database.py reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = database_url
+
+    users = load_users(args.users, args.seed)
+    if not users:
+        sys.exit("No users with study sessions found in the database")
+    print(f"{len(users)} test users, scenario {args.scenario}, {args.duration:.0f}s")
+
+    server = None
+    if not args.url:
+        print(f"Starting uvicorn with {args.workers} workers on port {args.port}")
+        server = start_server(args, database_url)
+    try:
+        report = asyncio.run(run_load(args, args.url or f"http://127.0.0.1:{args.port}", users))
+    finally:
+        if server is not None:
+            stop_server(server)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,143 @@
+import time
+from datetime import date, datetime
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import bindparam, event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import Profile, StudySession, HabitLog
+
+# ======== local days ===========
+# Study sessions and habit logs store the day they count for in their owner's timezone
+# (Profile.timezone, server-local when unset) as local_day = days since 1970-01-01. It is
+# computed when a row is written, so day/week/month aggregations are plain integer ranges on
+# the (user_id, local_day) indexes instead of per-row date()/AT TIME ZONE expressions.
+# Timestamps are stored naive in server-local time (the datetime.now defaults): aware values are
+# converted before they are stored (server_local), so the day stamped on write and the day a
+# restamp computes from the stored value agree.
+
+EPOCH = date(1970, 1, 1)
+# attribute each model's local_day is derived from
+DAY_SOURCES = {StudySession: "created_at", HabitLog: "completed_date"}
+ZONE_CACHE_SECONDS = 300  # other workers pick up a changed timezone after this at the latest
+
+def day_number(day: date) -> int:
+    return (day - EPOCH).days
+
+def day_date(number: int) -> date:
+    return date.fromordinal(EPOCH.toordinal() + number)
+
+def weekday(number: int) -> int:
+    """0 = Sunday ... 6 = Saturday, like strftime('%w') (1970-01-01 was a Thursday)"""
+    return (number + 4) % 7
+
+def parse_zone(name: Optional[str]) -> Optional[ZoneInfo]:
+    """ZoneInfo for an IANA name (None/empty = server-local), ValueError for unknown names"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+def server_local(value: datetime) -> datetime:
+    """Naive server-local time of a timestamp, the form the DateTime columns store"""
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+def local_day(value: datetime, zone: Optional[ZoneInfo]) -> int:
+    """Day number of a timestamp in the given timezone"""
+    if zone is None:
+        return day_number(value.astimezone().date() if value.tzinfo else value.date())
+    # astimezone() reads a naive value as server-local time
+    return day_number(value.astimezone(zone).date())
+
+class ZoneCache:
+    """user_id -> timezone of the profile, read once per user and expired after a few minutes"""
+
+    def __init__(self):
+        self._zones: Dict[str, Tuple[Optional[ZoneInfo], float]] = {}
+        self._lock = Lock()
+
+    def load(self, session: Session, user_ids: Iterable[str]) -> Dict[str, Optional[ZoneInfo]]:
+        now = time.time()
+        zones, missing = {}, set()
+        with self._lock:
+            for user_id in set(user_ids):
+                cached = self._zones.get(user_id)
+                if cached and cached[1] > now:
+                    zones[user_id] = cached[0]
+                else:
+                    missing.add(user_id)
+        if missing:
+            names = dict(session.execute(select(Profile.id, Profile.timezone).where(Profile.id.in_(missing))).all())
+            with self._lock:
+                for user_id in missing:
+                    try:
+                        zone = parse_zone(names.get(user_id))
+                    except ValueError:
+                        zone = None  # set outside the API, counted as server-local
+                    zones[user_id] = zone
+                    self._zones[user_id] = (zone, now + ZONE_CACHE_SECONDS)
+        return zones
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._zones.pop(user_id, None)
+
+zone_cache = ZoneCache()
+
+def user_zone(db: Session, user_id: str) -> Optional[ZoneInfo]:
+    return zone_cache.load(db, [user_id])[user_id]
+
+def today(db: Session, user_id: str) -> int:
+    """The user's current day number"""
+    return local_day(datetime.now().astimezone(), user_zone(db, user_id))
+
+def todays(db: Session, user_ids: Iterable[str]) -> Dict[str, int]:
+    """Current day number of many users (one profile query for those not cached)"""
+    now = datetime.now().astimezone()
+    return {user_id: local_day(now, zone) for user_id, zone in zone_cache.load(db, user_ids).items()}
+
+# ======== write time ===========
+@event.listens_for(Session, "before_flush")
+def stamp_local_days(session: Session, flush_context, instances) -> None:
+    """Set local_day on new study sessions / habit logs and on those whose timestamp or owner changed"""
+    stale = []
+    for obj in session.new:
+        if type(obj) in DAY_SOURCES:
+            if DAY_SOURCES[type(obj)] == "created_at" and obj.created_at is None:
+                obj.created_at = datetime.now()  # the column default, applied now to know the day
+            stale.append(obj)
+    for obj in session.dirty:
+        if type(obj) in DAY_SOURCES:
+            attrs = inspect(obj).attrs
+            if attrs[DAY_SOURCES[type(obj)]].history.has_changes() or attrs["user_id"].history.has_changes():
+                stale.append(obj)
+    if not stale:
+        return
+    zones = zone_cache.load(session, [obj.user_id for obj in stale if obj.user_id is not None])
+    for obj in stale:
+        value = getattr(obj, DAY_SOURCES[type(obj)])
+        if value is not None and value.tzinfo:
+            value = server_local(value)
+            setattr(obj, DAY_SOURCES[type(obj)], value)
+        obj.local_day = None if value is None else local_day(value, zones.get(obj.user_id))
+
+def restamp(db: Session, user_id: str, zone: Optional[ZoneInfo]) -> int:
+    """Recompute local_day of all the user's rows for a new timezone (in the caller's transaction), returns rows changed"""
+    changed = 0
+    for model, attribute in DAY_SOURCES.items():
+        column = getattr(model, attribute)
+        updates = []
+        for row_id, value, day in db.execute(select(model.id, column, model.local_day).where(model.user_id == user_id, column.isnot(None))):
+            new_day = local_day(value, zone)
+            if new_day != day:
+                updates.append({"row_id": row_id, "day": new_day})
+        if updates:
+            # one executemany per table, rows are not loaded as objects
+            table = model.__table__
+            db.connection().execute(update(table).where(table.c.id == bindparam("row_id")).values(local_day=bindparam("day")), updates)
+            changed += len(updates)
+    zone_cache.forget(user_id)
+    return changed
@@ -1,9 +1,12 @@
-from fastapi import FastAPI, Depends, HTTPException # brings the main class FastAPI
+from fastapi import FastAPI, Depends, HTTPException, Query # brings the main class FastAPI
 from fastapi.middleware.cors import CORSMiddleware # tool that gives the web access to this api
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from sqlalchemy.orm import Session
-from typing import List # list type
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional # list type
+from datetime import date, datetime, timedelta
+import asyncio
+import numpy as np
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import func, extract
 from models import Subject, StudySession, Habit, HabitLog, Goal, Profile
 from auth import get_current_user  # autshentication function
@@ -12,7 +15,7 @@ import schemas  # for goal schemas
 import os
 
 # import from database.py, main.py, schemas.py
-from database import get_db, create_tables, engine
+from database import get_db, create_tables, engine, SessionLocal
 from models import Subject, StudySession, Habit, HabitLog
 import schemas
 
@@ -20,33 +23,45 @@ from habit import router as habit_router
 
 from study import router as study_router
 
-# Database type detection for date formatting functions
-def get_date_format_func():
-    """Get appropriate date formatting function based on database type"""
-    db_type = engine.url.drivername
-    if 'postgresql' in db_type:
-        def pg_date_format(column, format_str):
-            # Convert SQLite strftime format to PostgreSQL to_char format
-            pg_format = format_str.replace('%Y', 'YYYY').replace('%m', 'MM').replace('%d', 'DD')
-            if '%w' in format_str:
-                # PostgreSQL uses 'ID' for day of week (0=Sunday, 6=Saturday)
-                pg_format = pg_format.replace('%w', 'ID')
-            return func.to_char(column, pg_format)
-        return pg_date_format
-    else:  # SQLite and others
-        return func.strftime
+from serialization import DefaultResponse, json_response, heatmap_adapter
+from columnar import wants_columnar, daily_columns, record_columns
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, router as metrics_router
+from timing import ServerTimingMiddleware, phase
+from profiler import ProfilerMiddleware, router as profiler_router
+from live import router as live_router
+from presence import router as presence_router, sweeper as presence_sweeper
+from sync import router as sync_router
+from batch import router as batch_router
+from search import router as search_router
+from calendar_view import router as calendar_router
+from analytics import router as analytics_router, SERIES_MAX_DAYS
+from stats import stats_executor, correlation_statistics
+from forecast import router as forecast_router
+from idempotency import IdempotencyMiddleware
+from writebehind import WRITE_BEHIND, write_behind
+from cache import cache_manager
+import localday
+from localday import day_date
+import streaks
+from leaderboard import leaderboard
 
 #main object of the web api server
 app = FastAPI(
     title = "StudyFlow API",
     description = "API that tracks and analyzes study habits and lifestyle routines",
-    version = "1.0.0"
+    version = "1.0.0",
+    default_response_class = DefaultResponse # orjson based encoding for dict responses
 ) 
 
 # HTTPS redirect removed - Render.com already provides HTTPS
 # if os.getenv("ENVIRONMENT") == "production":
 #     app.add_middleware(HTTPSRedirectMiddleware)
 
+# Idempotency-Key replay for POST/PUT/PATCH/DELETE, added first so it runs innermost: stored
+# responses are uncompressed and get CORS headers and compression like fresh ones
+app.add_middleware(IdempotencyMiddleware)
+
 app.add_middleware(
     CORSMiddleware, # CORS => web browser security protocol
     allow_origins=[
@@ -62,6 +77,19 @@ app.add_middleware(
     allow_headers = ["*"], # allows every header
 )
 
+# gzip / brotli compression for large responses (small ones and precompressed cache hits pass through)
+app.add_middleware(CompressionMiddleware)
+
+# on-demand sampling profiler (admin token in X-Debug-Profile or PROFILE_SAMPLE_RATE)
+app.add_middleware(ProfilerMiddleware)
+
+# Server-Timing breakdown (SERVER_TIMING=1 or admin token in X-Debug-Timing), added before
+# MetricsMiddleware so it runs inside it and can read the per-request query stats
+app.add_middleware(ServerTimingMiddleware)
+
+# per-route request / latency / DB metrics, exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+
 # CORS preflight is handled automatically by CORSMiddleware
 # @app.options("/{path:path}")
 # async def handle_options(path: str):
@@ -85,6 +113,10 @@ def create_profile(
 
     # Use provided ID or authenticated user ID
     profile_id = profile.id if profile.id else user_id
+    try:
+        localday.parse_zone(profile.timezone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Create new profile
     db_profile = Profile(
@@ -92,13 +124,15 @@ def create_profile(
         user_id=profile_id,  # Also set user_id for consistency
         email=profile.email,
         full_name=profile.full_name,
-        avatar_url=profile.avatar_url
+        avatar_url=profile.avatar_url,
+        timezone=profile.timezone or None
     )
 
     try:
         db.add(db_profile)
         db.commit()
         db.refresh(db_profile)
+        localday.zone_cache.forget(profile_id)  # rows written before the profile used server-local days
         return db_profile
     except Exception as e:
         db.rollback()
@@ -150,8 +184,24 @@ def update_my_profile(
     profile.avatar_url = profile_update.avatar_url
     profile.updated_at = datetime.now()
 
+    # timezone is only changed when sent; existing rows move to the days of the new timezone
+    timezone_changed = "timezone" in profile_update.model_fields_set and (profile_update.timezone or None) != profile.timezone
+    if timezone_changed:
+        try:
+            zone = localday.parse_zone(profile_update.timezone)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        profile.timezone = profile_update.timezone or None
+        localday.restamp(db, user_id, zone)
+        # streak bitmaps are keyed by local day too; rebuilt from the restamped logs (and committed)
+        streaks.rebuild(db, [row[0] for row in db.query(Habit.id).filter(Habit.user_id == user_id)])
+
     db.commit()
     db.refresh(profile)
+    if timezone_changed:
+        localday.zone_cache.forget(user_id)
+        cache_manager.clear_user_cache(user_id)  # every cached day bucket of the user
+        leaderboard.refresh_user(db, user_id)
     return profile
 
 from dashboard import router as dashboard_router
@@ -164,10 +214,40 @@ app.include_router(study_router)
 from groups import router as groups_router
 app.include_router(groups_router)
 
+app.include_router(metrics_router)
+
+app.include_router(profiler_router)
+
+app.include_router(live_router)
+
+app.include_router(presence_router)
+
+app.include_router(sync_router)
+
+app.include_router(batch_router)
+
+app.include_router(search_router)
+
+app.include_router(calendar_router)
+
+app.include_router(analytics_router)
+
+app.include_router(forecast_router)
+
 # creates the table when the server starts
 @app.on_event("startup")
 def startup_event():
     create_tables()
+    if WRITE_BEHIND:
+        write_behind.start()  # replays check-ins left in the log by a crash
+    presence_sweeper.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    presence_sweeper.stop()  # saves the running timers up to their last heartbeat
+    if write_behind.enabled:
+        write_behind.stop()  # commits the check-ins still queued
+    stats_executor.shutdown(wait=False)
 
 @app.get("/") # if the root directory(backend) receives get request,
 def read_root(): # execute this function
@@ -385,6 +465,7 @@ def update_study_session(
             raise HTTPException(status_code = 404, detail = "Cannot find the subject or access denied")
         session.subject_id = session_update.subject_id
 
+        old_minutes = session.duration_minutes
         if session_update.duration_minutes is not None: # update the study time
             session.duration_minutes = session_update.duration_minutes
 
@@ -393,6 +474,8 @@ def update_study_session(
 
         db.commit() # save the updated details
         db.refresh(session) # refresh the session
+        if session.duration_minutes != old_minutes: # move the user on their group boards by the difference
+            leaderboard.record_study(db, user_id, session.duration_minutes - old_minutes, session.created_at, sessions=0)
         return session # return the session
     
 # 5. delete study session
@@ -441,31 +524,33 @@ def get_subject_study_sessions(
 @app.get("/analytics/study-stats")
 def get_study_statistics(
     period: str = "week", 
+    format: str = "object",  # "object" (default) or "columnar"
     user_id: str = Depends(get_current_user),  # auth dependency
     db: Session = Depends(get_db)
 ):
     """Returns weekly/monthly study statistics"""
     try:
-        now = datetime.now()
-        
-        # Determine start_date based on period
+        # days in the user's timezone (local_day, see localday.py)
+        today = localday.today(db, user_id)
+
+        # Determine start_day based on period
         if period == "month":
-            start_date = now - timedelta(days = 30)
+            start_day = today - 30
         else:  # default to week
-            start_date = now - timedelta(days = 7)
-        
-        date_func = get_date_format_func()
+            start_day = today - 7
 
         # daily study time for current user only
         daily_stats = db.query(
-            date_func(StudySession.created_at, '%Y-%m-%d').label('date'),
+            StudySession.local_day.label('day'),
             func.sum(StudySession.duration_minutes).label('total_minutes'),
             func.count(StudySession.id).label('session_count')
         ).filter(
-            StudySession.created_at >= start_date,
-            StudySession.user_id == user_id  # add user filtering
+            StudySession.user_id == user_id,  # add user filtering
+            StudySession.local_day >= start_day
         ).group_by(
-            date_func(StudySession.created_at, '%Y-%m-%d')
+            StudySession.local_day
+        ).order_by(
+            StudySession.local_day
         ).all()
 
         # stats per subject for current user only
@@ -475,32 +560,44 @@ def get_study_statistics(
             func.sum(StudySession.duration_minutes).label('total_minutes'),
             func.count(StudySession.id).label('session_count')
         ).join(StudySession).filter(
-            StudySession.created_at >= start_date,
             StudySession.user_id == user_id,  # add user filtering
+            StudySession.local_day >= start_day,
             Subject.user_id == user_id  # add user filtering
         ).group_by(
             Subject.id, Subject.name, Subject.color
         ).all()
 
+        daily_rows = [
+            {
+                "date": day_date(stat.day).isoformat(),
+                "total_minutes": stat.total_minutes or 0,
+                "session_count": stat.session_count or 0
+            }
+            for stat in daily_stats
+        ]
+        subject_rows = [
+            {
+                "subject": stat.name,
+                "color": stat.color,
+                "total_minutes": stat.total_minutes or 0,
+                "session_count": stat.session_count or 0
+            }
+            for stat in subject_stats
+        ]
+
+        if wants_columnar(format):
+            # dense per-day arrays from the window start to today
+            return {
+                "period": period,
+                "format": "columnar",
+                "daily_stats": daily_columns(day_date(start_day), today - start_day + 1, daily_rows, ["total_minutes", "session_count"]),
+                "subject_stats": record_columns(subject_rows, ["subject", "color", "total_minutes", "session_count"])
+            }
+
         return {
             "period": period,
-            "daily_stats": [
-                {
-                    "date": str(stat.date),
-                    "total_minutes": stat.total_minutes or 0,
-                    "session_count": stat.session_count or 0
-                }
-                for stat in daily_stats
-            ],
-            "subject_stats": [
-                {
-                    "subject": stat.name,
-                    "color": stat.color,
-                    "total_minutes": stat.total_minutes or 0,
-                    "session_count": stat.session_count or 0
-                }
-                for stat in subject_stats
-            ]
+            "daily_stats": daily_rows,
+            "subject_stats": subject_rows
         }
 
     except Exception as e:
@@ -513,22 +610,21 @@ def get_dashboard_summary(
     db: Session = Depends(get_db)
 ):
     """Returns current user's dashboard summary data"""
+    write_behind.wait_user(user_id)
     try:
-        from datetime import datetime, timedelta
+        # today in the user's timezone
+        today = localday.today(db, user_id)
 
-        today = datetime.now().date()
-        date_func = get_date_format_func()
-
-        # calculates today's study time of the day (PostgreSQL compatible)
+        # calculates today's study time of the day
         study_today = db.query(StudySession).filter(
             StudySession.user_id == user_id,
-            date_func(StudySession.created_at, '%Y-%m-%d') == today.strftime('%Y-%m-%d')
+            StudySession.local_day == today
         ).with_entities(func.sum(StudySession.duration_minutes)).scalar() or 0
 
-        # habit achieved today (PostgreSQL compatible)
+        # habit achieved today
         habits_done = db.query(HabitLog).filter(
             HabitLog.user_id == user_id,
-            date_func(HabitLog.completed_date, '%Y-%m-%d') == today.strftime('%Y-%m-%d')
+            HabitLog.local_day == today
         ).count()
         
         # total number of habits
@@ -547,41 +643,48 @@ def get_dashboard_summary(
 @app.get("/analytics/habit-completion")
 def get_habit_completion_stats(
     period: str = "week", 
+    format: str = "object",  # "object" (default) or "columnar"
     user_id: str = Depends(get_current_user),  # add JWT authentication
     db: Session = Depends(get_db)
 ):
     """Analyse the habit completion data"""
+    write_behind.wait_user(user_id)
     try:
-        now = datetime.now()
+        # days in the user's timezone (local_day, see localday.py)
+        today = localday.today(db, user_id)
 
         if period == "week":
-            start_date = now - timedelta(days = 7)
+            start_day = today - 7
         else:
-            start_date = now - timedelta(days = 30)
+            start_day = today - 30
 
         # daily habit completion data for current user only
         total_habits = db.query(func.count(Habit.id)).filter(Habit.user_id == user_id).scalar()
-        date_func = get_date_format_func()
 
         daily_completion = db.query(
-            date_func(HabitLog.completed_date, '%Y-%m-%d').label('date'),
+            HabitLog.local_day.label('day'),
             func.count(func.distinct(HabitLog.habit_id)).label('completed_habits')
         ).join(Habit, HabitLog.habit_id == Habit.id).filter(
+            HabitLog.user_id == user_id,
             Habit.user_id == user_id,  # filter by user_id
-            HabitLog.completed_date >= start_date
+            HabitLog.local_day >= start_day
         ).group_by(
-            date_func(HabitLog.completed_date, '%Y-%m-%d')
+            HabitLog.local_day
+        ).order_by(
+            HabitLog.local_day
         ).all()
 
-        # completion rate by day of the week for current user only
+        # completion rate by day of the week for current user only (0 = Sunday, see localday.weekday)
+        weekday = (HabitLog.local_day + 4) % 7
         weekday_completion = db.query(
-            date_func(HabitLog.completed_date, '%w').label('weekday'),
+            weekday.label('weekday'),
             func.count(func.distinct(HabitLog.habit_id)).label('completion_count')
         ).join(Habit, HabitLog.habit_id == Habit.id).filter(
+            HabitLog.user_id == user_id,
             Habit.user_id == user_id,  # filter by user_id
-            HabitLog.completed_date >= start_date
+            HabitLog.local_day >= start_day
         ).group_by(
-            date_func(HabitLog.completed_date, '%w')
+            weekday
         ).all()
 
         # completion rate by habit for current user only
@@ -589,16 +692,39 @@ def get_habit_completion_stats(
             Habit.name,
             func.count(HabitLog.id).label('completion_count')
         ).join(HabitLog).filter(
+            HabitLog.user_id == user_id,
             Habit.user_id == user_id,  # filter by user_id
-            HabitLog.completed_date >= start_date
+            HabitLog.local_day >= start_day
         ).group_by(Habit.id, Habit.name).all()
 
+        if wants_columnar(format):
+            # completion_rate is derivable from completed_habits / total_habits, so it is not repeated
+            weekday_counts = [0] * 7
+            for stat in weekday_completion:
+                weekday_counts[int(stat.weekday)] = stat.completion_count
+            return {
+                "period": period,
+                "format": "columnar",
+                "total_habits": total_habits,
+                "daily_completion": daily_columns(
+                    day_date(start_day),
+                    today - start_day + 1,
+                    [{"date": day_date(stat.day).isoformat(), "completed_habits": stat.completed_habits} for stat in daily_completion],
+                    ["completed_habits"]
+                ),
+                "weekday_completion": weekday_counts,  # index 0 = Sunday
+                "habit_stats": record_columns(
+                    [{"habit_name": stat.name, "completion_count": stat.completion_count} for stat in habit_stats],
+                    ["habit_name", "completion_count"]
+                )
+            }
+
         return {
             "period": period,
             "total_habits": total_habits,
             "daily_completion": [
                 {
-                    "date": str(stat.date),
+                    "date": day_date(stat.day).isoformat(),
                     "completed_habits": stat.completed_habits,
                     "completion_rate": (stat.completed_habits / total_habits * 100) if total_habits > 0 else 0
                 }
@@ -635,66 +761,110 @@ def get_habit_completion_stats(
         print(traceback.format_exc())
         raise HTTPException(status_code = 500, detail = str(e))
     
-@app.get("/analytics/correlation")
-def get_study_habit_correlation(
-    user_id: str = Depends(get_current_user),  # add JWT authentication
-    db: Session = Depends(get_db)
-):
-    """Correlation analysis between study time and habit completion rate"""
+def load_correlation_days(user_id: str, start: Optional[date], end: Optional[date]):
+    """
+    Dense day-indexed arrays of the range (the user's local days): study minutes per day and one
+    0/1 completion row per habit. Runs in the threadpool with its own session
+    """
+    write_behind.wait_user(user_id)  # blocks, which is why it waits here and not in the endpoint
+    db = SessionLocal()
     try:
-        # data for the past 30 days
-        start_date = datetime.now() - timedelta(days = 30)
-        date_func = get_date_format_func()
-
-        # Daily study time and number of habits completed
-        correlation_data = db.query(
-            date_func(StudySession.created_at, '%Y-%m-%d').label('date'),
-            func.sum(StudySession.duration_minutes).label('study_minutes')
+        end_day = localday.day_number(end) if end else localday.today(db, user_id)
+        start_day = localday.day_number(start) if start else end_day - 30  # default: the past 30 days
+        days = end_day - start_day + 1
+        if days < 1:
+            raise HTTPException(status_code=400, detail="`to` must not be before `from`")
+        if days > SERIES_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"At most {SERIES_MAX_DAYS} days per request")
+
+        study = np.zeros(days, dtype=np.int64)
+        for day, minutes in db.query(
+            StudySession.local_day,
+            func.sum(StudySession.duration_minutes)
         ).filter(
             StudySession.user_id == user_id,  # filter by user_id
-            StudySession.created_at >= start_date
-        ).group_by(
-            date_func(StudySession.created_at, '%Y-%m-%d')
-        ).subquery()
-
-        habit_data = db.query(
-            date_func(HabitLog.completed_date, '%Y-%m-%d').label('date'),
-            func.count(func.distinct(HabitLog.habit_id)).label('habit_count')
+            StudySession.local_day >= start_day,
+            StudySession.local_day <= end_day
+        ).group_by(StudySession.local_day):
+            study[day - start_day] = minutes or 0
+
+        # days each habit was checked in (several logs on one day count once)
+        habit_days: Dict[int, List[int]] = {}
+        names: Dict[int, str] = {}
+        for day, habit_id, name in db.query(
+            HabitLog.local_day, Habit.id, Habit.name
         ).join(Habit, HabitLog.habit_id == Habit.id).filter(
+            HabitLog.user_id == user_id,
             Habit.user_id == user_id,  # filter by user_id
-            HabitLog.completed_date >= start_date
-        ).group_by(
-            date_func(HabitLog.completed_date, '%Y-%m-%d')
-        ).subquery()
-
-        # combined data
-        combined_data = db.query(
-            correlation_data.c.date,
-            correlation_data.c.study_minutes,
-            habit_data.c.habit_count
-        ).outerjoin(
-            habit_data, correlation_data.c.date == habit_data.c.date
-        ).all()
-        
-        return {
-            "correlation_data": [
-                {
-                    "date": str(data.date),
-                    "study_minutes": data.study_minutes or 0,
-                    "habit_count": data.habit_count or 0
-                }
-                for data in combined_data
-            ]
-        }
-        
+            HabitLog.local_day >= start_day,
+            HabitLog.local_day <= end_day
+        ).distinct():
+            habit_days.setdefault(habit_id, []).append(day - start_day)
+            names[habit_id] = name
+        habit_ids = sorted(habit_days)
+        habits = np.zeros((len(habit_ids), days), dtype=np.int8)
+        for row, habit_id in enumerate(habit_ids):
+            habits[row, habit_days[habit_id]] = 1
+        return start_day, study, habits, habit_ids, names
+    finally:
+        db.close()
+
+@app.get("/analytics/correlation")
+async def get_study_habit_correlation(
+    format: str = "object",  # "object" (default) or "columnar"
+    start: Optional[date] = Query(None, alias="from", description="first day (YYYY-MM-DD), default 30 days before `to`"),
+    end: Optional[date] = Query(None, alias="to", description="last day, inclusive, default today"),
+    user_id: str = Depends(get_current_user),  # add JWT authentication
+):
+    """
+    Correlation analysis between study time and habit completion: daily pairs plus Pearson and
+    Spearman coefficients, rolling 7/30-day means, lagged (habits today, study on later days)
+    and per-habit coefficients over every day of the range (days without activity count as 0)
+    """
+    try:
+        start_day, study, habits, habit_ids, names = await run_in_threadpool(load_correlation_days, user_id, start, end)
+        statistics = await asyncio.get_running_loop().run_in_executor(
+            stats_executor, correlation_statistics, study, habits, habit_ids
+        )
+        for entry in statistics["per_habit"]:
+            entry["habit_name"] = names[entry["habit_id"]]
+        habit_count = habits.sum(axis=0)
+        first = day_date(start_day)
+
+        if wants_columnar(format):
+            return {
+                "format": "columnar",
+                "correlation_data": {"start": first.isoformat(), "days": len(study),
+                                     "study_minutes": study.tolist(), "habit_count": habit_count.tolist()},
+                "statistics": statistics
+            }
+
+        # days with study or habit activity (the rolling arrays cover every day from `start`)
+        active = np.flatnonzero((study > 0) | (habit_count > 0))
+        rows = [
+            {
+                "date": day_date(start_day + int(index)).isoformat(),
+                "study_minutes": int(study[index]),
+                "habit_count": int(habit_count[index])
+            }
+            for index in active
+        ]
+        return {"start": first.isoformat(), "correlation_data": rows, "statistics": statistics}
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/goals/", response_model=schemas.Goal)
-def create_goal(goal: schemas.GoalCreate, db: Session = Depends(get_db)):
-    """Create a new goal"""
+def create_goal(
+    goal: schemas.GoalCreate,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a new goal for the current user"""
     db_goal = Goal(
-        user_id="1",
+        user_id=user_id,
         goal_type=goal.goal_type,
         target_value=goal.target_value,
         target_unit=goal.target_unit,
@@ -708,15 +878,20 @@ def create_goal(goal: schemas.GoalCreate, db: Session = Depends(get_db)):
     return db_goal
 
 @app.get("/goals/", response_model=List[schemas.Goal])
-def get_goals(db: Session = Depends(get_db)):
-    """Check every active goals"""
-    goals = db.query(Goal).filter(Goal.is_active == 1).all()
+def get_goals(user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Check every active goal of the current user"""
+    goals = db.query(Goal).filter(Goal.user_id == user_id, Goal.is_active == 1).all()
     return goals
 
 @app.put("/goals/{goal_id}", response_model=schemas.Goal)
-def update_goal(goal_id: int, goal_update: schemas.GoalUpdate, db: Session = Depends(get_db)):
+def update_goal(
+    goal_id: int,
+    goal_update: schemas.GoalUpdate,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """Update existing goals"""
-    goal = db.query(Goal).filter(Goal.id == goal_id).first()
+    goal = db.query(Goal).filter(Goal.id == goal_id, Goal.user_id == user_id).first()
     if goal is None:
         raise HTTPException(status_code=404, detail="Cannot find the goal")
     
@@ -729,9 +904,9 @@ def update_goal(goal_id: int, goal_update: schemas.GoalUpdate, db: Session = Dep
     return goal
 
 @app.delete("/goals/{goal_id}")
-def delete_goal(goal_id: int, db: Session = Depends(get_db)):
+def delete_goal(goal_id: int, user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
     """Deactivates the goal (is_active = 0)"""
-    goal = db.query(Goal).filter(Goal.id == goal_id).first()
+    goal = db.query(Goal).filter(Goal.id == goal_id, Goal.user_id == user_id).first()
     if goal is None:
         raise HTTPException(status_code=404, detail="Cannot find the goal")
     
@@ -740,24 +915,23 @@ def delete_goal(goal_id: int, db: Session = Depends(get_db)):
     return {"message": "The goal has successfully been deactivated"}
 
 @app.get("/goals/{goal_id}/progress")
-def get_goal_progress(goal_id: int, db: Session = Depends(get_db)):
+def get_goal_progress(goal_id: int, user_id: str = Depends(get_current_user), db: Session = Depends(get_db)):
     """Calculates the achievement rate of a specific goal and returns it"""
-    goal = db.query(Goal).filter(Goal.id == goal_id, Goal.is_active == 1).first()
+    goal = db.query(Goal).filter(Goal.id == goal_id, Goal.user_id == user_id, Goal.is_active == 1).first()
     if not goal:
         raise HTTPException(status_code=404, detail="Goal not found")
+    write_behind.wait_user(user_id)
 
-    # date calculation
-    from datetime import datetime, timedelta
-    now = datetime.now()
+    # first day of the period, in the goal owner's timezone
+    today = localday.today(db, goal.user_id)
     if goal.period == "daily":
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start_day = today
     elif goal.period == "weekly":
-        start_date = now - timedelta(days=now.weekday())
-        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        start_day = today - day_date(today).weekday()
     elif goal.period == "monthly":
-        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        start_day = today - day_date(today).day + 1
     else:
-        start_date = now
+        start_day = today + 1  # unknown period: nothing counted
 
     # calculates the achievement rate
     actual_value = 0
@@ -766,7 +940,8 @@ def get_goal_progress(goal_id: int, db: Session = Depends(get_db)):
         actual_value = db.query(
             StudySession
         ).filter(
-            StudySession.created_at >= start_date
+            StudySession.user_id == user_id,
+            StudySession.local_day >= start_day
         ).with_entities(
             func.sum(StudySession.duration_minutes)
         ).scalar() or 0
@@ -775,7 +950,8 @@ def get_goal_progress(goal_id: int, db: Session = Depends(get_db)):
         actual_value = db.query(
             HabitLog
         ).filter(
-            HabitLog.completed_date >= start_date
+            HabitLog.user_id == user_id,
+            HabitLog.local_day >= start_day
         ).count()
 
     # success rate calculation
@@ -795,6 +971,7 @@ def get_goal_progress(goal_id: int, db: Session = Depends(get_db)):
 def get_activity_heatmap(
     year: int = datetime.now().year,
     activity_type: str = "all",  # "all", "study", "habit"
+    format: str = "object",  # "object" (default) or "columnar"
     user_id: str = Depends(get_current_user),  # auth dependency
     db: Session = Depends(get_db)
 ):
@@ -808,21 +985,29 @@ def get_activity_heatmap(
     # Generate all dates for the year
     start_date = date(year, 1, 1)
     end_date = date(year, 12, 31)
-    date_func = get_date_format_func()
+    # the year's days in the user's timezone (local_day, see localday.py)
+    start_day, end_day = localday.day_number(start_date), localday.day_number(end_date)
+    write_behind.wait_user(user_id)
     
-    # Get study sessions for the year (current user only)
-    study_sessions = db.query(StudySession).filter(
-        date_func(StudySession.created_at, '%Y-%m-%d') >= start_date.strftime('%Y-%m-%d'),
-        date_func(StudySession.created_at, '%Y-%m-%d') <= end_date.strftime('%Y-%m-%d'),
-        StudySession.user_id == user_id  # add user filtering
-    ).all()
+    # Study minutes per day of the year (current user only)
+    study_by_day = dict(db.query(
+        StudySession.local_day,
+        func.sum(StudySession.duration_minutes)
+    ).filter(
+        StudySession.user_id == user_id,  # add user filtering
+        StudySession.local_day >= start_day,
+        StudySession.local_day <= end_day
+    ).group_by(StudySession.local_day).all())
     
-    # Get habit logs for the year (current user only)
-    habit_logs = db.query(HabitLog).filter(
-        date_func(HabitLog.completed_date, '%Y-%m-%d') >= start_date.strftime('%Y-%m-%d'),
-        date_func(HabitLog.completed_date, '%Y-%m-%d') <= end_date.strftime('%Y-%m-%d'),
-        HabitLog.user_id == user_id  # add user filtering
-    ).all()
+    # Habit logs per day of the year (current user only)
+    habits_by_day = dict(db.query(
+        HabitLog.local_day,
+        func.count(HabitLog.id)
+    ).filter(
+        HabitLog.user_id == user_id,  # add user filtering
+        HabitLog.local_day >= start_day,
+        HabitLog.local_day <= end_day
+    ).group_by(HabitLog.local_day).all())
     
     # Get all habits to calculate completion rates (current user only)
     all_habits = db.query(Habit).filter(Habit.user_id == user_id).all()  # add user filtering
@@ -836,16 +1021,10 @@ def get_activity_heatmap(
         date_str = current_date.strftime("%Y-%m-%d")
         
         # Calculate daily study time
-        daily_study = sum(
-            session.duration_minutes for session in study_sessions
-            if session.created_at.date() == current_date
-        )
+        daily_study = study_by_day.get(localday.day_number(current_date)) or 0
         
         # Calculate daily habit completion
-        daily_habits_completed = len([
-            log for log in habit_logs
-            if log.completed_date.date() == current_date
-        ])
+        daily_habits_completed = habits_by_day.get(localday.day_number(current_date), 0)
         
         # Calculate completion rate
         habit_completion_rate = (
@@ -900,8 +1079,29 @@ def get_activity_heatmap(
         "activity_type": activity_type
     }
     
-    return schemas.HeatmapResponse(
+    if wants_columnar(format):
+        # parallel arrays indexed by day of year; total_habits is the same for every day so it is hoisted,
+        # and date / habit_completion_rate are derivable from start + index and completed_habits / total_habits
+        days = list(daily_data.values())
+        return DefaultResponse({
+            "year": year,
+            "format": "columnar",
+            "start": start_date.isoformat(),
+            "days": len(days),
+            "total_habits": total_habits_count,
+            "value": [day.value for day in days],
+            "level": [day.level for day in days],
+            "study_time": [day.study_time for day in days],
+            "completed_habits": [day.completed_habits for day in days],
+            "summary": summary
+        })
+
+    heatmap = schemas.HeatmapResponse(
         year=year,
         data=list(daily_data.values()),
         summary=summary
     )
+    # already validated above, so dump the model directly instead of re-encoding through response_model
+    with phase("serialize"):
+        body = heatmap_adapter.dump_json(heatmap)
+    return json_response(body)
@@ -0,0 +1,193 @@
+import time
+from typing import Dict, List, Sequence, Tuple
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.routing import Match
+
+from database import QueryStats, query_stats
+from cache import cache_manager
+from live import hub
+from idempotency import idempotency
+from writebehind import write_behind
+
+router = APIRouter()
+
+# Metrics are kept per process (every uvicorn worker exposes its own numbers)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Render a label set as {a="x",b="y"}"""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """Cumulative bucket histogram with labels"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.values.items():
+            for index, bound in enumerate(self.buckets):
+                labels = format_labels(self.labels + ("le",), label_values + (repr(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {series[index]}")
+            labels = format_labels(self.labels + ("le",), label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            base = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{base} {series[-2]}")
+            lines.append(f"{self.name}_count{base} {series[-1]}")
+        return lines
+
+REQUESTS = Counter("http_requests_total", "HTTP requests handled", ["method", "route", "status"])
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled", ["method", "route"])
+DB_QUERIES = Histogram("db_queries_per_request", "SQL statements executed per request", ["route"], QUERY_COUNT_BUCKETS)
+DB_TIME = Histogram("db_query_seconds_per_request", "Time spent executing SQL per request", ["route"])
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds_per_request", "Time spent waiting for pooled connections per request", ["route"], WAIT_BUCKETS)
+
+METRICS = [REQUESTS, REQUEST_LATENCY, IN_FLIGHT, DB_QUERIES, DB_TIME, POOL_WAIT]
+
+def route_template(app, scope) -> str:
+    """Route path template ("/habits/{habit_id}") so label cardinality stays bounded"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", scope["path"])
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Records request counts, latency, in-flight requests and per-request DB work"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope["app"], scope)
+        stats = QueryStats(route)
+        token = query_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc(method, route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec(method, route)
+            query_stats.reset(token)
+            REQUESTS.inc(method, route, str(status_code))
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method, route)
+            DB_QUERIES.observe(stats.query_count, route)
+            DB_TIME.observe(stats.query_seconds, route)
+            POOL_WAIT.observe(stats.pool_wait_seconds, route)
+            stats.report()
+
+def render_cache_metrics() -> List[str]:
+    """CacheManager counters, read at scrape time"""
+    stats = cache_manager.stats()
+    lines = []
+    for name in ("hits", "misses", "evictions"):
+        lines += [f"# HELP cache_{name}_total In-memory cache {name}", f"# TYPE cache_{name}_total counter", f"cache_{name}_total {stats[name]}"]
+    lines += ["# HELP cache_entries In-memory cache entries", "# TYPE cache_entries gauge", f"cache_entries {stats['entries']}"]
+    return lines
+
+def render_live_metrics() -> List[str]:
+    """Leaderboard stream hub, read at scrape time"""
+    stats = hub.stats()
+    return [
+        "# HELP live_stream_subscribers Connected leaderboard streams", "# TYPE live_stream_subscribers gauge",
+        f"live_stream_subscribers {stats['subscribers']}",
+        "# HELP live_stream_dropped_total Updates discarded for slow stream clients", "# TYPE live_stream_dropped_total counter",
+        f"live_stream_dropped_total {stats['dropped']}"
+    ]
+
+def render_idempotency_metrics() -> List[str]:
+    return [
+        "# HELP idempotent_replays_total Retried writes answered from the Idempotency-Key store", "# TYPE idempotent_replays_total counter",
+        f"idempotent_replays_total {idempotency.replays}"
+    ]
+
+def render_write_behind_metrics() -> List[str]:
+    stats = write_behind.stats()
+    return [
+        "# HELP write_behind_pending Check-ins in the log not yet committed", "# TYPE write_behind_pending gauge",
+        f"write_behind_pending {stats['pending']}",
+        "# HELP write_behind_flushed_total Check-ins committed by the flusher", "# TYPE write_behind_flushed_total counter",
+        f"write_behind_flushed_total {stats['flushed']}",
+        "# HELP write_behind_flushes_total Flusher transactions", "# TYPE write_behind_flushes_total counter",
+        f"write_behind_flushes_total {stats['flushes']}"
+    ]
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += render_cache_metrics()
+    lines += render_live_metrics()
+    lines += render_idempotency_metrics()
+    lines += render_write_behind_metrics()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
@@ -0,0 +1,28 @@
+import os
+import sys
+
+def migrate_habit_bitmaps():
+    """Create the habit_day_bitmaps table and fill it from the existing habit logs (SQLite and PostgreSQL)"""
+    from database import engine, SessionLocal
+    from models import HabitDayBitmap
+    import streaks
+
+    db = SessionLocal()
+    try:
+        HabitDayBitmap.__table__.create(bind=engine, checkfirst=True)
+        print("habit_day_bitmaps table is ready")
+        # rebuilding is idempotent, so this also repairs bitmaps that drifted from the logs
+        rows = streaks.rebuild(db)
+        print(f"{rows} habit day bitmaps have been written")
+        print("habit bitmap migration complete")
+    except Exception as e:
+        db.rollback()
+        print(f"habit bitmap migration error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_habit_bitmaps()
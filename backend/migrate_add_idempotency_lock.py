@@ -0,0 +1,27 @@
+import os
+import sys
+
+def migrate_idempotency_lock():
+    """Add idempotency_keys.locked_until, so keys of requests that died while running can be taken over"""
+    from sqlalchemy import inspect, text
+    from database import engine
+
+    try:
+        inspector = inspect(engine)
+        if not inspector.has_table("idempotency_keys"):
+            print("idempotency_keys table doesn't exist yet, create_tables() adds it with the column")
+            return
+        existing = {column["name"] for column in inspector.get_columns("idempotency_keys")}
+        if "locked_until" not in existing:
+            with engine.begin() as connection:
+                connection.execute(text("ALTER TABLE idempotency_keys ADD COLUMN locked_until TIMESTAMP"))
+            print("idempotency_keys.locked_until column has been added")
+        print("idempotency lock migration complete")
+    except Exception as e:
+        print(f"idempotency lock migration error: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_idempotency_lock()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+def create_missing_indexes(engine) -> list:
+    """Create every index declared on the models that does not exist yet, returns their names"""
+    from sqlalchemy import inspect
+    from database import Base
+    import models
+
+    inspector = inspect(engine)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue  # create_tables() creates new tables together with their indexes
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+def migrate_indexes():
+    """Add the composite indexes used by the hot per-user / per-group queries (SQLite and PostgreSQL)"""
+    from database import engine
+
+    try:
+        created = create_missing_indexes(engine)
+        for name in created:
+            print(f"{name} index has been created")
+        if not created:
+            print("All indexes already exist")
+        print("index migration complete")
+    except Exception as e:
+        print(f"index migration error: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_indexes()
@@ -0,0 +1,53 @@
+import os
+import sys
+
+# column added to the tables whose rows are bucketed by day
+LOCAL_DAY_TABLES = ["study_sessions", "habit_logs"]
+
+def migrate_local_day():
+    """Add profiles.timezone and local_day (with its indexes) and fill local_day of existing rows"""
+    from sqlalchemy import inspect, select, text
+    from database import engine, SessionLocal
+    from models import Profile
+    from migrate_add_indexes import create_missing_indexes
+    import localday
+
+    try:
+        inspector = inspect(engine)
+        with engine.begin() as connection:
+            if "timezone" not in {column["name"] for column in inspector.get_columns("profiles")}:
+                connection.execute(text("ALTER TABLE profiles ADD COLUMN timezone VARCHAR"))
+                print("profiles.timezone column has been added")
+            for table in LOCAL_DAY_TABLES:
+                if "local_day" not in {column["name"] for column in inspector.get_columns(table)}:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN local_day INTEGER"))
+                    print(f"{table}.local_day column has been added")
+        for name in create_missing_indexes(engine):
+            print(f"{name} index has been created")
+
+        # rows are filled per user with that user's timezone (one transaction per user)
+        db = SessionLocal()
+        try:
+            zones = dict(db.execute(select(Profile.id, Profile.timezone)).all())
+            user_ids = {row[0] for table in LOCAL_DAY_TABLES
+                        for row in db.execute(text(f"SELECT DISTINCT user_id FROM {table} WHERE local_day IS NULL AND user_id IS NOT NULL"))}
+            filled = 0
+            for user_id in user_ids:
+                try:
+                    zone = localday.parse_zone(zones.get(user_id))
+                except ValueError:
+                    zone = None
+                filled += localday.restamp(db, user_id, zone)
+                db.commit()
+            print(f"local_day has been set on {filled} rows of {len(user_ids)} users")
+        finally:
+            db.close()
+        print("local day migration complete")
+    except Exception as e:
+        print(f"local day migration error: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_local_day()
@@ -0,0 +1,25 @@
+import os
+import sys
+
+def migrate_search():
+    """
+    Create the full-text index (FTS5 tables + triggers on SQLite, tsvector columns + GIN on PostgreSQL)
+    and index existing rows; run again after large imports to merge the SQLite index
+    """
+    from database import engine
+    import search
+
+    try:
+        with engine.begin() as connection:
+            for name in search.install(connection):
+                print(f"{name} has been created")
+            search.optimize(connection)
+        print("search migration complete")
+    except Exception as e:
+        print(f"search migration error: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_search()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+# columns added to every synced table
+SYNC_COLUMNS = {"updated_at": "TIMESTAMP", "change_seq": "INTEGER"}
+
+def migrate_sync():
+    """Add updated_at / change_seq to the synced tables, create the tombstone and counter tables and number existing rows"""
+    from sqlalchemy import inspect, text
+    from database import engine
+    from models import SyncTombstone, SyncCounter
+    from migrate_add_indexes import create_missing_indexes
+    import sync
+
+    try:
+        inspector = inspect(engine)
+        with engine.begin() as connection:
+            for model in sync.COLLECTIONS.values():
+                table = model.__tablename__
+                existing = {column["name"] for column in inspector.get_columns(table)}
+                for column, column_type in SYNC_COLUMNS.items():
+                    if column not in existing:
+                        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+                        print(f"{table}.{column} column has been added")
+        SyncTombstone.__table__.create(bind=engine, checkfirst=True)
+        SyncCounter.__table__.create(bind=engine, checkfirst=True)
+        for name in create_missing_indexes(engine):
+            print(f"{name} index has been created")
+        with engine.begin() as connection:
+            print(f"{sync.backfill(connection)} existing rows have been numbered")
+        print("sync migration complete")
+    except Exception as e:
+        print(f"sync migration error: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_sync()
@@ -0,0 +1,70 @@
+import os
+import sys
+
+def merge_duplicate_habits(connection) -> list:
+    """Habits with the same name for one user become the oldest one (their logs move over); returns the kept ids"""
+    from sqlalchemy import func, inspect, select
+    from models import Habit, HabitLog, HabitDayBitmap
+    habits, logs, bitmaps = Habit.__table__, HabitLog.__table__, HabitDayBitmap.__table__
+    has_bitmaps = inspect(connection).has_table(bitmaps.name)
+
+    duplicates = connection.execute(
+        select(habits.c.user_id, habits.c.name, func.min(habits.c.id))
+        .where(habits.c.user_id.isnot(None))  # NULLs never collide in a unique index
+        .group_by(habits.c.user_id, habits.c.name)
+        .having(func.count(habits.c.id) > 1)
+    ).all()
+    for user_id, name, keep in duplicates:
+        others = [row[0] for row in connection.execute(
+            select(habits.c.id).where(habits.c.user_id == user_id, habits.c.name == name, habits.c.id != keep)
+        )]
+        connection.execute(logs.update().where(logs.c.habit_id.in_(others)).values(habit_id=keep))
+        if has_bitmaps:
+            connection.execute(bitmaps.delete().where(bitmaps.c.habit_id.in_(others)))
+        connection.execute(habits.delete().where(habits.c.id.in_(others)))
+    return [keep for _, _, keep in duplicates]
+
+def delete_duplicate_logs(connection) -> int:
+    """Keep the first of several logs of one habit with the same completed_date"""
+    from sqlalchemy import func, select
+    from models import HabitLog
+    logs = HabitLog.__table__
+    first = select(func.min(logs.c.id)).where(logs.c.completed_date.isnot(None)).group_by(logs.c.habit_id, logs.c.completed_date)
+    result = connection.execute(logs.delete().where(logs.c.completed_date.isnot(None), logs.c.id.notin_(first.scalar_subquery())))
+    return result.rowcount
+
+def migrate_unique_constraints():
+    """Remove duplicate habits / habit logs, then add the unique indexes the write endpoints rely on"""
+    from sqlalchemy import inspect, text
+    from database import engine, SessionLocal
+    from models import IdempotencyRecord
+    from migrate_add_indexes import create_missing_indexes
+    import streaks
+
+    try:
+        with engine.begin() as connection:
+            merged = merge_duplicate_habits(connection)
+            print(f"{len(merged)} duplicate habit names have been merged")
+            print(f"{delete_duplicate_logs(connection)} duplicate habit logs have been deleted")
+            # replaced by the unique uq_habit_logs_habit_id_completed_date
+            if "ix_habit_logs_habit_id_completed_date" in {index["name"] for index in inspect(connection).get_indexes("habit_logs")}:
+                connection.execute(text("DROP INDEX ix_habit_logs_habit_id_completed_date"))
+        for name in create_missing_indexes(engine):
+            print(f"{name} index has been created")
+        IdempotencyRecord.__table__.create(bind=engine, checkfirst=True)
+        print("idempotency_keys table is ready")
+        if merged and inspect(engine).has_table("habit_day_bitmaps"):
+            db = SessionLocal()
+            try:
+                streaks.rebuild(db, merged)
+            finally:
+                db.close()
+        print("unique constraint migration complete")
+    except Exception as e:
+        print(f"unique constraint migration error: {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # database.py reads DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = sys.argv[1]
+    migrate_unique_constraints()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey # data types to make table columns
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, LargeBinary, UniqueConstraint # data types to make table columns
 from sqlalchemy.orm import relationship # import relationship for foreign key connections
 from database import Base # brings basic table frame from database.py
 from datetime import datetime # to record current time
@@ -12,9 +12,15 @@ class Subject(Base): # creates table "Subject"
     name = Column(String, index = True) # subject name
     color = Column(String) # color of each subject
     created_at = Column(DateTime, default = datetime.now) # records when the subject has been created
+    updated_at = Column(DateTime, nullable = True) # last change, set with change_seq (see sync.py)
+    change_seq = Column(Integer, nullable = True) # position in the global change sequence
 
     study_sessions = relationship("StudySession", back_populates = "subject")
 
+    __table_args__ = (
+        Index("ix_subjects_user_id_change_seq", "user_id", "change_seq"), # delta sync
+    )
+
 # study session table
 class StudySession(Base):
     __tablename__ = "study_sessions"
@@ -27,10 +33,19 @@ class StudySession(Base):
     duration_minutes = Column(Integer)
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+    local_day = Column(Integer, nullable = True) # day of created_at in the user's timezone, days since 1970-01-01 (see localday.py)
+    updated_at = Column(DateTime, nullable = True) # last change, set with change_seq (see sync.py)
+    change_seq = Column(Integer, nullable = True) # position in the global change sequence
     
     user = relationship("Profile", back_populates="study_sessions") 
     subject = relationship("Subject", back_populates="study_sessions")
 
+    __table_args__ = (
+        Index("ix_study_sessions_user_id_created_at", "user_id", "created_at"), # per-user date range queries
+        Index("ix_study_sessions_user_id_change_seq", "user_id", "change_seq"), # delta sync
+        Index("ix_study_sessions_user_id_local_day", "user_id", "local_day"), # per-user day/week/month aggregations
+    )
+
 # habit table
 class Habit(Base):
     __tablename__ = "habits"
@@ -42,9 +57,16 @@ class Habit(Base):
     target_frequency = Column(Integer, default=7) # target frequency per week (default 7)
     color = Column(String, default="#10B981") # color of each habit (default green)
     created_at = Column(DateTime, default = datetime.now)
+    updated_at = Column(DateTime, nullable = True) # last change, set with change_seq (see sync.py)
+    change_seq = Column(Integer, nullable = True) # position in the global change sequence
 
     logs = relationship("HabitLog", back_populates="habit")
 
+    __table_args__ = (
+        Index("ix_habits_user_id_change_seq", "user_id", "change_seq"), # delta sync
+        Index("uq_habits_user_id_name", "user_id", "name", unique = True), # one habit per name and user
+    )
+
 # habit log table
 class HabitLog(Base):
     __tablename__ = "habit_logs"
@@ -53,12 +75,36 @@ class HabitLog(Base):
     user_id = Column(String, index=True)
     habit_id = Column(Integer, ForeignKey("habits.id")) # which habit it is from the habit column
     completed_date = Column(DateTime) # when the habit has been completed
+    local_day = Column(Integer, nullable = True) # day of completed_date in the user's timezone, days since 1970-01-01 (see localday.py)
     notes = Column(Text, nullable = True) # notes on how the habit has been completed
     created_at = Column(DateTime, default = datetime.now)
+    updated_at = Column(DateTime, nullable = True) # last change, set with change_seq (see sync.py)
+    change_seq = Column(Integer, nullable = True) # position in the global change sequence
     habit = relationship("Habit", lazy="joined")
 
     habit = relationship("Habit", back_populates="logs")
 
+    __table_args__ = (
+        Index("uq_habit_logs_habit_id_completed_date", "habit_id", "completed_date", unique = True), # logs of a habit, no duplicate check-ins
+        Index("ix_habit_logs_user_id_completed_date", "user_id", "completed_date"), # per-user date range queries
+        Index("ix_habit_logs_user_id_change_seq", "user_id", "change_seq"), # delta sync
+        Index("ix_habit_logs_user_id_local_day", "user_id", "local_day"), # per-user day/week/month aggregations
+    )
+
+# habit day bitmap table (one row per habit and year, bit n = day n of the year was checked in)
+class HabitDayBitmap(Base):
+    __tablename__ = "habit_day_bitmaps"
+
+    id = Column(Integer, primary_key = True, index = True)
+    habit_id = Column(Integer, ForeignKey("habits.id"), nullable = False)
+    user_id = Column(String, index = True)
+    year = Column(Integer, nullable = False)
+    days = Column(LargeBinary(46), nullable = False) # 366 bits, little-endian
+
+    __table_args__ = (
+        UniqueConstraint("habit_id", "year", name = "uq_habit_day_bitmaps_habit_id_year"),
+    )
+
 # goal table
 class Goal(Base):
     __tablename__ = "goals"
@@ -72,6 +118,52 @@ class Goal(Base):
     description = Column(Text, nullable = True) # goal explanation (optional)
     is_active = Column(Integer, default=1) # if its active or not (1: active, 0: inactive)
     created_at = Column(DateTime, default = datetime.now) # goal created time
+    updated_at = Column(DateTime, nullable = True) # last change, set with change_seq (see sync.py)
+    change_seq = Column(Integer, nullable = True) # position in the global change sequence
+
+    __table_args__ = (
+        Index("ix_goals_user_id_change_seq", "user_id", "change_seq"), # delta sync
+    )
+
+# sync tombstone table (a synced row was deleted; clients drop it on their next sync)
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key = True, index = True)
+    user_id = Column(String, nullable = False)
+    entity = Column(String, nullable = False) # "subjects", "study_sessions", "habits", "habit_logs" or "goals"
+    entity_id = Column(Integer, nullable = False)
+    change_seq = Column(Integer, nullable = False)
+    deleted_at = Column(DateTime, default = datetime.now)
+
+    __table_args__ = (
+        Index("ix_sync_tombstones_user_id_change_seq", "user_id", "change_seq"), # delta sync
+    )
+
+# idempotency key table (stored responses for retried writes, used with IDEMPOTENCY_STORE=database)
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key = True, index = True)
+    user_id = Column(String, nullable = False)
+    key = Column(String, nullable = False) # Idempotency-Key header
+    request_hash = Column(String, nullable = False) # method, path and body of the first request
+    status = Column(Integer, nullable = True) # null while the first request is running
+    locked_until = Column(DateTime, nullable = True) # a running request older than this is taken over by a retry
+    headers = Column(Text, nullable = True) # JSON list of [name, value]
+    body = Column(LargeBinary, nullable = True)
+    expires_at = Column(DateTime, nullable = False, index = True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name = "uq_idempotency_keys_user_id_key"),
+    )
+
+# change sequence counter (a single row, its lock orders concurrent writers)
+class SyncCounter(Base):
+    __tablename__ = "sync_counter"
+
+    id = Column(Integer, primary_key = True)
+    value = Column(Integer, nullable = False, default = 0)
 
 # study group table
 class StudyGroup(Base):
@@ -98,6 +190,10 @@ class GroupMembership(Base):
 
     group = relationship("StudyGroup", back_populates="memberships")
 
+    __table_args__ = (
+        Index("ix_group_memberships_group_id_user_id", "group_id", "user_id"), # members of a group
+    )
+
 class Profile(Base):
     __tablename__ = "profiles"
     id = Column(String, primary_key=True, index=True)
@@ -105,6 +201,7 @@ class Profile(Base):
     email = Column(String, unique=True, index=True) 
     full_name = Column(String, nullable=True) 
     avatar_url = Column(String, nullable=True)
+    timezone = Column(String, nullable=True) # IANA name, e.g. "Asia/Seoul"; days are server-local when unset
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, nullable=True)
 
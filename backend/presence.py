@@ -0,0 +1,352 @@
+import os
+import time
+import heapq
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from database import get_db, SessionLocal
+from models import Subject, StudySession, GroupMembership
+import schemas
+from auth import get_current_user
+from cache import cache_manager
+from leaderboard import leaderboard
+from groups import display_names
+
+router = APIRouter()
+
+# a timer without heartbeat for this long is stopped and saved up to its last heartbeat
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "90"))
+# timers shorter than this are discarded instead of saved
+MIN_SESSION_SECONDS = 60
+# how often expired timers are saved when no request pops them
+PRESENCE_SWEEP_SECONDS = float(os.getenv("PRESENCE_SWEEP_SECONDS", "15"))
+
+# Timers live in process memory like the response cache: run a single worker (or sticky
+# sessions) so start, heartbeat and stop of one user reach the same process
+
+class ActiveTimer:
+    """A running study timer"""
+    __slots__ = ("user_id", "subject_id", "subject_name", "notes", "started_at", "start", "last_seen", "expires_at", "groups")
+
+    def __init__(self, user_id: str, subject_id: int, subject_name: str, notes: Optional[str], groups: Set[int]):
+        self.user_id = user_id
+        self.subject_id = subject_id
+        self.subject_name = subject_name
+        self.notes = notes
+        self.started_at = datetime.now()
+        self.start = time.monotonic()
+        self.last_seen = self.start
+        self.expires_at = self.start + PRESENCE_TTL
+        self.groups = groups
+
+    def elapsed(self, until: float = None) -> float:
+        return (until if until is not None else time.monotonic()) - self.start
+
+    def state(self) -> dict:
+        now = time.monotonic()
+        return {
+            "subject_id": self.subject_id,
+            "subject_name": self.subject_name,
+            "started_at": self.started_at,
+            "elapsed_seconds": int(self.elapsed(now)),
+            "expires_in_seconds": max(0, int(self.expires_at - now))
+        }
+
+class PresenceRegistry:
+    """
+    Running timers by user, an index of online users per group and a min-heap of expiry times
+    Heartbeats push a new heap entry instead of updating one; stale entries are skipped on pop
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.timers: Dict[str, ActiveTimer] = {}
+        self.online: Dict[int, Set[str]] = {}  # group_id -> user_ids with a running timer
+        self._expiry: List[Tuple[float, str]] = []
+
+    def _index(self, timer: ActiveTimer) -> None:
+        for group_id in timer.groups:
+            self.online.setdefault(group_id, set()).add(timer.user_id)
+
+    def _unindex(self, timer: ActiveTimer) -> None:
+        for group_id in timer.groups:
+            users = self.online.get(group_id)
+            if users is not None:
+                users.discard(timer.user_id)
+                if not users:
+                    del self.online[group_id]
+
+    def _pop_expired(self) -> List[ActiveTimer]:
+        now = time.monotonic()
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, user_id = heapq.heappop(self._expiry)
+            timer = self.timers.get(user_id)
+            if timer is not None and timer.expires_at == expires_at:
+                del self.timers[user_id]
+                self._unindex(timer)
+                expired.append(timer)
+        return expired
+
+    def start(self, timer: ActiveTimer) -> Tuple[ActiveTimer, List[ActiveTimer]]:
+        """Register a timer (a running one for the same user is kept); returns it and the expired ones"""
+        with self._lock:
+            expired = self._pop_expired()
+            current = self.timers.get(timer.user_id)
+            if current is None:
+                current = self.timers[timer.user_id] = timer
+                self._index(timer)
+                heapq.heappush(self._expiry, (timer.expires_at, timer.user_id))
+            return current, expired
+
+    def heartbeat(self, user_id: str) -> Tuple[Optional[ActiveTimer], List[ActiveTimer]]:
+        with self._lock:
+            expired = self._pop_expired()
+            timer = self.timers.get(user_id)
+            if timer is not None:
+                timer.last_seen = time.monotonic()
+                timer.expires_at = timer.last_seen + PRESENCE_TTL
+                heapq.heappush(self._expiry, (timer.expires_at, user_id))
+            return timer, expired
+
+    def stop(self, user_id: str) -> Tuple[Optional[ActiveTimer], List[ActiveTimer]]:
+        with self._lock:
+            expired = self._pop_expired()
+            timer = self.timers.pop(user_id, None)
+            if timer is not None:
+                self._unindex(timer)
+            return timer, expired
+
+    def get(self, user_id: str) -> Tuple[Optional[ActiveTimer], List[ActiveTimer]]:
+        with self._lock:
+            expired = self._pop_expired()
+            return self.timers.get(user_id), expired
+
+    def expire(self) -> List[ActiveTimer]:
+        with self._lock:
+            return self._pop_expired()
+
+    def drain(self) -> List[ActiveTimer]:
+        """Remove every timer (shutdown: memory is about to go)"""
+        with self._lock:
+            timers = list(self.timers.values())
+            self.timers.clear()
+            self.online.clear()
+            self._expiry.clear()
+            return timers
+
+    def studying_in(self, group_id: int) -> Tuple[List[ActiveTimer], List[ActiveTimer]]:
+        """Running timers of a group's members (O(members online)) and the expired ones"""
+        with self._lock:
+            expired = self._pop_expired()
+            return [self.timers[user_id] for user_id in self.online.get(group_id, ())], expired
+
+    # membership changes while a timer runs
+    def join_group(self, group_id: int, user_id: str) -> None:
+        with self._lock:
+            timer = self.timers.get(user_id)
+            if timer is not None:
+                timer.groups.add(group_id)
+                self.online.setdefault(group_id, set()).add(user_id)
+
+    def leave_group(self, group_id: int, user_id: str) -> None:
+        with self._lock:
+            timer = self.timers.get(user_id)
+            if timer is not None:
+                timer.groups.discard(group_id)
+            users = self.online.get(group_id)
+            if users is not None:
+                users.discard(user_id)
+
+    def drop_group(self, group_id: int) -> None:
+        with self._lock:
+            for user_id in self.online.pop(group_id, ()):
+                self.timers[user_id].groups.discard(group_id)
+
+    def on_membership_change(self, group_ids: Set[int], user_id: Optional[str], kind: str, amount: int) -> None:
+        """Leaderboard listener: keeps the per-group index in step with joins and leaves"""
+        for group_id in group_ids:
+            if kind == "joined":
+                self.join_group(group_id, user_id)
+            elif kind == "left":
+                self.leave_group(group_id, user_id)
+            elif kind == "members":
+                self.drop_group(group_id)
+
+# presence instance
+presence = PresenceRegistry()
+leaderboard.listeners.append(presence.on_membership_change)
+
+def save_timer(db: Session, timer: ActiveTimer, until: float) -> Optional[StudySession]:
+    """Write one StudySession for a finished timer (None if it was too short to keep)"""
+    seconds = timer.elapsed(until)
+    if seconds < MIN_SESSION_SECONDS:
+        return None
+    end_time = timer.started_at + timedelta(seconds=seconds)
+    session = StudySession(
+        user_id=timer.user_id,
+        subject_id=timer.subject_id,
+        subject_name=timer.subject_name,
+        start_time=timer.started_at,
+        end_time=end_time,
+        duration_minutes=int(seconds // 60),
+        notes=timer.notes,
+        created_at=end_time
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+
+    # same invalidation as a manually added session
+    cache_manager.delete(cache_manager.get_cache_key(timer.user_id, "dashboard_summary"))
+    cache_manager.delete(cache_manager.get_cache_key(timer.user_id, "study_sessions"))
+    leaderboard.record_study(db, timer.user_id, session.duration_minutes, session.created_at)
+    return session
+
+def save_expired(db: Session, expired: List[ActiveTimer]) -> None:
+    """Timers that lost their heartbeat are kept up to the last heartbeat"""
+    for timer in expired:
+        try:
+            save_timer(db, timer, timer.last_seen)
+        except Exception as e:
+            db.rollback()
+            print(f"Failed to save expired study timer of {timer.user_id}: {e}")
+
+class PresenceSweeper:
+    """Saves expired timers every PRESENCE_SWEEP_SECONDS, so they don't wait for the next timer request"""
+
+    def __init__(self, registry: PresenceRegistry):
+        self.registry = registry
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, name="presence-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(PRESENCE_SWEEP_SECONDS):
+            self.save(self.registry.expire())
+
+    @staticmethod
+    def save(timers: List[ActiveTimer]) -> None:
+        if not timers:
+            return
+        db = SessionLocal()
+        try:
+            save_expired(db, timers)
+        finally:
+            db.close()
+
+    def stop(self) -> None:
+        """Stop sweeping and save every remaining timer up to its last heartbeat"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.save(self.registry.drain())
+
+sweeper = PresenceSweeper(presence)
+
+# ======== study timer ===========
+@router.post("/study-timer/start", response_model=schemas.StudyTimer)
+def start_study_timer(
+    timer: schemas.StudyTimerStart,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Starts a live study timer (a running timer is returned unchanged)"""
+    running, expired = presence.get(user_id)
+    save_expired(db, expired)
+    if running is not None:
+        return running.state()
+
+    subject = db.query(Subject).filter(
+        Subject.id == timer.subject_id,
+        Subject.user_id == user_id
+    ).first()
+    if not subject:
+        raise HTTPException(status_code=404, detail="Subject not found or access denied")
+    groups = {row[0] for row in db.query(GroupMembership.group_id).filter(GroupMembership.user_id == user_id)}
+
+    current, expired = presence.start(ActiveTimer(user_id, subject.id, subject.name, timer.notes, groups))
+    save_expired(db, expired)
+    return current.state()
+
+@router.post("/study-timer/heartbeat", response_model=schemas.StudyTimer)
+def heartbeat_study_timer(
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Keeps the timer alive; call it more often than every PRESENCE_TTL seconds"""
+    timer, expired = presence.heartbeat(user_id)
+    save_expired(db, expired)
+    if timer is None:
+        raise HTTPException(status_code=404, detail="No running study timer")
+    return timer.state()
+
+@router.post("/study-timer/stop")
+def stop_study_timer(
+    stop: Optional[schemas.StudyTimerStop] = None,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stops the timer and saves it as one study session (with start_time / end_time)"""
+    timer, expired = presence.stop(user_id)
+    save_expired(db, expired)
+    if timer is None:
+        raise HTTPException(status_code=404, detail="No running study timer")
+    if stop is not None and stop.notes is not None:
+        timer.notes = stop.notes
+
+    session = save_timer(db, timer, time.monotonic())
+    if session is None:
+        return {"message": "Study timer discarded (shorter than a minute)", "session": None}
+    return {"message": "Study session saved", "session": schemas.StudySessionResponse.model_validate(session)}
+
+@router.get("/study-timer", response_model=Optional[schemas.StudyTimer])
+def read_study_timer(
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """The current user's running timer, null if none"""
+    timer, expired = presence.get(user_id)
+    save_expired(db, expired)
+    return timer.state() if timer is not None else None
+
+# ======== presence ===========
+@router.get("/groups/{group_id}/studying-now", response_model=schemas.StudyingNowResponse)
+def read_studying_now(
+    group_id: int,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Members of a group with a running study timer, longest running first"""
+    membership = db.query(GroupMembership.id).filter(
+        GroupMembership.group_id == group_id,
+        GroupMembership.user_id == user_id
+    ).first()
+    if not membership:
+        raise HTTPException(status_code=403, detail="Not a member of this group")
+
+    timers, expired = presence.studying_in(group_id)
+    save_expired(db, expired)
+    timers.sort(key=lambda timer: timer.start)
+    names = display_names([timer.user_id for timer in timers], db) if timers else {}
+    now = time.monotonic()
+    return {
+        "group_id": group_id,
+        "studying": [
+            {
+                "user_id": timer.user_id,
+                "username": names[timer.user_id],
+                "subject_name": timer.subject_name,
+                "started_at": timer.started_at,
+                "elapsed_minutes": int(timer.elapsed(now) // 60)
+            }
+            for timer in timers
+        ]
+    }
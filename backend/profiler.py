@@ -0,0 +1,241 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from collections import Counter
+from contextvars import Context, ContextVar
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from auth import is_admin_token, require_admin
+
+router = APIRouter()
+
+# captures are kept as a bounded ring buffer on disk: <id>.folded (flamegraph input) + <id>.json (summary)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", "50"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # fraction of requests profiled automatically
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+PROFILE_TOP_N = 25
+
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# the sampler of the request being handled, copied into the threadpool with the request's context
+current_capture: ContextVar[Optional["StackSampler"]] = ContextVar("current_capture", default=None)
+
+def frame_label(frame) -> str:
+    """module:function label used in collapsed stacks"""
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stacks of the threads running this request's endpoint
+    Sync endpoints run in the threadpool, so instead of cProfile (which only sees its own thread)
+    every thread with the endpoint function on its stack is checked once to belong to this request
+    (other requests may run the same endpoint at the same time) and then kept by thread id;
+    stacks are trimmed to start at the endpoint frame
+    """
+
+    def __init__(self, scope, request_frame, interval: float = PROFILE_INTERVAL):
+        super().__init__(daemon=True)
+        self.scope = scope
+        self.request_frame = request_frame  # the middleware's coroutine frame
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.threads: Dict[int, object] = {}  # thread id -> endpoint frame, for threads running this request
+        self._stop_event = threading.Event()
+
+    def owns(self, frame) -> bool:
+        """
+        Whether the stack under an endpoint frame is this request's: async endpoints run on the event
+        loop below the middleware's own frame, sync ones in an anyio worker running the request's context
+        """
+        while frame is not None:
+            if frame is self.request_frame:
+                return True
+            if frame.f_code.co_name == "run" and "context" in frame.f_code.co_varnames:
+                context = frame.f_locals.get("context")
+                if isinstance(context, Context):
+                    return context.get(current_capture) is self
+            frame = frame.f_back
+        return False
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            endpoint = self.scope.get("endpoint")  # set by the router once the request is matched
+            code = getattr(endpoint, "__code__", None)
+            if code is None:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    if frame.f_code is code:
+                        break
+                    frame = frame.f_back
+                if frame is None:  # endpoint not on this thread's stack
+                    continue
+                if self.threads.get(ident) is not frame:
+                    if not self.owns(frame.f_back):
+                        continue  # another request running the same endpoint
+                    self.threads[ident] = frame
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def top_functions(stacks: Counter, interval: float, limit: int = PROFILE_TOP_N) -> List[Dict]:
+    """Self and inclusive sample counts per function, busiest first"""
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            inclusive[name] += count
+    total = sum(stacks.values()) or 1
+    return [
+        {
+            "function": name,
+            "self_samples": own[name],
+            "self_percent": round(own[name] / total * 100, 1),
+            "inclusive_samples": inclusive[name],
+            "inclusive_percent": round(inclusive[name] / total * 100, 1),
+            "estimated_self_ms": round(own[name] * interval * 1000, 1)
+        }
+        for name, _ in sorted(inclusive.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:limit]
+    ]
+
+def save_capture(profile_id: str, summary: Dict, stacks: Counter) -> None:
+    """Write one capture and drop the oldest ones beyond PROFILE_MAX_CAPTURES"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    captures = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in captures[:max(0, len(captures) - PROFILE_MAX_CAPTURES)]:
+        base = entry.path[:-len(".json")]
+        for path in (entry.path, base + ".folded"):
+            if os.path.exists(path):
+                os.remove(path)
+
+class ProfilerMiddleware:
+    """Profiles a request when the admin token is sent in X-Debug-Profile, or for a sampled fraction of requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        requested = is_admin_token(headers.get("x-debug-profile"))
+        if not requested and not (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        # ids are always generated here (and returned in X-Profile-ID), a client can't pick or overwrite one
+        profile_id = uuid.uuid4().hex[:16]
+        request_id = headers.get("x-request-id")
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(raw=message["headers"])["x-profile-id"] = profile_id
+            await send(message)
+
+        sampler = StackSampler(scope, sys._getframe())
+        token = current_capture.set(sampler)
+        started_at = time.time()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            sampler.stop()
+            current_capture.reset(token)
+            route = scope.get("route")
+            summary = {
+                "id": profile_id,
+                "request_id": request_id if request_id and PROFILE_ID_PATTERN.match(request_id) else None,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status_code,
+                "started_at": started_at,
+                "duration_ms": round(duration * 1000, 2),
+                "samples": sampler.samples,
+                "interval_ms": PROFILE_INTERVAL * 1000,
+                "trigger": "header" if requested else "sampled",
+                "top_functions": top_functions(sampler.stacks, PROFILE_INTERVAL)
+            }
+            try:
+                await run_in_threadpool(save_capture, profile_id, summary, sampler.stacks)
+            except OSError as e:
+                print(f"Failed to save profile {profile_id}: {e}")
+
+def capture_path(profile_id: str, extension: str) -> str:
+    """Path of a stored capture, 404 if the id is invalid or unknown"""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+# ======== admin endpoints (X-Admin-Token) ===========
+@router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles():
+    """Lists stored captures, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return {"profiles": []}
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        with open(entry.path) as f:
+            summary = json.load(f)
+        summary.pop("top_functions", None)
+        profiles.append(summary)
+    profiles.sort(key=lambda p: p.get("started_at", 0), reverse=True)
+    return {"profiles": profiles}
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+def read_profile(profile_id: str):
+    """Summary of one capture including the top-N functions"""
+    with open(capture_path(profile_id, "json")) as f:
+        return json.load(f)
+
+@router.get("/admin/profiles/{profile_id}/folded", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+def download_profile_stacks(profile_id: str):
+    """Collapsed stacks, ready for flamegraph.pl or speedscope"""
+    with open(capture_path(profile_id, "folded")) as f:
+        return PlainTextResponse(
+            f.read(),
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'}
+        )
@@ -66,6 +66,11 @@ class Habit(BaseModel):
     target_frequency: Optional[int] = 7  # Default to 7 if None
     color: Optional[str] = "#10B981"  # Default green color if None
     created_at: datetime
+    # from the habit's day bitmaps (see streaks.py)
+    current_streak: int = 0
+    longest_streak: int = 0
+    week_count: int = 0  # days checked in this week, compare with target_frequency
+    year_completion: float = 0.0  # % of this year's days so far
 
     class Config:
         from_attributes = True
@@ -120,6 +125,27 @@ class GoalUpdate(BaseModel):
     description: Optional[str] = None
     is_active: Optional[int] = None
 
+# Goal forecast schemas
+class GoalForecast(BaseModel):
+    goal_id: int
+    goal_type: str
+    period: str
+    target_value: int
+    target_unit: Optional[str] = None
+    period_start: str  # YYYY-MM-DD, the user's local days
+    period_end: str  # inclusive
+    actual_value: float  # so far in this period
+    expected_value: float  # projected for the end of the period
+    probability: float  # of reaching target_value (0-1)
+    required_daily_pace: float  # per remaining day to reach the target
+    daily_average: float  # over the history window
+    recent_daily_average: float  # last 7 days
+    remaining_days: float  # including the rest of today
+
+class GoalForecastResponse(BaseModel):
+    today: str
+    forecasts: List[GoalForecast]
+
 # Heatmap schemas
 class HeatmapData(BaseModel):
     """Individual day data for heatmap"""
@@ -182,6 +208,7 @@ class LeaderboardEntry(BaseModel):
     habit_completion_rate: float
     total_habits: int
     completed_habits: int
+    best_streak: int = 0  # longest running streak among the member's habits
     rank: int
 
 class GroupLeaderboardResponse(BaseModel):
@@ -191,11 +218,135 @@ class GroupLeaderboardResponse(BaseModel):
     total_members: int
     week_start: str
     week_end: str
+    my_rank: Optional[int] = None
+    me: Optional[LeaderboardEntry] = None  # the current user's entry, also when outside the top `limit`
     
+# Study timer / presence schemas
+class StudyTimerStart(BaseModel):
+    subject_id: int
+    notes: Optional[str] = None
+
+class StudyTimerStop(BaseModel):
+    notes: Optional[str] = None  # replaces the notes given at start
+
+class StudyTimer(BaseModel):
+    subject_id: int
+    subject_name: Optional[str] = None
+    started_at: datetime
+    elapsed_seconds: int
+    expires_in_seconds: int  # the timer stops by itself if no heartbeat arrives in time
+
+class StudyingNowEntry(BaseModel):
+    user_id: str
+    username: str
+    subject_name: Optional[str] = None
+    started_at: datetime
+    elapsed_minutes: int
+
+class StudyingNowResponse(BaseModel):
+    group_id: int
+    studying: List[StudyingNowEntry]
+
+# Batch upload schemas
+class BatchHabitLog(BaseModel):
+    habit_id: int
+    completed_date: datetime
+
+class BatchStudySession(BaseModel):
+    subject_id: int
+    duration_minutes: int
+    notes: Optional[str] = None
+    created_at: Optional[datetime] = None  # when it was recorded offline, also used to spot duplicates
+
+class BatchUpload(BaseModel):
+    habit_logs: List[BatchHabitLog] = []
+    study_sessions: List[BatchStudySession] = []
+
+class BatchItemResult(BaseModel):
+    index: int  # position in the uploaded list
+    status: str  # "created", "duplicate" (already stored, id of the existing row) or "rejected"
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BatchResult(BaseModel):
+    habit_logs: List[BatchItemResult]
+    study_sessions: List[BatchItemResult]
+    created: int
+    duplicates: int
+    rejected: int
+
+# Delta sync schemas
+class SyncDeleted(BaseModel):
+    """Ids deleted since the token, per collection"""
+    subjects: List[int] = []
+    study_sessions: List[int] = []
+    habits: List[int] = []
+    habit_logs: List[int] = []
+    goals: List[int] = []
+
+class SyncResponse(BaseModel):
+    token: str  # pass as ?since= on the next sync
+    has_more: bool  # more changes than `limit`, sync again right away
+    full: bool  # no token was given: every row is included and local data can be replaced
+    subjects: List[Subject] = []
+    study_sessions: List[StudySessionResponse] = []
+    habits: List[Habit] = []
+    habit_logs: List[HabitLog] = []
+    goals: List[Goal] = []
+    deleted: SyncDeleted = SyncDeleted()
+
+# Full-text search schemas
+class SearchHit(BaseModel):
+    type: str  # "study_session" or "habit"
+    id: int
+    title: Optional[str] = None  # subject name of the session / habit name
+    snippet: str  # HTML-escaped text around the match, matched words in <mark>
+    created_at: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    query: str  # the words that were searched for
+    results: List[SearchHit]
+    has_more: bool  # fetch the next page with offset + limit
+
+# Calendar schemas
+class CalendarSubject(BaseModel):
+    subject_id: Optional[int] = None
+    subject_name: Optional[str] = None
+    minutes: int
+
+class CalendarDay(BaseModel):
+    date: str  # YYYY-MM-DD format
+    study_minutes: int
+    sessions: int
+    subjects: List[CalendarSubject]  # most studied first
+    habit_ids: List[int]  # habits checked in that day
+
+class CalendarResponse(BaseModel):
+    start: str  # YYYY-MM-DD format
+    end: str
+    days: List[CalendarDay]  # every day from start to end
+
+# Analytics series schemas
+class SeriesLine(BaseModel):
+    id: Optional[int] = None  # subject or habit id, None for the ungrouped total
+    name: Optional[str] = None
+    total: int
+    values: List[int]  # one value per bucket
+
+class SeriesResponse(BaseModel):
+    metric: str
+    granularity: str
+    group_by: Optional[str] = None
+    start: str  # YYYY-MM-DD, first day of the first bucket
+    end: str  # last day of the last bucket
+    buckets: List[str]  # first day of every bucket
+    series: List[SeriesLine]
+
 class ProfileBase(BaseModel):
     email: str
     full_name: Optional[str] = None
     avatar_url: Optional[str] = None
+    timezone: Optional[str] = None  # IANA name like "Asia/Seoul", decides which day activity counts for
 
 class ProfileCreate(ProfileBase):
     id: Optional[str] = None  # Optional ID from Supabase
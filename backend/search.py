@@ -0,0 +1,213 @@
+import os
+import re
+import html
+from typing import List
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from database import get_db, Base
+from models import StudySession, Habit
+import schemas
+from auth import get_current_user
+from serialization import encode, json_response, search_adapter
+
+router = APIRouter()
+
+# results per page at most
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+MAX_TERMS = 10  # words of a query that are used, the rest is ignored
+
+# snippets are built with these markers, then HTML-escaped and the markers turned into <mark>
+MARK_START, MARK_END = "\x02", "\x03"
+SNIPPET_WORDS = 12
+
+# ======== index ===========
+# SQLite: one FTS5 table per searched table, rowid = id of the row, filled by triggers so every
+# write (ORM, /batch, generate_data.py bulk inserts) is indexed in the same transaction. The
+# `owner` column holds one token per user ('u' + hex of user_id), so the user filter is a posting
+# list intersected inside the index instead of a join that first finds every user's matches.
+# Words are stemmed ("reviewed" finds "review"), so prefixes are only needed while typing: a prefix
+# query merges the doclists of every term it expands to across all users (see bench_search.py).
+SQLITE_INDEXES = {
+    "study_sessions_fts": ("study_sessions", ["notes"]),
+    "habits_fts": ("habits", ["name", "description"]),
+}
+
+def sqlite_ddl(fts: str, table: str, columns: List[str]) -> List[str]:
+    values = ", ".join(f"new.{column}" for column in columns)
+    has_text = " OR ".join(f"new.{column} IS NOT NULL" for column in columns)
+    insert = (f"INSERT INTO {fts}(rowid, owner, {', '.join(columns)}) SELECT new.id, 'u' || hex(new.user_id), {values} "
+              f"WHERE new.user_id IS NOT NULL AND ({has_text});")
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(owner, {', '.join(columns)}, "
+        f"tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN DELETE FROM {fts} WHERE rowid = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF user_id, {', '.join(columns)} ON {table} "
+        f"BEGIN DELETE FROM {fts} WHERE rowid = old.id; {insert} END",
+    ]
+
+# PostgreSQL: a generated tsvector column with a GIN index on each searched table
+POSTGRES_DDL = [
+    "ALTER TABLE study_sessions ADD COLUMN IF NOT EXISTS notes_search tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', coalesce(notes, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_study_sessions_notes_search ON study_sessions USING GIN (notes_search)",
+    "ALTER TABLE habits ADD COLUMN IF NOT EXISTS search tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_habits_search ON habits USING GIN (search)",
+]
+
+def install(connection) -> List[str]:
+    """Create the full-text index of the current database if missing; returns what was created"""
+    created = []
+    if connection.dialect.name == "sqlite":
+        tables = {row[0] for row in connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for fts, (table, columns) in SQLITE_INDEXES.items():
+            if table not in tables:
+                continue  # create_all(tables=[...]) without it
+            exists = fts in tables
+            for statement in sqlite_ddl(fts, table, columns):
+                connection.exec_driver_sql(statement)
+            if not exists:
+                # rows written before the index existed (no-op on a new database)
+                connection.exec_driver_sql(
+                    f"INSERT INTO {fts}(rowid, owner, {', '.join(columns)}) "
+                    f"SELECT id, 'u' || hex(user_id), {', '.join(columns)} FROM {table} "
+                    f"WHERE user_id IS NOT NULL AND ({' OR '.join(f'{column} IS NOT NULL' for column in columns)})"
+                )
+                created.append(fts)
+    elif connection.dialect.name == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
+        created.append("notes_search / search columns")
+    return created
+
+def optimize(connection) -> None:
+    """Merge the FTS5 segments into one b-tree (after bulk loads; SQLite only, PostgreSQL has nothing to do)"""
+    if connection.dialect.name == "sqlite":
+        for fts in SQLITE_INDEXES:
+            connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+
+def uninstall(connection) -> None:
+    """Drop the FTS5 tables with the rest (Base.metadata.drop_all); PostgreSQL columns go with their tables"""
+    if connection.dialect.name == "sqlite":
+        for fts in SQLITE_INDEXES:
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+
+# created and dropped together with the tables (create_tables, generate_data.py, tests)
+event.listen(Base.metadata, "after_create", lambda target, connection, **kw: install(connection))
+event.listen(Base.metadata, "before_drop", lambda target, connection, **kw: uninstall(connection))
+
+# ======== queries ===========
+def terms(query: str) -> List[str]:
+    """Words of the query (punctuation and FTS operators are dropped, so any input is a valid query)"""
+    return re.findall(r"\w+", query)[:MAX_TERMS]
+
+def owner_token(user_id: str) -> str:
+    return "u" + user_id.encode().hex().upper()
+
+def fts_query(user_id: str, words: List[str], columns: List[str], prefix: bool) -> str:
+    """FTS5 MATCH expression: the user's token AND every word in one of the columns"""
+    target = columns[0] if len(columns) == 1 else "{" + " ".join(columns) + "}"
+    phrases = [f'{target} : "{word}"' for word in words]
+    if prefix:
+        phrases[-1] += "*"
+    return " AND ".join([f"owner : {owner_token(user_id)}"] + phrases)
+
+def ts_query(words: List[str], prefix: bool) -> str:
+    """to_tsquery expression (\\w+ words need no quoting)"""
+    return " & ".join(words[:-1] + [words[-1] + (":*" if prefix else "")])
+
+def highlight(snippet: str) -> str:
+    """Escape a snippet for HTML and wrap the matched words in <mark>"""
+    return html.escape(snippet or "").replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+def search_sqlite(db: Session, user_id: str, words: List[str], count: int, prefix: bool, order: str) -> List[dict]:
+    marks = {"start": MARK_START, "end": MARK_END, "words": SNIPPET_WORDS, "count": count}
+    # ORDER BY rank lets FTS5 sort by bm25 itself (owner column weighted 0) and build snippets for the
+    # returned rows only. bm25 reads each word's whole doclist once per query for its IDF, so ranking
+    # costs more for very common words; selecting `rank` would make it do that a second time.
+    # ORDER BY rowid DESC streams the newest matches without ranking.
+    sessions = db.execute(text(
+        "SELECT rowid AS id, snippet(study_sessions_fts, 1, :start, :end, '…', :words) AS snippet "
+        "FROM study_sessions_fts WHERE study_sessions_fts MATCH :query AND rank MATCH 'bm25(0.0, 1.0)' "
+        f"ORDER BY {'rank' if order == 'relevance' else 'rowid DESC'} LIMIT :count"
+    ), {**marks, "query": fts_query(user_id, words, ["notes"], prefix)}).mappings().all()
+    habits = db.execute(text(
+        "SELECT rowid AS id, CASE WHEN instr(snippet(habits_fts, 2, :start, :end, '…', :words), :start) "
+        "THEN snippet(habits_fts, 2, :start, :end, '…', :words) ELSE highlight(habits_fts, 1, :start, :end) END AS snippet "
+        "FROM habits_fts WHERE habits_fts MATCH :query AND rank MATCH 'bm25(0.0, 2.0, 1.0)' "
+        f"ORDER BY {'rank' if order == 'relevance' else 'rowid DESC'} LIMIT :count"
+    ), {**marks, "query": fts_query(user_id, words, ["name", "description"], prefix)}).mappings().all()
+    return with_rows(db, user_id, habits, sessions)
+
+def search_postgres(db: Session, user_id: str, words: List[str], count: int, prefix: bool, order: str) -> List[dict]:
+    # headlines are costly, so they are built for the page only (outer query)
+    params = {
+        "query": ts_query(words, prefix),
+        "user_id": user_id,
+        "count": count,
+        "options": f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS // 2}"
+    }
+    sessions = db.execute(text(
+        "SELECT id, ts_headline('english', notes, to_tsquery('english', :query), :options) AS snippet FROM ("
+        "SELECT id, notes, ts_rank(notes_search, to_tsquery('english', :query)) AS score FROM study_sessions "
+        "WHERE user_id = :user_id AND notes_search @@ to_tsquery('english', :query) "
+        f"ORDER BY {'score DESC' if order == 'relevance' else 'id DESC'} LIMIT :count) page "
+        f"ORDER BY {'score DESC' if order == 'relevance' else 'id DESC'}"
+    ), params).mappings().all()
+    habits = db.execute(text(
+        "SELECT id, ts_headline('english', coalesce(description, name), to_tsquery('english', :query), :options) AS snippet FROM ("
+        "SELECT id, name, description, ts_rank(search, to_tsquery('english', :query)) AS score FROM habits "
+        "WHERE user_id = :user_id AND search @@ to_tsquery('english', :query) "
+        f"ORDER BY {'score DESC' if order == 'relevance' else 'id DESC'} LIMIT :count) page "
+        f"ORDER BY {'score DESC' if order == 'relevance' else 'id DESC'}"
+    ), params).mappings().all()
+    return with_rows(db, user_id, habits, sessions)
+
+def with_rows(db: Session, user_id: str, habits: List[dict], sessions: List[dict]) -> List[dict]:
+    """
+    Hits in result order with title and created_at of their rows (one query per table).
+    Scores of different tables don't compare, so the few habit hits come first
+    """
+    results = []
+    for kind, model, title, hits in (("habit", Habit, Habit.name, habits), ("study_session", StudySession, StudySession.subject_name, sessions)):
+        if not hits:
+            continue
+        rows = {row.id: row for row in db.query(model.id, title.label("title"), model.created_at).filter(
+            model.user_id == user_id,
+            model.id.in_([hit["id"] for hit in hits])
+        )}
+        results += [{"type": kind, "id": hit["id"], "title": rows[hit["id"]].title, "created_at": rows[hit["id"]].created_at,
+                     "snippet": hit["snippet"]} for hit in hits if hit["id"] in rows]
+    return results
+
+@router.get("/search", response_model=schemas.SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200, description="words to find (all of them, in any form: review = reviewed)"),
+    prefix: bool = Query(False, description="the last word may be incomplete (search as you type)"),
+    order: str = Query("relevance", pattern="^(relevance|recent)$", description="best matches or newest first"),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Full-text search over the current user's habit names/descriptions and study session notes
+    (matching habits first, then sessions); snippets are HTML-escaped with the matched words in <mark>
+    """
+    words = terms(q)
+    results = []
+    if words:
+        # each table returns its first offset + limit + 1 hits
+        search_table = search_sqlite if db.bind.dialect.name == "sqlite" else search_postgres
+        results = search_table(db, user_id, words, offset + limit + 1, prefix, order)
+    page = results[offset:offset + limit]
+    for result in page:
+        result["snippet"] = highlight(result["snippet"])
+    return json_response(encode(search_adapter, {
+        "query": " ".join(words),
+        "results": page,
+        "has_more": len(results) > offset + limit
+    }))
@@ -0,0 +1,30 @@
+from typing import Any, List
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import TypeAdapter
+import schemas
+from timing import phase
+
+# default response class for the whole app (dict responses are encoded with orjson)
+DefaultResponse = ORJSONResponse
+
+# pre-built adapters, created once at import time instead of on every request
+subject_list_adapter = TypeAdapter(List[schemas.Subject])
+study_session_list_adapter = TypeAdapter(List[schemas.StudySessionResponse])
+habit_list_adapter = TypeAdapter(List[schemas.Habit])
+habit_log_list_adapter = TypeAdapter(List[schemas.HabitLog])
+heatmap_adapter = TypeAdapter(schemas.HeatmapResponse)
+sync_adapter = TypeAdapter(schemas.SyncResponse)
+batch_result_adapter = TypeAdapter(schemas.BatchResult)
+search_adapter = TypeAdapter(schemas.SearchResponse)
+calendar_adapter = TypeAdapter(schemas.CalendarResponse)
+series_adapter = TypeAdapter(schemas.SeriesResponse)
+forecast_adapter = TypeAdapter(schemas.GoalForecastResponse)
+
+def encode(adapter: TypeAdapter, data: Any) -> bytes:
+    """Validate ORM rows (or models) with the adapter and dump them straight to JSON bytes"""
+    with phase("serialize"):
+        return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+def json_response(body: bytes, status_code: int = 200) -> Response:
+    """Wrap already encoded JSON bytes in a response without re-encoding"""
+    return Response(content=body, status_code=status_code, media_type="application/json")
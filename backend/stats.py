@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+
+# CPU-bound statistics run here, off the event loop and off the request threadpool;
+# numpy releases the GIL in its kernels, so a few workers are enough
+STATS_WORKERS = int(os.getenv("STATS_WORKERS", "2"))
+stats_executor = ThreadPoolExecutor(max_workers=STATS_WORKERS, thread_name_prefix="stats")
+
+ROLLING_WINDOWS = (7, 30)
+MAX_LAG = 7  # habit on day t against study on day t + 1 ... t + MAX_LAG
+MIN_DAYS = 3  # fewer paired days give no coefficient
+
+def pearson(x: np.ndarray, y: np.ndarray) -> Optional[float]:
+    """Pearson's r, None if there are too few days or either series is constant"""
+    if len(x) < MIN_DAYS:
+        return None
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = np.sqrt(np.dot(x, x) * np.dot(y, y))
+    if denominator == 0:
+        return None
+    return round(float(np.dot(x, y) / denominator), 4)
+
+def ranks(values: np.ndarray) -> np.ndarray:
+    """1-based ranks, ties get the average of the ranks they span"""
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    return ((ends - counts + 1 + ends) / 2)[inverse]
+
+def spearman(x: np.ndarray, y: np.ndarray) -> Optional[float]:
+    return pearson(ranks(x), ranks(y))
+
+def rolling_mean(values: np.ndarray, window: int) -> List[Optional[float]]:
+    """Trailing mean per day, None until a full window is available"""
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    means = (sums[window:] - sums[:-window]) / window
+    return [None] * min(window - 1, len(values)) + np.round(means, 2).tolist()
+
+def correlation_statistics(study: np.ndarray, habits: np.ndarray, habit_ids: List[int]) -> Dict:
+    """
+    Statistics of a dense day-indexed range: study minutes per day (shape [days]) against
+    habit completion (shape [habits, days], 1 = checked in that day)
+    """
+    habit_count = habits.sum(axis=0).astype(float)
+    study = study.astype(float)
+    days = len(study)
+    return {
+        "days": days,
+        "pearson": pearson(study, habit_count),
+        "spearman": spearman(study, habit_count),
+        # habits of day t against study of day t + lag ("habits today, study tomorrow")
+        "lagged": [
+            {"lag": lag, "pearson": pearson(habit_count[:-lag], study[lag:])}
+            for lag in range(1, min(MAX_LAG, days - 1) + 1)
+        ],
+        "rolling": {
+            f"{name}_{window}": rolling_mean(series, window)
+            for window in ROLLING_WINDOWS
+            for name, series in (("study_minutes", study), ("habit_count", habit_count))
+        },
+        # point-biserial correlation of each habit (done / not done) with the day's study time
+        "per_habit": [
+            {"habit_id": habit_id, "completed_days": int(done.sum()), "pearson": pearson(done.astype(float), study)}
+            for habit_id, done in zip(habit_ids, habits)
+        ],
+    }
@@ -0,0 +1,236 @@
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import Habit, HabitDayBitmap, HabitLog
+import localday
+
+# Check-in days are kept as one 366-bit bitmap per habit and year (bit n = day n of the year),
+# so streaks and completion rates are bit operations instead of scans over the habit's logs.
+# Days are the owner's local days: a bit comes from the log's local_day (stamped on flush, see
+# localday.py) and "today" is localday.today, so streaks agree with the calendar and analytics.
+
+BITMAP_BYTES = 46  # 366 bits
+
+def year_length(year: int) -> int:
+    return 366 if calendar.isleap(year) else 365
+
+def day_of_year(day: date) -> int:
+    """0-based bit position of a day within its year"""
+    return day.timetuple().tm_yday - 1
+
+def log_day(log: HabitLog) -> date:
+    """Day a (flushed) check-in counts for"""
+    return localday.day_date(log.local_day)
+
+def to_int(days: bytes) -> int:
+    return int.from_bytes(days, "little")
+
+def to_bytes(bits: int) -> bytes:
+    return bits.to_bytes(BITMAP_BYTES, "little")
+
+class DayBits:
+    """The years of one habit joined into a single integer, bit 0 = Jan 1 of the first year"""
+
+    def __init__(self, years: Dict[int, int], today: date):
+        self.today = today
+        self.origin = min(min(years), self.today.year) if years else self.today.year
+        self.years = years
+        self.bits = 0
+        offset = 0
+        for year in range(self.origin, self.today.year + 1):
+            self.bits |= years.get(year, 0) << offset
+            offset += year_length(year)
+
+    def index(self, day: date) -> int:
+        return (day - date(self.origin, 1, 1)).days
+
+    def run_ending_at(self, end: int) -> int:
+        """Number of consecutive set bits ending at bit `end`"""
+        if end < 0 or not self.bits >> end & 1:
+            return 0
+        missing = ~self.bits & ((1 << (end + 1)) - 1)
+        return end - (missing.bit_length() - 1) if missing else end + 1
+
+    def current_streak(self) -> int:
+        """Days in a row up to today (still alive if only today is not checked in yet)"""
+        today = self.index(self.today)
+        return self.run_ending_at(today) or self.run_ending_at(today - 1)
+
+    def longest_streak(self) -> int:
+        # each x &= x >> 1 shortens every run by one, so the loop count is the longest run
+        bits, length = self.bits, 0
+        while bits:
+            bits &= bits >> 1
+            length += 1
+        return length
+
+    def week_count(self) -> int:
+        """Check-in days this week (Monday to today)"""
+        monday = self.index(self.today - timedelta(days=self.today.weekday()))
+        if monday < 0:
+            return (self.bits & 0x7F >> -monday).bit_count()
+        return (self.bits >> monday & 0x7F).bit_count()
+
+    def year_completion(self) -> float:
+        """Percentage of this year's days so far that were checked in"""
+        elapsed = day_of_year(self.today) + 1
+        done = self.years.get(self.today.year, 0) & ((1 << elapsed) - 1)
+        return round(done.bit_count() / elapsed * 100, 1)
+
+    def summary(self) -> dict:
+        return {
+            "current_streak": self.current_streak(),
+            "longest_streak": self.longest_streak(),
+            "week_count": self.week_count(),
+            "year_completion": self.year_completion()
+        }
+
+def load_years(db: Session, habit_ids: Iterable[int] = None, user_ids: Iterable[str] = None) -> Dict[int, Dict[int, int]]:
+    """habit_id -> {year: bits} for the given habits or users, with one query"""
+    query = db.query(HabitDayBitmap.habit_id, HabitDayBitmap.year, HabitDayBitmap.days)
+    if habit_ids is not None:
+        query = query.filter(HabitDayBitmap.habit_id.in_(list(habit_ids)))
+    if user_ids is not None:
+        query = query.filter(HabitDayBitmap.user_id.in_(list(user_ids)))
+    years: Dict[int, Dict[int, int]] = {}
+    for habit_id, year, days in query:
+        years.setdefault(habit_id, {})[year] = to_int(days)
+    return years
+
+def local_today(db: Session, user_id: str) -> date:
+    return localday.day_date(localday.today(db, user_id))
+
+def habit_summaries(db: Session, habits: List) -> Dict[int, dict]:
+    """Streak fields for a list of Habit rows (one query for all their bitmaps)"""
+    years = load_years(db, habit_ids=[habit.id for habit in habits])
+    todays = localday.todays(db, {habit.user_id for habit in habits})
+    return {habit.id: DayBits(years.get(habit.id, {}), localday.day_date(todays[habit.user_id])).summary() for habit in habits}
+
+def habit_streak(db: Session, habit_id: int, user_id: str) -> int:
+    """Current streak of one habit of the user"""
+    years = load_years(db, habit_ids=[habit_id])
+    return DayBits(years.get(habit_id, {}), local_today(db, user_id)).current_streak()
+
+def current_streaks(db: Session, user_ids: List[str]) -> Dict[str, Dict[int, int]]:
+    """user_id -> {habit_id: current streak} for many users with one query"""
+    query = db.query(HabitDayBitmap.user_id, HabitDayBitmap.habit_id, HabitDayBitmap.year, HabitDayBitmap.days).filter(
+        HabitDayBitmap.user_id.in_(user_ids)
+    )
+    years: Dict[tuple, Dict[int, int]] = {}
+    for user_id, habit_id, year, days in query:
+        years.setdefault((user_id, habit_id), {})[year] = to_int(days)
+    todays = localday.todays(db, {user_id for user_id, _ in years})
+    streaks: Dict[str, Dict[int, int]] = {}
+    for (user_id, habit_id), habit_years in years.items():
+        streaks.setdefault(user_id, {})[habit_id] = DayBits(habit_years, localday.day_date(todays[user_id])).current_streak()
+    return streaks
+
+def claim_rows(db: Session, user_id: str, keys: Iterable[tuple]) -> None:
+    """
+    Make sure the (habit_id, year) rows exist before they are read for update: a concurrent
+    first check-in of the year finds the other writer's row instead of failing on the unique
+    constraint, and on SQLite the insert takes the write lock before the read
+    """
+    rows = [{"habit_id": habit_id, "user_id": user_id, "year": year, "days": to_bytes(0)} for habit_id, year in keys]
+    if not rows:
+        return
+    insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    db.execute(insert(HabitDayBitmap).on_conflict_do_nothing(index_elements=["habit_id", "year"]), rows)
+
+def touch_habits(db: Session, habit_ids: Iterable[int]) -> None:
+    """Streak fields of these habits changed: mark them updated, so sync.stamp_changes gives them a new change_seq"""
+    habit_ids = list(habit_ids)
+    if not habit_ids:
+        return
+    for habit in db.query(Habit).filter(Habit.id.in_(habit_ids)):
+        habit.updated_at = datetime.now()
+
+def set_day(db: Session, habit_id: int, user_id: str, day: date, checked: bool) -> None:
+    """Set or clear one day's bit (part of the caller's transaction, not committed here)"""
+    if checked:
+        claim_rows(db, user_id, [(habit_id, day.year)])
+    else:
+        # no row, nothing to clear; otherwise lock it the same way (a no-op write)
+        touched = db.execute(update(HabitDayBitmap).where(
+            HabitDayBitmap.habit_id == habit_id,
+            HabitDayBitmap.year == day.year
+        ).values(days=HabitDayBitmap.days).execution_options(synchronize_session=False))
+        if not touched.rowcount:
+            return
+    row = db.query(HabitDayBitmap).filter(
+        HabitDayBitmap.habit_id == habit_id,
+        HabitDayBitmap.year == day.year
+    ).with_for_update().populate_existing().one()
+    bits = to_int(row.days)
+    bit = 1 << day_of_year(day)
+    updated = bits | bit if checked else bits & ~bit
+    if updated != bits:
+        row.days = to_bytes(updated)
+        touch_habits(db, [habit_id])
+
+def set_days(db: Session, user_id: str, days_by_habit: Dict[int, Iterable[date]]) -> None:
+    """Set many days' bits at once, with one query for the rows of all the habits"""
+    days_by_habit = {habit_id: list(days) for habit_id, days in days_by_habit.items()}
+    claim_rows(db, user_id, sorted({(habit_id, day.year) for habit_id, days in days_by_habit.items() for day in days}))
+    rows = {
+        (row.habit_id, row.year): row
+        for row in db.query(HabitDayBitmap).filter(
+            HabitDayBitmap.habit_id.in_(list(days_by_habit))
+        ).order_by(HabitDayBitmap.id).with_for_update().populate_existing()
+    }
+    changed = set()
+    for habit_id, days in days_by_habit.items():
+        for day in days:
+            row = rows[(habit_id, day.year)]
+            bits = to_int(row.days)
+            bit = 1 << day_of_year(day)
+            if not bits & bit:
+                row.days = to_bytes(bits | bit)
+                changed.add(habit_id)
+    touch_habits(db, sorted(changed))
+
+def log_removed(db: Session, habit_id: int, user_id: str, day_number: int) -> None:
+    """Clear a day (a local_day) after a log was deleted, unless another log of that habit falls on the same day"""
+    if day_number is None:
+        return
+    db.flush()  # sessions don't autoflush, the deleted log must not be counted
+    remaining = db.query(func.count(HabitLog.id)).filter(
+        HabitLog.user_id == user_id,
+        HabitLog.local_day == day_number,
+        HabitLog.habit_id == habit_id
+    ).scalar()
+    if not remaining:
+        set_day(db, habit_id, user_id, localday.day_date(day_number), False)
+
+def rebuild(db: Session, habit_ids: List[int] = None) -> int:
+    """Recompute bitmaps from HabitLog (backfill / repair); returns the number of rows written"""
+    # the owner comes from the habit: old logs may predate HabitLog.user_id
+    query = db.query(HabitLog.habit_id, Habit.user_id, HabitLog.local_day).join(
+        Habit, HabitLog.habit_id == Habit.id
+    ).filter(HabitLog.local_day.isnot(None))
+    if habit_ids is not None:
+        query = query.filter(HabitLog.habit_id.in_(habit_ids))
+    bitmaps: Dict[tuple, int] = {}
+    owners: Dict[int, str] = {}
+    for habit_id, user_id, day_number in query.yield_per(10000):
+        day = localday.day_date(day_number)
+        bitmaps[(habit_id, day.year)] = bitmaps.get((habit_id, day.year), 0) | 1 << day_of_year(day)
+        owners[habit_id] = user_id
+
+    delete = db.query(HabitDayBitmap)
+    if habit_ids is not None:
+        delete = delete.filter(HabitDayBitmap.habit_id.in_(habit_ids))
+    delete.delete(synchronize_session=False)
+    if habit_ids is not None:
+        touch_habits(db, habit_ids)  # days moved (a timezone change), so may the streaks
+    db.bulk_insert_mappings(HabitDayBitmap, [
+        {"habit_id": habit_id, "user_id": owners[habit_id], "year": year, "days": to_bytes(bits)}
+        for (habit_id, year), bits in bitmaps.items()
+    ])
+    db.commit()
+    return len(bitmaps)
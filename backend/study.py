@@ -8,6 +8,9 @@ from models import Subject, StudySession
 import schemas
 from auth import get_current_user  # import authentication function
 from cache import cache_manager
+from compression import CompressedBody, CompressedBodyResponse
+from serialization import encode, subject_list_adapter, study_session_list_adapter
+from leaderboard import leaderboard
 
 router = APIRouter()
 
@@ -24,14 +27,15 @@ def read_subjects(
     # Check cache for data
     cached_subjects = cache_manager.get(cache_key)
     if cached_subjects:
-        return cached_subjects
+        return CompressedBodyResponse(cached_subjects)
 
     subjects = db.query(Subject).filter(Subject.user_id == user_id).all()
 
-    # Store result in cache (15 minutes)
-    cache_manager.set(cache_key, subjects, expire_seconds=900)
+    # Store the encoded JSON (and its compressed variants, filled on demand) in cache (15 minutes)
+    body = CompressedBody(encode(subject_list_adapter, subjects))
+    cache_manager.set(cache_key, body, expire_seconds=900)
 
-    return subjects
+    return CompressedBodyResponse(body)
 
 # 2. Get single subject
 @router.get("/subjects/{subject_id}", response_model=schemas.Subject)
@@ -87,14 +91,15 @@ def read_study_sessions(
     # Check cache for data
     cached_sessions = cache_manager.get(cache_key)
     if cached_sessions:
-        return cached_sessions
+        return CompressedBodyResponse(cached_sessions)
 
     study_sessions = db.query(StudySession).filter(StudySession.user_id == user_id).all()
 
-    # Store result in cache (10 minutes)
-    cache_manager.set(cache_key, study_sessions, expire_seconds=600)
+    # Store the encoded JSON (and its compressed variants, filled on demand) in cache (10 minutes)
+    body = CompressedBody(encode(study_session_list_adapter, study_sessions))
+    cache_manager.set(cache_key, body, expire_seconds=600)
 
-    return study_sessions
+    return CompressedBodyResponse(body)
 
 # 5. Create new study session
 @router.post("/study-sessions", response_model=schemas.StudySessionResponse)
@@ -121,6 +126,7 @@ def create_study_session(
     db.add(db_study_session)
     db.commit()
     db.refresh(db_study_session)
+    leaderboard.record_study(db, user_id, db_study_session.duration_minutes, db_study_session.created_at)
 
     # Invalidate cache when data changes (also invalidate dashboard summary)
     dashboard_cache_key = cache_manager.get_cache_key(user_id, "dashboard_summary")
@@ -204,6 +210,7 @@ def delete_study_session(
     
     db.delete(study_session) # delete from the database
     db.commit() # keep the change
+    leaderboard.record_study(db, user_id, -study_session.duration_minutes, study_session.created_at, sessions=-1)
 
     # Invalidate cache when data changes (also invalidate dashboard summary)
     dashboard_cache_key = cache_manager.get_cache_key(user_id, "dashboard_summary")
@@ -0,0 +1,204 @@
+import os
+import base64
+import binascii
+from datetime import datetime
+from operator import itemgetter
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import event, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import Subject, StudySession, Habit, HabitLog, Goal, SyncTombstone, SyncCounter
+import schemas
+from auth import get_current_user
+from serialization import encode, json_response, sync_adapter
+from habit import add_streaks
+from writebehind import write_behind
+
+router = APIRouter()
+
+# changes returned per request at most (the client follows has_more)
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
+
+# synced models by collection name (the response field and SyncTombstone.entity)
+COLLECTIONS = {
+    "subjects": Subject,
+    "study_sessions": StudySession,
+    "habits": Habit,
+    "habit_logs": HabitLog,
+    "goals": Goal
+}
+SYNCED = {model: collection for collection, model in COLLECTIONS.items()}
+
+# ======== change sequence ===========
+# Every insert, update and delete of a synced row takes a number from one global sequence
+# (change_seq on the row, or on a tombstone for deletes), so "what changed since N" is a range
+# scan on (user_id, change_seq).
+#
+# SQLite has one writer at a time: numbers come from the sync_counter row, whose update is held
+# until commit, so writers commit in sequence order. PostgreSQL writers must not queue on one row,
+# so they draw from the sync_change_seq sequence and commit in any order; a number can then become
+# visible after a higher one. Before drawing, a writer takes a shared advisory lock keyed by the
+# next number it can get (last drawn + 1) and holds it until its transaction ends. /sync only
+# returns changes up to the watermark: the last number drawn, or below the lowest key still locked.
+# A writer locks before it draws, so a number drawn after the watermark was read is above it.
+
+# Lock keys are single bigints: the namespace in the high bits, the change number in the low
+# SYNC_LOCK_BITS. pg_locks shows such a key split in two (classid = high 32 bits, objid = low 32
+# bits, objsubid = 1).
+SYNC_LOCK_NAMESPACE = 72617
+SYNC_LOCK_BITS = 40  # room for 2^40 change numbers
+SYNC_LOCK_BASE = SYNC_LOCK_NAMESPACE << SYNC_LOCK_BITS
+CHANGE_SEQUENCE = "sync_change_seq"
+LAST_DRAWN = f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {CHANGE_SEQUENCE}"
+
+@event.listens_for(SyncCounter.__table__, "after_create")
+def seed_counter(table, connection, **kw) -> None:
+    # created with its row (and sequence), so writers only ever update it
+    connection.execute(table.insert().values(id=1, value=0))
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {CHANGE_SEQUENCE}"))
+
+def allocate(session: Session, count: int) -> List[int]:
+    """Reserve `count` sequence numbers, ascending"""
+    if session.bind.dialect.name == "postgresql":
+        session.execute(text(f"SELECT pg_advisory_xact_lock_shared(CAST(:lock_base AS bigint) + ({LAST_DRAWN}) + 1)"), {"lock_base": SYNC_LOCK_BASE})
+        return session.execute(text(
+            f"SELECT nextval('{CHANGE_SEQUENCE}') FROM generate_series(1, :count) ORDER BY 1"
+        ), {"count": count}).scalars().all()
+    counter = SyncCounter.__table__
+    updated = session.execute(counter.update().where(counter.c.id == 1).values(value=counter.c.value + count))
+    if updated.rowcount == 0:
+        # databases created before the row was seeded with the table
+        session.execute(sqlite_insert(counter).values(id=1, value=0).on_conflict_do_nothing())
+        session.execute(counter.update().where(counter.c.id == 1).values(value=counter.c.value + count))
+    last = session.execute(select(counter.c.value).where(counter.c.id == 1)).scalar()
+    return list(range(last - count + 1, last + 1))
+
+def watermark(db: Session) -> Optional[int]:
+    """Highest number up to which every change is committed or rolled back, None where writers commit in order"""
+    if db.bind.dialect.name != "postgresql":
+        return None
+    drawn = db.execute(text(LAST_DRAWN)).scalar()
+    oldest = db.execute(text(
+        "SELECT min((classid::bigint << 32) | objid::bigint) - :lock_base FROM pg_locks "
+        "WHERE locktype = 'advisory' AND objsubid = 1 AND classid::bigint BETWEEN :first_class AND :last_class "
+        "AND database = (SELECT oid FROM pg_database WHERE datname = current_database())"
+    ), {
+        "lock_base": SYNC_LOCK_BASE,
+        "first_class": SYNC_LOCK_BASE >> 32,
+        "last_class": (SYNC_LOCK_BASE + (1 << SYNC_LOCK_BITS) - 1) >> 32
+    }).scalar()
+    return drawn if oldest is None else min(drawn, oldest - 1)
+
+@event.listens_for(Session, "before_flush")
+def stamp_changes(session: Session, flush_context, instances) -> None:
+    """Give new and changed synced rows a sequence number and turn deletes into tombstones"""
+    changed = [obj for obj in session.new if type(obj) in SYNCED]
+    changed += [obj for obj in session.dirty if type(obj) in SYNCED and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if type(obj) in SYNCED and obj.user_id is not None]  # old rows without an owner are never synced
+    if not changed and not deleted:
+        return
+    numbers = iter(allocate(session, len(changed) + len(deleted)))
+    now = datetime.now()
+    for obj in changed:
+        obj.change_seq, obj.updated_at = next(numbers), now
+    for obj in deleted:
+        session.add(SyncTombstone(user_id=obj.user_id, entity=SYNCED[type(obj)], entity_id=obj.id, change_seq=next(numbers), deleted_at=now))
+
+def backfill(connection) -> int:
+    """Number rows written without the ORM (old data, generate_data.py); returns how many were stamped"""
+    counter = SyncCounter.__table__
+    base = connection.execute(select(counter.c.value).where(counter.c.id == 1)).scalar()
+    has_counter = base is not None
+    base = base or 0
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {CHANGE_SEQUENCE}"))
+        base = max(base, connection.execute(text(LAST_DRAWN)).scalar())
+    stamped = 0
+    for model in COLLECTIONS.values():
+        table = model.__table__
+        # id + base keeps the numbers unique across tables without numbering row by row
+        result = connection.execute(table.update().where(table.c.change_seq.is_(None)).values(
+            change_seq=table.c.id + base,
+            updated_at=func.coalesce(table.c.updated_at, table.c.created_at)
+        ))
+        stamped += result.rowcount
+        base += connection.execute(select(func.max(table.c.id))).scalar() or 0
+    if has_counter:
+        connection.execute(counter.update().where(counter.c.id == 1).values(value=base))
+    else:
+        connection.execute(counter.insert().values(id=1, value=base))
+    if connection.dialect.name == "postgresql" and base:
+        connection.execute(text(f"SELECT setval('{CHANGE_SEQUENCE}', :base)"), {"base": base})
+    return stamped
+
+# ======== tokens ===========
+def make_token(seq: int) -> str:
+    return base64.urlsafe_b64encode(f"v1:{seq}".encode()).decode().rstrip("=")
+
+def parse_token(token: str) -> int:
+    try:
+        version, seq = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode().split(":")
+        if version != "v1":
+            raise ValueError(version)
+        return int(seq)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid sync token, sync again without `since`")
+
+# ======== sync ===========
+@router.get("/sync", response_model=schemas.SyncResponse)
+def sync_changes(
+    since: Optional[str] = Query(None, description="token from the previous sync (omit for a full sync)"),
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=10000),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Rows of the current user created, changed or deleted since the token, oldest change first
+    Each collection is one range scan on (user_id, change_seq); the token is the last change included
+    """
+    write_behind.wait_user(user_id)
+    start = parse_token(since) if since else 0
+    upper = watermark(db)
+
+    # the first `limit` changes overall are among the first `limit` of each collection
+    changes = []
+    for collection, model in COLLECTIONS.items():
+        rows = db.query(model).filter(
+            model.user_id == user_id,
+            model.change_seq > start
+        )
+        if upper is not None:
+            rows = rows.filter(model.change_seq <= upper)
+        rows = rows.order_by(model.change_seq).limit(limit + 1)
+        changes.extend((row.change_seq, collection, row) for row in rows)
+    if since:
+        # a full sync replaces local data, so it needs no tombstones
+        tombstones = db.query(SyncTombstone.change_seq, SyncTombstone.entity, SyncTombstone.entity_id).filter(
+            SyncTombstone.user_id == user_id,
+            SyncTombstone.change_seq > start
+        )
+        if upper is not None:
+            tombstones = tombstones.filter(SyncTombstone.change_seq <= upper)
+        tombstones = tombstones.order_by(SyncTombstone.change_seq).limit(limit + 1)
+        changes.extend((seq, "deleted", (entity, entity_id)) for seq, entity, entity_id in tombstones)
+
+    changes.sort(key=itemgetter(0))
+    page = changes[:limit]
+    result = {collection: [] for collection in COLLECTIONS}
+    result["deleted"] = {collection: [] for collection in COLLECTIONS}
+    for _, collection, row in page:
+        if collection == "deleted":
+            result["deleted"][row[0]].append(row[1])
+        else:
+            result[collection].append(row)
+    if result["habits"]:
+        add_streaks(db, result["habits"])
+
+    result["token"] = make_token(page[-1][0] if page else start)
+    result["has_more"] = len(changes) > limit
+    result["full"] = not since
+    return json_response(encode(sync_adapter, result))
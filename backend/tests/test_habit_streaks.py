@@ -0,0 +1,46 @@
+"""
+Streak bitmaps follow the stored local days of check-ins
+
+    cd backend && python -m pytest tests
+"""
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# a server far from UTC, so an aware check-in falls on a different calendar day than its UTC date
+os.environ["TZ"] = "Asia/Seoul"
+time.tzset()
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+from fastapi.testclient import TestClient
+
+import main
+
+def auth(user_id: str) -> dict:
+    return {"Authorization": "Bearer " + jwt.encode({"sub": user_id}, "test", algorithm="HS256")}
+
+def test_aware_checkin_create_then_delete_clears_streak():
+    with TestClient(main.app) as client:
+        headers = auth("streak-user")
+        habit = client.post("/habits", json={"name": "Read", "color": "#fff", "target_frequency": 7}, headers=headers).json()
+        # 23:30 UTC of yesterday is 08:30 of today in Seoul
+        yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+        completed = yesterday.replace(hour=23, minute=30, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        created = client.post(f"/habits/{habit['id']}/logs", json={"completed_date": completed}, headers=headers)
+        assert created.status_code == 200
+        again = client.post(f"/habits/{habit['id']}/logs", json={"completed_date": completed}, headers=headers)
+        assert again.status_code == 200 and again.json()["id"] == created.json()["id"]
+        fields = client.get(f"/habits/{habit['id']}", headers=headers).json()
+        assert fields["current_streak"] == 1
+        assert fields["week_count"] == 1
+
+        assert client.delete(f"/habit-logs/{created.json()['id']}", headers=headers).status_code == 200
+        assert client.get("/habit-logs", headers=headers).json() == []
+        fields = client.get(f"/habits/{habit['id']}", headers=headers).json()
+        assert fields["current_streak"] == 0
+        assert fields["week_count"] == 0
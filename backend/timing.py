@@ -0,0 +1,97 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+
+from database import QueryStats, query_stats
+
+logger = logging.getLogger("studyflow.timing")
+
+# SERVER_TIMING=1 adds the header to every response, otherwise only to requests
+# that send the admin token in X-Debug-Timing
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+class RequestTiming:
+    """Per-phase durations (seconds) collected while handling one request"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+# timing of the request currently being handled (None when Server-Timing is off)
+request_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+@contextmanager
+def phase(name: str):
+    """Time a block as part of the current request; a single ContextVar lookup when timing is off"""
+    timing = request_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
+
+def format_server_timing(phases: Dict[str, float], query_count: int) -> str:
+    """Build the Server-Timing header value (durations in milliseconds)"""
+    parts = []
+    for name, seconds in phases.items():
+        entry = f"{name};dur={seconds * 1000:.2f}"
+        if name == "db":
+            entry += f';desc="{query_count} queries"'
+        parts.append(entry)
+    return ", ".join(parts)
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing header (auth, cache, db, serialize, total) and a debug log line
+    Must sit inside MetricsMiddleware so the per-request QueryStats are visible here
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not SERVER_TIMING_ENABLED:
+            # imported here to avoid a circular import (auth uses phase())
+            from auth import is_admin_token
+            if not is_admin_token(Headers(scope=scope).get("x-debug-timing")):
+                await self.app(scope, receive, send)
+                return
+
+        stats = query_stats.get()
+        stats_token = None
+        if stats is None:
+            stats = QueryStats()
+            stats_token = query_stats.set(stats)
+        timing = RequestTiming()
+        timing_token = request_timing.set(timing)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                phases = dict(timing.phases)
+                phases["db"] = stats.query_seconds
+                phases["total"] = time.perf_counter() - start
+                header = format_server_timing(phases, stats.query_count)
+                MutableHeaders(raw=message["headers"])["server-timing"] = header
+                logger.debug("%s %s %s", scope["method"], scope["path"], header)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_timing.reset(timing_token)
+            if stats_token is not None:
+                query_stats.reset(stats_token)
@@ -0,0 +1,312 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Condition, Lock, Thread
+from typing import Dict, List, Optional
+import orjson
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import HabitLog
+from localday import server_local
+import streaks
+
+# Optional write-behind mode for habit check-ins (WRITE_BEHIND=1): a check-in is acknowledged once
+# it is fsynced to a local append-only log, and a flusher thread commits what piled up every few
+# milliseconds in one transaction, so a morning burst is a handful of commits instead of one per
+# check-in. The log is local to the process: run a single worker with a persistent disk.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_LOG = os.getenv("WRITE_BEHIND_LOG", "habit_checkins.log")
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "5")) / 1000
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "1000"))
+# under steady load the log never drains, so it is rotated and the old part dropped once committed
+WRITE_BEHIND_ROTATE_BYTES = int(os.getenv("WRITE_BEHIND_ROTATE_BYTES", str(16 * 1024 * 1024)))
+# how long reads wait for the user's own pending check-ins before answering anyway
+READ_YOUR_WRITES_TIMEOUT = 5.0
+RESOLVED_IDS = 100000  # provisional -> real ids remembered for deletes right after a check-in
+
+class WriteBehindBuffer:
+    """
+    Append-only log + in-memory queue of check-ins not yet in the database
+    Appends are made durable with group fsync: whoever finds no fsync running syncs everything
+    written so far, the others wait for it. Check-ins get a provisional id (-seq) until flushed.
+    """
+
+    def __init__(self, path: str = WRITE_BEHIND_LOG):
+        self.path = path
+        self.enabled = False
+        self._lock = Lock()
+        self._changed = Condition(self._lock)  # pending / committed / synced moved
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._seq = 0
+        self._written = 0  # last seq written to the log file
+        self._synced = 0  # last seq known to be on disk
+        self._syncing = False
+        self._committed = 0  # every seq up to here is in the database
+        self._rotated_seq: Optional[int] = None  # last seq in the rotated file, if one exists
+        self.pending: List[dict] = []
+        self.pending_users: Dict[str, int] = {}
+        self.resolved: "OrderedDict[int, int]" = OrderedDict()  # seq -> database id
+        self.flushed = 0
+        self.flushes = 0
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+
+    # ======== lifecycle ===========
+    def start(self) -> None:
+        """Replay what a crash left in the log, then accept check-ins"""
+        replayed = self._replay()
+        if replayed:
+            print(f"Write-behind: replayed {replayed} check-ins from {self.path}")
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._size = os.fstat(self._fd).st_size
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def stop(self) -> None:
+        """Stop accepting check-ins and commit the rest"""
+        self.enabled = False
+        with self._lock:
+            self._stopping = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _replay(self) -> int:
+        # only records after the checkpoint: committed ones may have been deleted since
+        checkpoint = self._read_checkpoint()
+        records = []
+        for path in (self.path + ".old", self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        break  # torn last line: it was never acknowledged
+                    if record["seq"] > checkpoint:
+                        records.append(record)
+        for start in range(0, len(records), WRITE_BEHIND_MAX_BATCH):
+            # committed after the last checkpoint write: they come back as duplicates and are skipped
+            if not self._commit_each(records[start:start + WRITE_BEHIND_MAX_BATCH], "skipped replayed"):
+                raise RuntimeError(f"Write-behind replay of {self.path} failed: database unavailable")
+        # provisional ids continue after the replayed ones and don't repeat those of earlier runs
+        self._seq = max([int(time.time() * 1000), checkpoint] + [record["seq"] for record in records])
+        self._written = self._synced = self._committed = self._seq
+        self._write_checkpoint(self._seq)
+        for path in (self.path + ".old", self.path):
+            if os.path.exists(path):
+                os.remove(path)
+        return len(records)
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(self.path + ".checkpoint", "rb") as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, seq: int) -> None:
+        """Durably record that every seq up to here is in the database (atomic replace)"""
+        path = self.path + ".checkpoint"
+        fd = os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, str(seq).encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(path + ".tmp", path)
+
+    # ======== writes ===========
+    def submit(self, user_id: str, habit_id: int, completed_date: datetime) -> dict:
+        """Durably queue one check-in; returns it with its provisional id"""
+        completed_date = server_local(completed_date)
+        with self._lock:
+            self._seq += 1
+            record = {"seq": self._seq, "user_id": user_id, "habit_id": habit_id, "completed_date": completed_date.isoformat()}
+            line = orjson.dumps(record) + b"\n"
+            os.write(self._fd, line)
+            self._size += len(line)
+            self._written = record["seq"]
+            self.pending.append(record)
+            self.pending_users[user_id] = self.pending_users.get(user_id, 0) + 1
+            self._changed.notify_all()
+            # group fsync: one fsync covers every record written before it started
+            while self._synced < record["seq"]:
+                if self._syncing:
+                    self._changed.wait()
+                    continue
+                # the flusher doesn't rotate (close) the file while _syncing is set
+                self._syncing, target, fd = True, self._written, self._fd
+                self._lock.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._lock.acquire()
+                    self._syncing = False
+                self._synced = max(self._synced, target)
+                self._changed.notify_all()
+        return {"id": -record["seq"], "habit_id": habit_id, "completed_date": completed_date}
+
+    # ======== reads ===========
+    def wait_user(self, user_id: str, timeout: float = READ_YOUR_WRITES_TIMEOUT) -> None:
+        """Read-your-writes: block until the user's pending check-ins are in the database"""
+        if not self.pending_users.get(user_id):
+            return
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.pending_users.get(user_id) and time.monotonic() < deadline:
+                self._changed.wait(deadline - time.monotonic())
+
+    def resolve(self, log_id: int, timeout: float = READ_YOUR_WRITES_TIMEOUT) -> Optional[int]:
+        """Database id for a provisional (negative) id, waiting for its flush if needed"""
+        seq = -log_id
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._committed < seq and seq <= self._seq and time.monotonic() < deadline:
+                self._changed.wait(deadline - time.monotonic())
+            return self.resolved.get(seq)
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self.pending), "flushed": self.flushed, "flushes": self.flushes}
+
+    # ======== flusher ===========
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self.pending and not self._stopping:
+                    self._changed.wait()
+                if not self.pending and self._stopping:
+                    return
+            time.sleep(WRITE_BEHIND_INTERVAL)  # let the group grow
+            with self._lock:
+                # only records on disk are committed, so the database never gets ahead of the log
+                batch = [record for record in self.pending[:WRITE_BEHIND_MAX_BATCH] if record["seq"] <= self._synced]
+            if not batch:
+                continue
+            if not self._commit_each(batch, "dropped"):
+                time.sleep(1)  # database unavailable: retry later
+                continue
+            try:
+                self._write_checkpoint(batch[-1]["seq"])
+            except OSError as e:
+                print(f"Write-behind checkpoint failed: {e}")  # a later one covers these records
+            self._done(batch)
+
+    def _commit_each(self, records: List[dict], action: str) -> bool:
+        """
+        Commit a group; if that fails, one by one so one bad record (e.g. its habit was deleted
+        since) doesn't hold back the rest. Records that still fail are logged and skipped, unless
+        every one failed for a reason other than its data (database unavailable): then nothing is
+        skipped and False is returned
+        """
+        try:
+            self._commit(records)
+            return True
+        except Exception as e:
+            print(f"Write-behind commit failed, committing one by one: {e}")
+        failed = []
+        for record in records:
+            try:
+                self._commit([record])
+            except Exception as e:
+                failed.append((record, e))
+        if len(failed) == len(records) and not all(isinstance(error, IntegrityError) for _, error in failed):
+            return False
+        for record, error in failed:
+            print(f"Write-behind {action} check-in {record}: {error}")
+        return True
+
+    def _done(self, batch: List[dict]) -> None:
+        with self._lock:
+            del self.pending[:len(batch)]
+            for record in batch:
+                count = self.pending_users[record["user_id"]] - 1
+                if count:
+                    self.pending_users[record["user_id"]] = count
+                else:
+                    del self.pending_users[record["user_id"]]
+            self._committed = batch[-1]["seq"]
+            self.flushed += len(batch)
+            self.flushes += 1
+            self._truncate()
+            self._changed.notify_all()
+
+    def _truncate(self) -> None:
+        """Drop log records that are committed (called with the lock held)"""
+        if self._rotated_seq is not None and self._committed >= self._rotated_seq:
+            os.remove(self.path + ".old")
+            self._rotated_seq = None
+        if self._committed == self._written and self._synced == self._written:
+            os.ftruncate(self._fd, 0)  # fully drained: start over
+            self._size = 0
+        elif self._size > WRITE_BEHIND_ROTATE_BYTES and self._rotated_seq is None and not self._syncing:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            os.replace(self.path, self.path + ".old")
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            self._size = 0
+            self._rotated_seq = self._written
+
+    def _commit(self, records: List[dict]) -> None:
+        """Insert a group of check-ins in one transaction (duplicates map to the existing rows)"""
+        from batch import after_commit
+
+        db: Session = SessionLocal()
+        try:
+            keys = {}
+            for record in records:
+                keys.setdefault((record["habit_id"], datetime.fromisoformat(record["completed_date"])), []).append(record)
+            existing = {
+                (habit_id, completed_date): log_id
+                for habit_id, completed_date, log_id in db.query(HabitLog.habit_id, HabitLog.completed_date, HabitLog.id).filter(
+                    HabitLog.habit_id.in_({habit_id for habit_id, _ in keys}),
+                    HabitLog.completed_date.in_({completed_date for _, completed_date in keys})
+                )
+            }
+            created = []
+            days_by_user: Dict[str, Dict[int, set]] = {}
+            for (habit_id, completed_date), group in keys.items():
+                if (habit_id, completed_date) in existing:
+                    continue
+                log = HabitLog(habit_id=habit_id, completed_date=completed_date, user_id=group[0]["user_id"])
+                created.append(((habit_id, completed_date), log))
+            db.add_all([log for _, log in created])
+            db.flush()
+            # bits of the local days stamped by the flush
+            for _, log in created:
+                days_by_user.setdefault(log.user_id, {}).setdefault(log.habit_id, set()).add(streaks.log_day(log))
+            for user_id, days_by_habit in days_by_user.items():
+                streaks.set_days(db, user_id, days_by_habit)
+            for key, log in created:
+                existing[key] = log.id
+            checkins: Dict[str, list] = {}
+            for key, log in created:
+                checkins.setdefault(log.user_id, []).append((log.habit_id, log.completed_date))
+            db.commit()
+
+            with self._lock:
+                for key, group in keys.items():
+                    for record in group:
+                        self.resolved[record["seq"]] = existing[key]
+                while len(self.resolved) > RESOLVED_IDS:
+                    self.resolved.popitem(last=False)
+            for user_id, user_checkins in checkins.items():
+                after_commit(db, user_id, user_checkins, [])
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+# write-behind instance (started in main.py when WRITE_BEHIND=1)
+write_behind = WriteBehindBuffer()